@@ -73,6 +73,8 @@ def run_migrations_online() -> None:
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        # the now() defaults the migrations write are in UTC, as those of the application
+        connect_args={"server_settings": {"timezone": "UTC"}},
     )
 
     with connectable.connect() as connection:
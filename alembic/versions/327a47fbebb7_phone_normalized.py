@@ -0,0 +1,98 @@
+"""Phone normalized
+
+Revision ID: 327a47fbebb7
+Revises: a063bf1e0126
+Create Date: 2026-10-19 10:12:41.118034
+
+"""
+import os
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '327a47fbebb7'
+down_revision = 'a063bf1e0126'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+phones = sa.table(
+    'phones',
+    sa.column('id', sa.Integer),
+    sa.column('number', sa.String),
+    sa.column('normalized', sa.String),
+    sa.column('contact_id', sa.Integer),
+    sa.column('owner_id', sa.Integer),
+)
+contacts = sa.table('contacts', sa.column('id', sa.Integer), sa.column('owner_id', sa.Integer))
+
+_non_digits = re.compile(r'\D')
+
+
+def normalize_number(number: str, country_code: str = os.environ.get('DEFAULT_COUNTRY_CODE', '')) -> str:
+    # a copy of src.phones.service.normalize_number as it was when this revision was written, so later changes
+    # to the application do not change what the migration stores
+    number = number.strip()
+    digits = _non_digits.sub('', number)
+    if number.startswith('+'):
+        return f'+{digits}'
+    if digits.startswith('00'):
+        return f'+{digits[2:]}'
+    if country_code and digits:
+        return f'+{country_code}{digits.removeprefix("0")}'
+    return digits
+
+
+def delete_orphans() -> None:
+    # a phone without a contact has no owner to copy and no route that can reach it; it would only make the
+    # NOT NULL of owner_id fail
+    op.execute(
+        phones.delete().where(
+            ~sa.exists().where(contacts.c.id == phones.c.contact_id)
+        )
+    )
+
+
+def backfill() -> None:
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(phones.c.id, phones.c.number, contacts.c.owner_id)
+            .join(contacts, contacts.c.id == phones.c.contact_id)
+            .where(phones.c.id > last_id)
+            .order_by(phones.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        connection.execute(
+            phones.update().where(phones.c.id == sa.bindparam('phone_id')),
+            [{"phone_id": phone_id, "normalized": normalize_number(number), "owner_id": owner_id}
+             for phone_id, number, owner_id in rows],
+        )
+        last_id = rows[-1][0]
+
+
+def upgrade() -> None:
+    op.add_column('phones', sa.Column('normalized', sa.String(length=50), nullable=True))
+    op.add_column('phones', sa.Column('owner_id', sa.Integer(), nullable=True))
+    # committing every keyset batch on its own keeps row locks short while the table is backfilled
+    with op.get_context().autocommit_block():
+        delete_orphans()
+        backfill()
+    op.alter_column('phones', 'normalized', nullable=False)
+    op.alter_column('phones', 'owner_id', nullable=False)
+    op.create_foreign_key('phones_owner_id_fkey', 'phones', 'users', ['owner_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_phones_owner_id_normalized', 'phones', ['owner_id', 'normalized'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_phones_owner_id_normalized', table_name='phones')
+    op.drop_constraint('phones_owner_id_fkey', 'phones', type_='foreignkey')
+    op.drop_column('phones', 'owner_id')
+    op.drop_column('phones', 'normalized')
@@ -0,0 +1,182 @@
+"""Name keys not null
+
+Revision ID: 4b7e9d2c1f58
+Revises: d6f1b3e8a274
+Create Date: 2026-10-19 23:05:18.742906
+
+"""
+import re
+import unicodedata
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e9d2c1f58'
+down_revision = 'd6f1b3e8a274'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+NAME_COLUMNS = ['first_name_normalized', 'last_name_normalized', 'first_name_phonetic', 'last_name_phonetic']
+# the keys of the name sorts of /contacts/read, which compare them in keyset pages
+NOT_NULL_COLUMNS = ['first_name_normalized', 'last_name_normalized']
+
+# src.contacts.phonetic.metaphone and src.contacts.names.name_keys as of this revision, so that the keys written
+# here do not change with the application: the Metaphone code of every word of the names, lowercase ASCII with
+# the accents folded
+VOWELS = frozenset("aeiou")
+FRONT_VOWELS = frozenset("eiy")
+H_DIGRAPHS = frozenset("csptg")
+SILENT_STARTS = ("ae", "gn", "kn", "pn", "wr")
+SAME_SOUND = {"f": "F", "j": "J", "l": "L", "m": "M", "n": "N", "r": "R", "q": "K", "v": "F", "z": "S"}
+NON_ALNUM = re.compile(r'[^0-9a-z ]')
+
+
+def metaphone(word: str) -> str:
+    word = ''.join(char for char in word if 'a' <= char <= 'z')
+    if word.startswith(SILENT_STARTS):
+        word = word[1:]
+    elif word.startswith("x"):
+        word = "s" + word[1:]
+    elif word.startswith("wh"):
+        word = "w" + word[2:]
+
+    code = []
+    for i, char in enumerate(word):
+        prev = word[i - 1] if i else ''
+        next_ = word[i + 1] if i + 1 < len(word) else ''
+        after = word[i + 2] if i + 2 < len(word) else ''
+        if char == prev and char != 'c':
+            continue
+        if char in VOWELS:
+            if i == 0:
+                code.append(char.upper())
+        elif char in SAME_SOUND:
+            code.append(SAME_SOUND[char])
+        elif char == 'b':
+            if not (prev == 'm' and not next_):
+                code.append('B')
+        elif char == 'c':
+            if next_ == 'i' and after == 'a' or next_ == 'h' and prev != 's':
+                code.append('X')
+            elif next_ in FRONT_VOWELS:
+                if prev != 's':
+                    code.append('S')
+            else:
+                code.append('K')
+        elif char == 'd':
+            code.append('J' if next_ == 'g' and after in FRONT_VOWELS else 'T')
+        elif char == 'g':
+            if next_ == 'h' and after and after not in VOWELS:
+                continue
+            if next_ == 'n' and (i + 2 == len(word) or word[i + 2:] == "ed"):
+                continue
+            if prev == 'd' and next_ in FRONT_VOWELS:
+                continue
+            code.append('J' if next_ in FRONT_VOWELS and prev != 'g' else 'K')
+        elif char == 'h':
+            if prev not in H_DIGRAPHS and next_ in VOWELS and (i == 0 or prev in VOWELS):
+                code.append('H')
+        elif char == 'k':
+            if prev != 'c':
+                code.append('K')
+        elif char == 'p':
+            code.append('F' if next_ == 'h' else 'P')
+        elif char == 's':
+            if next_ == 'h' or next_ == 'i' and after in ('a', 'o'):
+                code.append('X')
+            else:
+                code.append('S')
+        elif char == 't':
+            if next_ == 'i' and after in ('a', 'o'):
+                code.append('X')
+            elif next_ == 'h':
+                code.append('0')
+            elif not (next_ == 'c' and after == 'h'):
+                code.append('T')
+        elif char == 'w' or char == 'y':
+            if next_ in VOWELS:
+                code.append(char.upper())
+        elif char == 'x':
+            code.append('KS')
+    return ''.join(code)
+
+
+def normalize_name(name: str | None) -> str:
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return ' '.join(NON_ALNUM.sub(' ', name).split())
+
+
+def name_keys(row) -> dict:
+    keys = {}
+    for field in ('first_name', 'last_name'):
+        normalized = normalize_name(row[field])
+        keys[f"{field}_normalized"] = normalized
+        keys[f"{field}_phonetic"] = ' '.join(filter(None, (metaphone(word) for word in normalized.split())))
+    return keys
+
+
+def backfill(connection) -> None:
+    # the contacts still without keys, pass after pass until a pass from the start finds none, as in f3d81b6a9c47
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text('SELECT id, owner_id, first_name, last_name FROM contacts '
+                    'WHERE (first_name_normalized IS NULL OR last_name_normalized IS NULL) AND id > :last_id '
+                    'ORDER BY id LIMIT :limit'),
+            {"last_id": last_id, "limit": BATCH_SIZE},
+        ).mappings().all()
+        if not rows:
+            if not last_id:
+                return
+            last_id = 0
+            continue
+        connection.execute(
+            sa.text(f'UPDATE contacts SET {", ".join(f"{column} = :{column}" for column in NAME_COLUMNS)} '
+                    'WHERE id = :id AND owner_id = :owner_id'),
+            [{"id": row["id"], "owner_id": row["owner_id"], **name_keys(row)} for row in rows],
+        )
+        last_id = rows[-1]["id"]
+
+
+def set_not_null(connection, table: str, column: str) -> None:
+    # a validated CHECK lets SET NOT NULL skip its scan of the table under an ACCESS EXCLUSIVE lock; the check is
+    # validated under a lock that lets writes through
+    constraint = f'{table}_{column}_not_null'
+    connection.execute(sa.text(f'ALTER TABLE {table} ADD CONSTRAINT {constraint} CHECK ({column} IS NOT NULL) '
+                               'NOT VALID'))
+    connection.execute(sa.text(f'ALTER TABLE {table} VALIDATE CONSTRAINT {constraint}'))
+    connection.execute(sa.text(f'ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL'))
+    connection.execute(sa.text(f'ALTER TABLE {table} DROP CONSTRAINT {constraint}'))
+
+
+def upgrade() -> None:
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        backfill(connection)
+        for column in NOT_NULL_COLUMNS:
+            op.alter_column('contacts', column, existing_type=sa.String(length=100), nullable=False)
+        return
+    with op.get_context().autocommit_block():
+        backfill(connection)
+        # on contacts partitioned by owner, every partition first, after which the parent needs no scan
+        partitions = connection.execute(
+            sa.text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass('contacts')")
+        ).scalars().all()
+        for column in NOT_NULL_COLUMNS:
+            for partition in partitions:
+                set_not_null(connection, partition, column)
+            if partitions:
+                connection.execute(sa.text(f'ALTER TABLE contacts ALTER COLUMN {column} SET NOT NULL'))
+            else:
+                set_not_null(connection, 'contacts', column)
+
+
+def downgrade() -> None:
+    for column in NOT_NULL_COLUMNS:
+        op.alter_column('contacts', column, existing_type=sa.String(length=100), nullable=True)
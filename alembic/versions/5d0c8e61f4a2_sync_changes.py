@@ -0,0 +1,62 @@
+"""Sync changes
+
+Revision ID: 5d0c8e61f4a2
+Revises: 729153452d11
+Create Date: 2026-10-19 12:24:05.381467
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0c8e61f4a2'
+down_revision = '729153452d11'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    # now() is stable, so existing rows get the migration time without rewriting the tables
+    for table in ('contacts', 'phones', 'emails'):
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False))
+    op.add_column('emails', sa.Column('owner_id', sa.Integer(), nullable=True))
+    # committing every id batch on its own keeps row locks short while the table is backfilled
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        max_id = connection.execute(sa.text('SELECT coalesce(max(id), 0) FROM emails')).scalar()
+        for first_id in range(0, max_id + 1, BATCH_SIZE):
+            connection.execute(
+                sa.text('UPDATE emails SET owner_id = contacts.owner_id FROM contacts '
+                        'WHERE contacts.id = emails.contact_id AND emails.id >= :first_id AND emails.id < :last_id'),
+                {"first_id": first_id, "last_id": first_id + BATCH_SIZE},
+            )
+    op.alter_column('emails', 'owner_id', nullable=False)
+    op.create_foreign_key('emails_owner_id_fkey', 'emails', 'users', ['owner_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_contacts_owner_id_updated_at', 'contacts', ['owner_id', 'updated_at'], unique=False)
+    op.create_index('ix_phones_owner_id_updated_at', 'phones', ['owner_id', 'updated_at'], unique=False)
+    op.create_index('ix_emails_owner_id_updated_at', 'emails', ['owner_id', 'updated_at'], unique=False)
+    op.create_table('contact_tombstones',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('owner_id', sa.Integer(), nullable=False),
+                    sa.Column('contact_id', sa.Integer(), nullable=False),
+                    sa.Column('deleted_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+                    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_contact_tombstones_owner_id_deleted_at', 'contact_tombstones', ['owner_id', 'deleted_at'],
+                    unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tombstones_owner_id_deleted_at', table_name='contact_tombstones')
+    op.drop_table('contact_tombstones')
+    op.drop_index('ix_emails_owner_id_updated_at', table_name='emails')
+    op.drop_index('ix_phones_owner_id_updated_at', table_name='phones')
+    op.drop_index('ix_contacts_owner_id_updated_at', table_name='contacts')
+    op.drop_constraint('emails_owner_id_fkey', 'emails', type_='foreignkey')
+    op.drop_column('emails', 'owner_id')
+    for table in ('emails', 'phones', 'contacts'):
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,39 @@
+"""Birthday key
+
+Revision ID: 729153452d11
+Revises: 327a47fbebb7
+Create Date: 2026-10-19 11:02:17.554920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '729153452d11'
+down_revision = '327a47fbebb7'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_key', sa.SmallInteger(), nullable=True))
+    # committing every id batch on its own keeps row locks short while the table is backfilled
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        max_id = connection.execute(sa.text('SELECT coalesce(max(id), 0) FROM contacts')).scalar()
+        for first_id in range(0, max_id + 1, BATCH_SIZE):
+            connection.execute(
+                sa.text('UPDATE contacts '
+                        'SET birthday_key = EXTRACT(MONTH FROM birthday) * 100 + EXTRACT(DAY FROM birthday) '
+                        'WHERE birthday IS NOT NULL AND id >= :first_id AND id < :last_id'),
+                {"first_id": first_id, "last_id": first_id + BATCH_SIZE},
+            )
+    op.create_index('ix_contacts_owner_id_birthday_key', 'contacts', ['owner_id', 'birthday_key'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_owner_id_birthday_key', table_name='contacts')
+    op.drop_column('contacts', 'birthday_key')
@@ -0,0 +1,66 @@
+"""Tags
+
+Revision ID: a9e4c2d8b613
+Revises: f3d81b6a9c47
+Create Date: 2026-10-19 20:04:51.237816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from src.partitioning import add_foreign_keys, is_partitioned, partition_count
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9e4c2d8b613'
+down_revision = 'f3d81b6a9c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('tags',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('owner_id', sa.Integer(), nullable=False),
+                    sa.Column('name', sa.String(length=50), nullable=False),
+                    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_tags_owner_id_name', 'tags', ['owner_id', 'name'], unique=True)
+
+    columns = [sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+               sa.Column('contact_id', sa.Integer(), nullable=False),
+               sa.Column('tag_id', sa.Integer(), nullable=False),
+               sa.Column('owner_id', sa.Integer(), nullable=False)]
+    connection = op.get_bind()
+    if connection.dialect.name != 'postgresql':
+        op.create_table('contact_tags', *columns,
+                        sa.ForeignKeyConstraint(['contact_id'], ['contacts.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['tag_id'], ['tags.id'], ondelete='CASCADE'),
+                        sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ondelete='CASCADE'),
+                        sa.PrimaryKeyConstraint('id')
+                        )
+    elif is_partitioned(connection):
+        # contact_tags follows contacts into the layout of the partition_by_owner migration
+        partitions = partition_count(connection)
+        op.create_table('contact_tags', *columns, sa.PrimaryKeyConstraint('id', 'owner_id'),
+                        postgresql_partition_by='HASH (owner_id)')
+        for remainder in range(partitions):
+            op.execute(f"CREATE TABLE contact_tags_p{remainder} PARTITION OF contact_tags "
+                       f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})")
+    else:
+        op.create_table('contact_tags', *columns, sa.PrimaryKeyConstraint('id'))
+    op.create_index('ix_contact_tags_owner_id_tag_id_contact_id', 'contact_tags', ['owner_id', 'tag_id', 'contact_id'],
+                    unique=True)
+    op.create_index('ix_contact_tags_owner_id_contact_id', 'contact_tags', ['owner_id', 'contact_id'], unique=False)
+    if connection.dialect.name == 'postgresql':
+        # named and placed like the keys of a converted table, so src/partitioning.py can convert it again
+        add_foreign_keys(connection, is_partitioned(connection), ['contact_tags'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contact_tags_owner_id_contact_id', table_name='contact_tags')
+    op.drop_index('ix_contact_tags_owner_id_tag_id_contact_id', table_name='contact_tags')
+    op.drop_table('contact_tags')
+    op.drop_index('ix_tags_owner_id_name', table_name='tags')
+    op.drop_table('tags')
@@ -0,0 +1,51 @@
+"""Index audit
+
+Revision ID: b41f7d29c8e3
+Revises: 5d0c8e61f4a2
+Create Date: 2026-10-19 14:08:51.226310
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b41f7d29c8e3'
+down_revision = '5d0c8e61f4a2'
+branch_labels = None
+depends_on = None
+
+# every repository query filters on the owner or on the parent contact first; tests/test_query_plans.py
+# checks that none of them falls back to a sequential scan
+NEW_INDEXES = [
+    # owner-scoped reads in id order: lists, exports, duplicate search
+    ('ix_contacts_owner_id_id', 'contacts', ['owner_id', 'id']),
+    # owner-scoped name order, replaces the single-column name indexes no query can use
+    ('ix_contacts_owner_id_last_name_first_name', 'contacts', ['owner_id', 'last_name', 'first_name']),
+    # children by contact: joins, merges, exports, and the cascades of contact deletes
+    ('ix_phones_contact_id', 'phones', ['contact_id']),
+    ('ix_emails_contact_id', 'emails', ['contact_id']),
+    # number lookup answered from the index alone
+    ('ix_phones_owner_id_normalized_contact_id', 'phones', ['owner_id', 'normalized', 'contact_id']),
+]
+OLD_INDEXES = [
+    ('ix_contacts_first_name', 'contacts', ['first_name']),
+    ('ix_contacts_last_name', 'contacts', ['last_name']),
+    ('ix_phones_owner_id_normalized', 'phones', ['owner_id', 'normalized']),
+]
+
+
+def upgrade() -> None:
+    # built concurrently, so writes go on while the indexes of large tables are built
+    with op.get_context().autocommit_block():
+        for name, table, columns in NEW_INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+        for name, table, _ in OLD_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in OLD_INDEXES:
+            op.create_index(name, table, columns, unique=False, postgresql_concurrently=True)
+        for name, table, _ in NEW_INDEXES:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,65 @@
+"""Soft delete
+
+Revision ID: c7f2a94d1e60
+Revises: e8a3c6f5d217
+Create Date: 2026-10-19 16:52:40.318245
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7f2a94d1e60'
+down_revision = 'e8a3c6f5d217'
+branch_labels = None
+depends_on = None
+
+# the purger walks deleted contacts and old tombstones in (deleted_at, id) order
+NEW_INDEXES = [
+    ('ix_contacts_deleted_at_id', 'contacts', ['deleted_at', 'id'], 'deleted_at IS NOT NULL'),
+    ('ix_contact_tombstones_deleted_at_id', 'contact_tombstones', ['deleted_at', 'id'], None),
+]
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return bool(connection.scalar(sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+                                  {"table": table}))
+
+
+def create_index(connection, name: str, table: str, columns: list[str], where: str | None) -> None:
+    # src.partitioning.create_index as of this revision: an index built without blocking writes; on a partitioned
+    # table it is declared on the parent only, built concurrently on every partition and attached to it
+    definition = f"({', '.join(columns)})" + (f" WHERE {where}" if where else "")
+    if not is_partitioned(connection, table):
+        connection.execute(sa.text(f"CREATE INDEX CONCURRENTLY {name} ON {table} {definition}"))
+        return
+    connection.execute(sa.text(f"CREATE INDEX {name} ON ONLY {table} {definition}"))
+    partitions = connection.execute(
+        sa.text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"),
+        {"table": table},
+    ).scalars().all()
+    for partition in partitions:
+        partition_index = f"{name}{partition.removeprefix(table)}"
+        connection.execute(sa.text(f"CREATE INDEX CONCURRENTLY {partition_index} ON {partition} {definition}"))
+        connection.execute(sa.text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+
+
+def upgrade() -> None:
+    # nullable without a default: a change of the catalog only, however large the table
+    op.add_column('contacts', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in NEW_INDEXES:
+            if op.get_bind().dialect.name == 'postgresql':
+                create_index(op.get_bind(), name, table, columns, where)
+            else:
+                op.create_index(name, table, columns, unique=False,
+                                sqlite_where=sa.text(where) if where else None)
+
+
+def downgrade() -> None:
+    # without the column the contacts not purged yet would come back
+    op.execute("DELETE FROM contacts WHERE deleted_at IS NOT NULL")
+    for name, table, _, _ in NEW_INDEXES:
+        op.drop_index(name, table_name=table)
+    op.drop_column('contacts', 'deleted_at')
@@ -0,0 +1,80 @@
+"""Contact listing
+
+Revision ID: d6f1b3e8a274
+Revises: a9e4c2d8b613
+Create Date: 2026-10-19 21:12:37.480592
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd6f1b3e8a274'
+down_revision = 'a9e4c2d8b613'
+branch_labels = None
+depends_on = None
+
+# one index per sort key of /contacts/read, each ending with the id the pages continue after
+NEW_INDEXES = [
+    ('ix_contacts_owner_id_birthday_key_id', ['owner_id', 'birthday_key', 'id']),
+    ('ix_contacts_owner_id_first_name_sort', ['owner_id', 'first_name_normalized', 'last_name_normalized', 'id']),
+    ('ix_contacts_owner_id_last_name_sort', ['owner_id', 'last_name_normalized', 'first_name_normalized', 'id']),
+    ('ix_contacts_owner_id_created_at_id', ['owner_id', 'created_at', 'id']),
+]
+
+
+def is_partitioned(connection) -> bool:
+    return bool(connection.scalar(sa.text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('contacts')")))
+
+
+def create_index(connection, name: str, columns: list[str]) -> None:
+    # src.partitioning.create_index as of this revision: an index built without blocking writes; on partitioned
+    # contacts it is declared on the parent only, built concurrently on every partition and attached to it
+    definition = f"({', '.join(columns)})"
+    if not is_partitioned(connection):
+        connection.execute(sa.text(f"CREATE INDEX CONCURRENTLY {name} ON contacts {definition}"))
+        return
+    connection.execute(sa.text(f"CREATE INDEX {name} ON ONLY contacts {definition}"))
+    partitions = connection.execute(
+        sa.text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass('contacts')")
+    ).scalars().all()
+    for partition in partitions:
+        partition_index = f"{name}{partition.removeprefix('contacts')}"
+        connection.execute(sa.text(f"CREATE INDEX CONCURRENTLY {partition_index} ON {partition} {definition}"))
+        connection.execute(sa.text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+
+
+def drop_index(connection, name: str) -> None:
+    # Postgres cannot drop the index of a partitioned table concurrently; dropping it only takes a short lock to
+    # remove the catalog entries
+    if is_partitioned(connection):
+        connection.execute(sa.text(f"DROP INDEX {name}"))
+    else:
+        connection.execute(sa.text(f"DROP INDEX CONCURRENTLY {name}"))
+
+
+def upgrade() -> None:
+    # now() is evaluated once, so Postgres stores the default in the catalog instead of rewriting the table; the
+    # contacts created before this migration share its time
+    op.add_column('contacts', sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'),
+                                        nullable=False))
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for name, columns in NEW_INDEXES:
+            if connection.dialect.name == 'postgresql':
+                create_index(connection, name, columns)
+            else:
+                op.create_index(name, 'contacts', columns, unique=False)
+        # the upcoming birthdays are served by the index of the birthday sort, which starts with the same columns
+        if connection.dialect.name == 'postgresql':
+            drop_index(connection, 'ix_contacts_owner_id_birthday_key')
+        else:
+            op.drop_index('ix_contacts_owner_id_birthday_key', table_name='contacts')
+
+
+def downgrade() -> None:
+    op.create_index('ix_contacts_owner_id_birthday_key', 'contacts', ['owner_id', 'birthday_key'], unique=False)
+    for name, _ in NEW_INDEXES:
+        op.drop_index(name, table_name='contacts')
+    op.drop_column('contacts', 'created_at')
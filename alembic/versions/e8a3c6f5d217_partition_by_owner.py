@@ -0,0 +1,38 @@
+"""Partition by owner
+
+Revision ID: e8a3c6f5d217
+Revises: b41f7d29c8e3
+Create Date: 2026-10-19 15:37:12.904118
+
+"""
+from alembic import context, op
+
+from src.config import settings
+from src.partitioning import convert
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8a3c6f5d217'
+down_revision = 'b41f7d29c8e3'
+branch_labels = None
+depends_on = None
+
+
+def partitions() -> int:
+    # alembic -x partitions=16 upgrade head, or CONTACTS_PARTITIONS=16; plain tables when neither is set
+    return int(context.get_x_argument(as_dictionary=True).get("partitions", settings.contacts_partitions))
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql' or not partitions():
+        return
+    # the conversion commits batch by batch, see src/partitioning.py
+    with op.get_context().autocommit_block():
+        convert(op.get_bind(), partitions())
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    with op.get_context().autocommit_block():
+        convert(op.get_bind(), 0)
@@ -0,0 +1,105 @@
+"""
+Per-request cost of ``Auth.get_current_user`` with JWT access tokens and with session tokens.
+
+Redis is replaced by an in-process dictionary so the figures show the CPU cost of each mode: signature check
+and unpickling of the cached user for JWTs, unpickling of the session record for session tokens, nothing but a
+dictionary lookup for a session found in the local copy of the worker. With a real Redis, the JWT mode and the
+session mode without a local copy both add one network round trip per request.
+
+Usage::
+
+    python -m benchmarks.auth --requests 20000
+"""
+import argparse
+import asyncio
+import time
+
+from src.models import User
+from src.auth import service
+from src.auth.service import auth_service
+from src.auth.sessions import SessionStore
+from src.auth.user_cache import UserCache
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def sadd(self, key, *values):
+        self.data.setdefault(key, set()).update(values)
+
+    async def expire(self, key, seconds):
+        pass
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    def __init__(self, redis: MemoryRedis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+
+
+class MemoryConnector:
+    def __init__(self, redis: MemoryRedis):
+        self.redis = redis
+
+    async def get_redis_db(self):
+        return self.redis
+
+
+async def per_request_us(token: str, requests: int) -> float:
+    start = time.perf_counter()
+    for _ in range(requests):
+        await auth_service.get_current_user(token, None)
+    return (time.perf_counter() - start) * 1_000_000 / requests
+
+
+async def main(requests: int):
+    redis = MemoryRedis()
+    connector = MemoryConnector(redis)
+    user = User(id=1, username="bench", email="bench@example.com", password="x" * 60, avatar="avatar")
+    service.user_cache = UserCache(connector)
+    service.session_store = SessionStore(connector)
+
+    jwt_token = await auth_service.create_access_token(data={"sub": user.email})
+    await service.user_cache.set(user)
+    results = {"jwt + cached user": await per_request_us(jwt_token, requests)}
+
+    service.session_store.configure(900, 0)
+    session_token = await service.session_store.create(user)
+    results["session (redis GET)"] = await per_request_us(session_token, requests)
+
+    service.session_store.configure(900, 5)
+    session_token = await service.session_store.create(user)
+    results["session (local copy)"] = await per_request_us(session_token, requests)
+
+    print(f"{'mode':<22} {'us/request':>10}")
+    for mode, us in results.items():
+        print(f"{mode:<22} {us:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the authentication cost of the auth modes.")
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,64 @@
+"""
+Latency of ``AutocompleteIndex.search`` on a large address book.
+
+Builds the prefix index of ``--contacts`` contacts with Faker names for a scratch user in the Redis at ``--url``,
+times ``--queries`` lookups of random one to four letter prefixes, the keystrokes of a search box, and deletes
+the index. The figures include the round trip to Redis.
+
+Usage::
+
+    python -m benchmarks.autocomplete --url redis://localhost:6379 --contacts 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from faker import Faker
+
+from src.contacts.autocomplete import AutocompleteIndex, index_key, names_key, version_key
+from src.contacts.names import normalize_name
+from src.database_redis import RedisConnector
+
+# far above the ids of real users, so the benchmark never touches their indexes
+OWNER_ID = 2 ** 31 - 1
+
+
+async def main(url: str, contacts: int, queries: int, limit: int):
+    connector = RedisConnector(url)
+    index = AutocompleteIndex(connector)
+    fake = Faker()
+    names = [(contact_id, fake.first_name(), fake.last_name()) for contact_id in range(1, contacts + 1)]
+
+    async def load():
+        return names
+
+    try:
+        start = time.perf_counter()
+        await index.rebuild(OWNER_ID, load)
+        print(f"indexed {contacts} contacts in {time.perf_counter() - start:.2f}s")
+
+        words = [normalize_name(name) for _, first_name, last_name in names for name in (first_name, last_name)]
+        prefixes = [word[:random.randint(1, 4)] for word in random.choices(words, k=queries)]
+        timings, found = [], 0
+        for prefix in prefixes:
+            start = time.perf_counter()
+            found += len(await index.search(OWNER_ID, prefix, limit))
+            timings.append(time.perf_counter() - start)
+        timings.sort()
+        print(f"{queries} lookups, {found / queries:.1f} names each: "
+              f"p50 {timings[len(timings) // 2] * 1000:.3f} ms, p99 {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+    finally:
+        redis = await connector.get_redis_db()
+        await redis.delete(index_key(OWNER_ID), names_key(OWNER_ID), version_key(OWNER_ID))
+        await connector.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time autocomplete lookups on a large address book.")
+    parser.add_argument("--url", default="redis://localhost:6379", help="a Redis the benchmark may write to")
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.url, args.contacts, args.queries, args.limit))
@@ -0,0 +1,65 @@
+"""
+Duplicate detection on a synthetic address book.
+
+Generates ``--contacts`` contacts with one to two phones and emails each, copies a share of them with
+reformatted phones, tagged emails and slightly misspelled names, and times ``find_duplicate_groups``.
+
+Usage::
+
+    python -m benchmarks.dedupe --contacts 100000 --duplicates 0.1
+"""
+import argparse
+import random
+import string
+import time
+
+from src.contacts.service import find_duplicate_groups
+
+
+def _name(rnd: random.Random) -> str:
+    return rnd.choice(string.ascii_uppercase) + ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 8)))
+
+
+def _misspell(rnd: random.Random, name: str) -> str:
+    i = rnd.randrange(1, len(name))
+    return name[:i] + name[i + 1:]
+
+
+def generate(count: int, duplicate_share: float, seed: int = 0):
+    rnd = random.Random(seed)
+    contacts, phones, emails = [], [], []
+    for contact_id in range(1, count + 1):
+        first_name, last_name = _name(rnd), _name(rnd)
+        contacts.append((contact_id, first_name, last_name))
+        for _ in range(rnd.randint(1, 2)):
+            phones.append((contact_id, f"+380 {rnd.randint(10, 99)} {rnd.randint(1000000, 9999999)}"))
+        for _ in range(rnd.randint(1, 2)):
+            emails.append((contact_id, f"{first_name}.{last_name}{rnd.randint(1, 9999)}@example.com".lower()))
+
+    originals = rnd.sample(range(count), int(count * duplicate_share))
+    next_id = count + 1
+    phone_index = {contact_id: number for contact_id, number in phones}
+    for index in originals:
+        contact_id, first_name, last_name = contacts[index]
+        contacts.append((next_id, _misspell(rnd, first_name), last_name))
+        phones.append((next_id, '0' + ''.join(c for c in phone_index[contact_id] if c.isdigit())[-9:]))
+        next_id += 1
+    return contacts, phones, emails, len(originals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time duplicate detection on a synthetic address book.")
+    parser.add_argument("--contacts", type=int, default=100_000)
+    parser.add_argument("--duplicates", type=float, default=0.1)
+    args = parser.parse_args()
+
+    contacts, phones, emails, planted = generate(args.contacts, args.duplicates)
+    start = time.perf_counter()
+    groups = find_duplicate_groups(contacts, phones, emails)
+    elapsed = time.perf_counter() - start
+    print(f"{len(contacts)} contacts, {len(phones)} phones, {len(emails)} emails")
+    print(f"{len(groups)} groups found ({planted} planted) in {elapsed:.2f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""
+Bandwidth against CPU time of the response encodings on ``list[ContactOut]`` payloads.
+
+Builds synthetic address books, renders them the way ``NegotiatedResponse`` does (JSON or MessagePack) and
+compresses the body with every available encoder, reporting the size and the CPU time per response.
+
+Usage::
+
+    python -m benchmarks.encoding --contacts 1000 10000 --repeat 5
+"""
+import argparse
+import json
+import random
+import string
+import time
+
+from src.encoding import GzipEncoder, BrotliEncoder, brotli, msgpack
+
+
+def generate(count: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+
+    def name() -> str:
+        return rnd.choice(string.ascii_uppercase) + ''.join(rnd.choices(string.ascii_lowercase, k=rnd.randint(3, 8)))
+
+    contacts = []
+    for contact_id in range(1, count + 1):
+        first_name, last_name = name(), name()
+        contacts.append({
+            "first_name": first_name,
+            "last_name": last_name,
+            "birthday": f"19{rnd.randint(50, 99)}-{rnd.randint(1, 12):02}-{rnd.randint(1, 28):02}",
+            "description": "Description",
+            "id": contact_id,
+            "emails": [{"address": f"{first_name}.{last_name}@example.com".lower(), "id": contact_id * 2 + i}
+                       for i in range(rnd.randint(0, 2))],
+            "phones": [{"number": f"+380 {rnd.randint(10, 99)} {rnd.randint(1000000, 9999999)}",
+                        "id": contact_id * 2 + i} for i in range(rnd.randint(0, 2))],
+        })
+    return contacts
+
+
+def renderers() -> dict:
+    result = {"json": lambda content: json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None,
+                                                 separators=(",", ":")).encode("utf-8")}
+    if msgpack is not None:
+        result["msgpack"] = lambda content: msgpack.packb(content, use_bin_type=True)
+    return result
+
+
+def encoders() -> dict:
+    result = {"identity": None, "gzip-1": lambda: GzipEncoder(1), "gzip-6": lambda: GzipEncoder(6),
+              "gzip-9": lambda: GzipEncoder(9)}
+    if brotli is not None:
+        result.update({"br-1": lambda: BrotliEncoder(1), "br-4": lambda: BrotliEncoder(4),
+                       "br-11": lambda: BrotliEncoder(11)})
+    return result
+
+
+def encode(make_encoder, body: bytes) -> bytes:
+    encoder = make_encoder()
+    return encoder.compress(body) + encoder.finish()
+
+
+def cpu_ms(function, repeat: int) -> tuple[float, object]:
+    start = time.process_time()
+    for _ in range(repeat):
+        result = function()
+    return (time.process_time() - start) * 1000 / repeat, result
+
+
+def main(counts: list[int], repeat: int):
+    print(f"{'contacts':>8} {'format':<8} {'encoding':<9} {'bytes':>10} {'ratio':>6} {'render ms':>10} "
+          f"{'encode ms':>10}")
+    for count in counts:
+        contacts = generate(count)
+        for format_name, render in renderers().items():
+            render_ms, body = cpu_ms(lambda: render(contacts), repeat)
+            for encoding_name, encoder in encoders().items():
+                if encoder is None:
+                    encode_ms, encoded = 0.0, body
+                else:
+                    encode_ms, encoded = cpu_ms(lambda: encode(encoder, body), repeat)
+                print(f"{count:>8} {format_name:<8} {encoding_name:<9} {len(encoded):>10} "
+                      f"{len(body) / len(encoded):>6.1f} {render_ms:>10.2f} {encode_ms:>10.2f}")
+    if brotli is None:
+        print("brotli is not installed, br rows skipped")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the response encodings.")
+    parser.add_argument("--contacts", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    main(args.contacts, args.repeat)
@@ -0,0 +1,56 @@
+"""
+Import-time benchmark for the application entry point.
+
+Runs ``python -X importtime -c "import main"`` in a fresh interpreter and reports the cumulative import
+time of ``main`` together with the slowest top-level packages it pulls in.
+
+Usage::
+
+    python -m benchmarks.import_time [--top 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure_import_time(module: str = "main") -> dict[str, int]:
+    """
+    Import ``module`` in a fresh interpreter with ``-X importtime``.
+
+    :param module: Dotted name of the module to import.
+    :type module: str
+    :return: Cumulative import time in microseconds for every module that was imported.
+    :rtype: dict[str, int]
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=os.environ.copy(), capture_output=True, text=True, check=True,
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        timings[name.strip()] = int(cumulative_us)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    timings = measure_import_time(args.module)
+    top_level = {name: us for name, us in timings.items() if "." not in name and name != args.module}
+    print(f"{args.module}: {timings[args.module] / 1000:.1f} ms")
+    for name, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {name:<30} {us / 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Rows, cells and bytes of ``/contacts/read`` with and without ``?fields=``.
+
+Fills an in-memory SQLite database with ``--contacts`` contacts of one user, each with two phones, two emails
+and a description, then reads them through ``get_contacts`` for every field set. The SQL statements are
+recorded and run again on the raw connection to count the rows and cells the database returned.
+
+Usage::
+
+    python -m benchmarks.sparse_fields --contacts 10000 --fields id,first_name,last_name id,first_name,phones
+"""
+import argparse
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+from pydantic import TypeAdapter
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact, Phone, Email
+from src.contacts.repository import get_contacts
+from src.contacts.schemas import ContactOut, contact_fields_adapter
+from src.contacts.service import parse_fields
+
+
+async def fill(session_maker, count: int):
+    async with session_maker() as session, session.begin():
+        session.add(User(id=1, username="bench", email="bench@example.com", password="password"))
+        await session.flush()
+        await session.execute(insert(Contact), [
+            {"id": i, "owner_id": 1, "first_name": f"First{i}", "last_name": f"Last{i}", "description": "x" * 200}
+            for i in range(1, count + 1)
+        ])
+        await session.execute(insert(Phone), [
+            {"number": f"+380 50 {i:07}{j}", "normalized": f"38050{i:07}{j}", "contact_id": i, "owner_id": 1}
+            for i in range(1, count + 1) for j in range(2)
+        ])
+        await session.execute(insert(Email), [
+            {"address": f"first{i}.{j}@example.com", "contact_id": i, "owner_id": 1}
+            for i in range(1, count + 1) for j in range(2)
+        ])
+
+
+async def measure(engine, session_maker, fields: tuple[str, ...] | None) -> dict:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", record)
+    start = time.perf_counter()
+    async with session_maker() as session:
+        contacts = await get_contacts(SimpleNamespace(id=1), session, fields)
+    if fields is None:
+        adapter = TypeAdapter(list[ContactOut])
+        body = json.dumps(adapter.dump_python(adapter.validate_python(contacts, from_attributes=True), mode="json"))
+    else:
+        adapter = contact_fields_adapter(fields)
+        body = json.dumps(adapter.dump_python(adapter.validate_python(contacts), mode="json"))
+    seconds = time.perf_counter() - start
+    event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    rows = cells = 0
+    async with engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement.lstrip().upper().startswith("SELECT"):
+                result = await conn.exec_driver_sql(statement, parameters)
+                fetched = result.all()
+                rows += len(fetched)
+                cells += len(fetched) * len(result.keys())
+    return {"queries": len(statements), "rows": rows, "cells": cells, "bytes": len(body.encode()),
+            "seconds": seconds}
+
+
+async def main(count: int, field_sets: list[str]):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    await fill(session_maker, count)
+
+    print(f"{'fields':<36} {'queries':>7} {'rows':>8} {'cells':>9} {'bytes':>10} {'seconds':>8}")
+    for field_set in ["", *field_sets]:
+        stats = await measure(engine, session_maker, parse_fields(field_set))
+        print(f"{field_set or '(all)':<36} {stats['queries']:>7} {stats['rows']:>8} {stats['cells']:>9} "
+              f"{stats['bytes']:>10} {stats['seconds']:>8.3f}")
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare full and sparse contact reads.")
+    parser.add_argument("--contacts", type=int, default=10000)
+    parser.add_argument("--fields", nargs="+", default=["id,first_name,last_name", "id,first_name,last_name,phones"])
+    args = parser.parse_args()
+    asyncio.run(main(args.contacts, args.fields))
@@ -0,0 +1,91 @@
+"""
+Throughput of the contacts read path for an increasing number of workers.
+
+Starts ``server.py`` with 1..N workers in turn and drives ``GET /api/contacts/read`` with concurrent
+keep-alive connections. Needs the Postgres and Redis from ``.env`` and an access token of a user that has
+contacts (``POST /api/auth/login``).
+
+Usage::
+
+    python -m benchmarks.workers_throughput --token <access token> --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+async def wait_until_up(base_url: str, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get(f"{base_url}/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"server at {base_url} did not start")
+
+
+async def drive(base_url: str, token: str, concurrency: int, duration: float) -> tuple[int, int]:
+    headers = {"Authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    ok = errors = 0
+    deadline = time.perf_counter() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits) as client:
+        async def worker():
+            nonlocal ok, errors
+            while time.perf_counter() < deadline:
+                response = await client.get("/api/contacts/read")
+                if response.status_code == 200:
+                    ok += 1
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return ok, errors
+
+
+def measure(workers: int, token: str, port: int, concurrency: int, duration: float) -> float:
+    env = os.environ.copy()
+    env["SERVER_PORT"] = str(port)
+    env["SERVER_HOST"] = "127.0.0.1"
+    server = subprocess.Popen([sys.executable, "server.py", "--workers", str(workers)], cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        asyncio.run(wait_until_up(base_url))
+        ok, errors = asyncio.run(drive(base_url, token, concurrency, duration))
+    finally:
+        server.terminate()
+        server.wait()
+    if errors:
+        print(f"  {errors} failed requests with {workers} worker(s)")
+    return ok / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Contacts read throughput per worker count.")
+    parser.add_argument("--token", required=True)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 4])
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    baseline = None
+    for workers in sorted(set(args.workers)):
+        rps = measure(workers, args.token, args.port, args.concurrency, args.duration)
+        baseline = baseline or rps
+        print(f"{workers:>3} worker(s): {rps:9.1f} req/s  x{rps / baseline:.2f}")
+
+
+if __name__ == '__main__':
+    main()
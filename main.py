@@ -1,42 +1,37 @@
+import secrets
 import time
-import uvicorn
-from fastapi import Depends, FastAPI, Request
-from fastapi.middleware.cors import CORSMiddleware
-
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
+from contextlib import asynccontextmanager
 
-from src.contacts.routes import router as contacts
-from src.phones.routes import router as phones
-from src.emails.routes import router as emails
-from src.auth.routes import router as auth
-from src.mailing.routes import router as mailing
-from src.user.routes import router as user
-from src.database_redis import redis_db
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+from src.config import Settings, settings as default_settings
+from src.database_postgres import postgres_db, build_database_url, build_engine_options
+from src.database_redis import redis_db, build_redis_url
+from src.encoding import NegotiatedResponse, ResponseEncodingMiddleware, encoding_metrics
+from src.events import change_broker
+from src.auth.revocation import revocation_list
+from src.contacts.autocomplete import autocomplete_index
 
 origins = ["http://localhost:3000"]
 
-app.include_router(auth, prefix='/api')
-app.include_router(user, prefix='/api')
-app.include_router(mailing, prefix='/api')
 
-app.include_router(contacts, prefix='/api')
-app.include_router(phones, prefix='/api')
-app.include_router(emails, prefix='/api')
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # every worker process runs its own lifespan, so each one owns its pools
+    postgres_db.get_engine()
+    await redis_db.get_redis_db()
+    await change_broker.start()
+    await revocation_list.start()
+    autocomplete_index.start()
+    yield
+    autocomplete_index.close()
+    await revocation_list.close()
+    await change_broker.close()
+    await postgres_db.dispose()
+    await redis_db.close()
 
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-
-@app.middleware("http")
 async def add_process_time_header(request: Request, call_next):
     start_time = time.time()
     response = await call_next(request)
@@ -45,10 +40,89 @@ async def add_process_time_header(request: Request, call_next):
     return response
 
 
-@app.get("/")
 def read_root():
     return {"message": "Hello World"}
 
 
+def require_metrics_token(request: Request):
+    # for operators only, with the token of METRICS_TOKEN rather than the token of a user
+    expected = f"Bearer {request.app.state.settings.metrics_token}".encode()
+    if not secrets.compare_digest(request.headers.get("Authorization", "").encode(), expected):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+def read_encoding_metrics():
+    # counters of this worker only
+    return encoding_metrics.snapshot()
+
+
+def create_app(settings: Settings | None = None) -> FastAPI:
+    """
+    Build the application.
+
+    Heavy clients (database engine, Redis connection, mail client, password hasher, Cloudinary) are not
+    created here: they are configured from ``settings`` and initialized on first use, and the pools are
+    closed in the lifespan hook.
+
+    :param settings: Settings to configure the application with. Defaults to the settings loaded from the environment.
+    :type settings: Settings, optional
+    :return: The configured application.
+    :rtype: FastAPI
+    """
+    from src.contacts.routes import router as contacts
+    from src.phones.routes import router as phones
+    from src.emails.routes import router as emails
+    from src.auth.routes import router as auth
+    from src.mailing.routes import router as mailing
+    from src.user.routes import router as user
+    from src.auth.service import auth_service
+    from src.mailing.service import mail_service
+
+    if settings is not None:
+        postgres_db.configure(build_database_url(settings), settings.postgres_replica_urls,
+                              settings.read_your_writes_window, **build_engine_options(settings))
+        redis_db.configure(build_redis_url(settings))
+        auth_service.configure(settings)
+        mail_service.configure(settings)
+
+    app = FastAPI(lifespan=lifespan, default_response_class=NegotiatedResponse)
+    app.state.settings = settings = settings or default_settings
+
+    app.include_router(auth, prefix='/api')
+    app.include_router(user, prefix='/api')
+    app.include_router(mailing, prefix='/api')
+
+    app.include_router(contacts, prefix='/api')
+    app.include_router(phones, prefix='/api')
+    app.include_router(emails, prefix='/api')
+
+    app.add_middleware(
+        ResponseEncodingMiddleware,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.middleware("http")(add_process_time_header)
+    app.get("/")(read_root)
+    # not served at all without a token to guard it
+    if settings.metrics_token:
+        app.get("/metrics/encoding", dependencies=[Depends(require_metrics_token)],
+                include_in_schema=False)(read_encoding_metrics)
+    return app
+
+
+app = create_app()
+
+
 if __name__ == '__main__':
+    import uvicorn
+
     uvicorn.run(app, host="localhost", port=8000)
@@ -0,0 +1,62 @@
+"""
+Production entry point.
+
+Runs the application under uvicorn with several worker processes. Each worker imports ``main``, which builds
+the app once from the settings in the environment, and opens its own database and Redis pools in the lifespan
+hook. On SIGTERM uvicorn stops
+accepting connections, lets in-flight requests finish for up to ``SERVER_GRACEFUL_TIMEOUT`` seconds and then
+runs the lifespan shutdown, which closes the pools.
+
+uvloop and httptools are used when they are installed (``pip install uvloop httptools``), otherwise uvicorn
+falls back to the asyncio loop and the h11 parser.
+
+Usage::
+
+    python server.py --workers 4
+"""
+import argparse
+import importlib.util
+
+from src.config import Settings, settings as default_settings
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def build_server_options(settings: Settings, workers: int | None = None) -> dict:
+    """
+    Build the keyword arguments for ``uvicorn.run`` from the settings.
+
+    :param settings: Settings holding the ``server_*`` options.
+    :type settings: Settings
+    :param workers: Number of worker processes. Overrides ``settings.server_workers`` when given.
+    :type workers: int, optional
+    :return: Keyword arguments for ``uvicorn.run``.
+    :rtype: dict
+    """
+    return {
+        "host": settings.server_host,
+        "port": settings.server_port,
+        "workers": workers or settings.server_workers,
+        "loop": "uvloop" if _installed("uvloop") else "asyncio",
+        "http": "httptools" if _installed("httptools") else "h11",
+        "timeout_keep_alive": settings.server_keepalive,
+        "backlog": settings.server_backlog,
+        "timeout_graceful_shutdown": settings.server_graceful_timeout,
+        "access_log": False,
+    }
+
+
+def run(workers: int | None = None):
+    import uvicorn
+
+    # the workers are new processes that read their settings from the environment, like this one
+    uvicorn.run("main:app", **build_server_options(default_settings, workers))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the API with several worker processes.")
+    parser.add_argument("--workers", type=int, default=None, help="defaults to SERVER_WORKERS")
+    args = parser.parse_args()
+    run(workers=args.workers)
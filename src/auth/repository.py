@@ -1,19 +1,21 @@
-from libgravatar import Gravatar
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
 
 from src.models import User
 from src.auth.schemas import UserModel
+from src.database_postgres import read_session, pin_to_primary
 
 
 async def get_user_by_email(email: str, session: AsyncSession) -> User:
-    async with session.begin():
+    async with read_session(email, session) as session, session.begin():
         stmt = select(User).where(User.email == email).limit(1)
         result = await session.execute(stmt)
         return result.scalars().unique().one_or_none()
 
 
 async def create_user(body: UserModel, session: AsyncSession) -> User:
+    from libgravatar import Gravatar
+
     avatar = None
     try:
         g = Gravatar(body.email)
@@ -23,10 +25,13 @@ async def create_user(body: UserModel, session: AsyncSession) -> User:
     new_user = User(**body.model_dump(), avatar=avatar)
     async with session.begin():
         session.add(new_user)
+    await pin_to_primary(new_user.email)
     return new_user
 
 
 async def update_token(user: User, token: str | None, session: AsyncSession) -> None:
+    # the user may have been loaded from a replica, so the write is an UPDATE on the primary
     async with session.begin():
-        user.refresh_token = token
-        await session.commit()
+        await session.execute(update(User).where(User.id == user.id).values(refresh_token=token))
+    await pin_to_primary(user.email)
+    user.refresh_token = token
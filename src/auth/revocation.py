@@ -0,0 +1,186 @@
+"""
+Revoked access tokens.
+
+A revoked token is kept in Redis under its ``jti`` until the token would have expired anyway, and announced on
+a pub/sub channel. Every worker mirrors the live entries in memory: it loads them from Redis when it starts and
+adds the announced ones as they come, so checking a token costs a dictionary lookup and no round trip. Access
+tokens live for minutes, which keeps the mirror as small as the number of logouts in that window.
+
+All the access tokens of a user, e.g. after a password change, are revoked the same way with one entry under
+their subject that rejects the tokens issued before it, since the ids of the tokens of a user are not kept.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from src.database_redis import RedisConnector, redis_db
+
+KEY_PREFIX = "revoked:jti:"
+USER_KEY_PREFIX = "revoked:user:"
+CHANNEL = "auth:revoked"
+
+logger = logging.getLogger(__name__)
+
+
+def revoked_key(jti: str) -> str:
+    return f"{KEY_PREFIX}{jti}"
+
+
+def revoked_user_key(subject: str) -> str:
+    return f"{USER_KEY_PREFIX}{subject}"
+
+
+class RevocationList:
+
+    def __init__(self, redis_connector: RedisConnector):
+        self.redis_connector = redis_connector
+        # jti -> expiry of the token as a unix timestamp
+        self.revoked: dict[str, float] = {}
+        # subject -> (time before which its tokens were issued, expiry of the last of them)
+        self.revoked_users: dict[str, tuple[float, float]] = {}
+        self.pubsub = None
+        self.reader = None
+
+    @property
+    def started(self) -> bool:
+        return self.pubsub is not None
+
+    async def start(self):
+        redis = await self.redis_connector.get_redis_db()
+        self.pubsub = redis.pubsub()
+        try:
+            await self.sync()
+        except RedisError:
+            # the worker starts anyway, and its reader syncs the mirror once Redis is back
+            logger.warning("cannot load the revoked tokens, retrying in the background", exc_info=True)
+            self.reader = asyncio.create_task(self.read(synced=False))
+        else:
+            self.reader = asyncio.create_task(self.read())
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            try:
+                await self.reader
+            except asyncio.CancelledError:
+                pass
+            self.reader = None
+        if self.pubsub is not None:
+            await self.pubsub.close()
+            self.pubsub = None
+
+    def is_revoked(self, jti: str | None, subject: str | None = None, issued_at: float | None = None) -> bool:
+        """
+        Check a token against the mirror of this worker, without calling Redis.
+
+        :param jti: Id of the token. Tokens issued without one cannot be revoked one by one.
+        :type jti: str | None
+        :param subject: The ``sub`` claim of the token.
+        :type subject: str | None
+        :param issued_at: The ``iat`` claim of the token.
+        :type issued_at: float | None
+        :return: True if the token, or every token of its subject issued before it, was revoked.
+        :rtype: bool
+        """
+        if jti is not None and jti in self.revoked:
+            return True
+        revoked_user = self.revoked_users.get(subject)
+        return revoked_user is not None and issued_at is not None and issued_at < revoked_user[0]
+
+    def add(self, jti: str, expires_at: float):
+        self.prune()
+        if expires_at > time.time():
+            self.revoked[jti] = expires_at
+
+    def add_user(self, subject: str, before: float, expires_at: float):
+        self.prune()
+        if expires_at > time.time():
+            self.revoked_users[subject] = (before, expires_at)
+
+    def prune(self):
+        now = time.time()
+        for expired in [key for key, value in self.revoked.items() if value <= now]:
+            del self.revoked[expired]
+        for expired in [key for key, (_, value) in self.revoked_users.items() if value <= now]:
+            del self.revoked_users[expired]
+
+    async def revoke(self, jti: str, expires_at: float):
+        """
+        Revoke a token on every worker until it expires.
+
+        :param jti: Id of the token.
+        :type jti: str
+        :param expires_at: The ``exp`` claim of the token.
+        :type expires_at: float
+        """
+        remaining = int(expires_at - time.time()) + 1
+        if remaining <= 0:
+            return
+        redis = await self.redis_connector.get_redis_db()
+        await redis.set(revoked_key(jti), expires_at, ex=remaining)
+        await redis.publish(CHANNEL, json.dumps({"jti": jti, "exp": expires_at}))
+        self.add(jti, expires_at)
+
+    async def revoke_user(self, subject: str, expires_at: float):
+        """
+        Revoke every token of a subject issued until now, on every worker.
+
+        :param subject: The ``sub`` claim of the tokens.
+        :type subject: str
+        :param expires_at: Expiry of the last token issued until now.
+        :type expires_at: float
+        """
+        before = time.time()
+        remaining = int(expires_at - before) + 1
+        redis = await self.redis_connector.get_redis_db()
+        value = json.dumps({"before": before, "exp": expires_at})
+        await redis.set(revoked_user_key(subject), value, ex=remaining)
+        await redis.publish(CHANNEL, json.dumps({"sub": subject, "before": before, "exp": expires_at}))
+        self.add_user(subject, before, expires_at)
+
+    async def sync(self):
+        # subscribe before loading, so a token revoked in between is not missed
+        await self.pubsub.subscribe(CHANNEL)
+        await self.load()
+
+    async def load(self):
+        redis = await self.redis_connector.get_redis_db()
+        keys = [key async for key in redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000)]
+        if keys:
+            for key, value in zip(keys, await redis.mget(keys)):
+                # a key may expire between the scan and the read
+                if value is not None:
+                    self.add(key.decode().removeprefix(KEY_PREFIX), float(value))
+        keys = [key async for key in redis.scan_iter(match=f"{USER_KEY_PREFIX}*", count=1000)]
+        if keys:
+            for key, value in zip(keys, await redis.mget(keys)):
+                if value is not None:
+                    value = json.loads(value)
+                    self.add_user(key.decode().removeprefix(USER_KEY_PREFIX), value["before"], value["exp"])
+
+    async def read(self, synced: bool = True):
+        while True:
+            try:
+                if not synced:
+                    await self.sync()
+                    synced = True
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except RedisError:
+                # announcements sent while disconnected are lost, so the mirror is loaded again
+                logger.warning("cannot read the revoked tokens, syncing again", exc_info=True)
+                synced = False
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            data = json.loads(message["data"])
+            if "sub" in data:
+                self.add_user(data["sub"], data["before"], data["exp"])
+            else:
+                self.add(data["jti"], data["exp"])
+
+
+revocation_list = RevocationList(redis_db)
@@ -7,6 +7,10 @@ from src.database_postgres import get_session
 from src.auth.schemas import UserModel, UserResponse, TokenModel
 from src.auth import repository as repository_users
 from src.auth.service import auth_service
+from src.auth.tokens import refresh_token_store
+from src.auth.revocation import revocation_list
+from src.auth.sessions import session_store, is_session_token
+from src.models import User
 from src.mailing.service import mail_service
 
 
@@ -16,6 +20,22 @@ security = HTTPBearer()
 dependencies = [Depends(RateLimiter(times=2, seconds=5))]
 
 
+async def create_tokens(email: str, family: str, token_id: str, db: AsyncSession, user: User | None = None) -> dict:
+    if auth_service.auth_mode == "session":
+        # the session keeps a snapshot of the user, refreshing a family token has to read it once
+        if user is None:
+            user = await repository_users.get_user_by_email(email, db)
+            if user is None:
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        access_token = await auth_service.create_session_token(user, family)
+    else:
+        # the family goes into the access token too, so that logging out can end it
+        access_token = await auth_service.create_access_token(data={"sub": email, "fam": family})
+    refresh_token = await auth_service.create_refresh_token(data={"sub": email, "fam": family, "jti": token_id},
+                                                            expires_delta=refresh_token_store.ttl.total_seconds())
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
 @router.post("/signup", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def signup(body: UserModel, background_tasks: BackgroundTasks, request: Request,
                  db: AsyncSession = Depends(get_session)):
@@ -80,7 +100,7 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
 
        **Notes**:
 
-       The function first checks the validity of the provided email and then confirms if the email is verified. It then verifies the provided password. If all checks pass, it generates and returns the access and refresh tokens.
+       The function first checks the validity of the provided email and then confirms if the email is verified. It then verifies the provided password. If all checks pass, it generates and returns the access and refresh tokens. Every login starts a new refresh token family in Redis, so each device keeps its own session. With ``AUTH_MODE=session`` the access token is an opaque session token instead of a JWT.
     """
     user = await repository_users.get_user_by_email(body.username, db)
     if user is None:
@@ -90,23 +110,77 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: AsyncSession =
     elif not auth_service.verify_password(body.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     else:
-        access_token = await auth_service.create_access_token(data={"sub": user.email})
-        refresh_token = await auth_service.create_refresh_token(data={"sub": user.email})
-        await repository_users.update_token(user, refresh_token, db)
-        return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+        family, token_id = await refresh_token_store.start_family(user.email)
+        return await create_tokens(user.email, family, token_id, db, user)
 
 
 @router.get('/refresh_token', response_model=TokenModel)
 async def refresh_token(credentials: HTTPAuthorizationCredentials = Security(security),
                         db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /refresh_token
+
+       Exchange a refresh token for a new access token and a new refresh token.
+
+       :param credentials: The refresh token, sent as a bearer token.
+       :type credentials: HTTPAuthorizationCredentials
+       :param db: The asynchronous database session, only used for refresh tokens issued before the token families.
+       :type db: AsyncSession, optional
+       :return: A dictionary containing the access token, refresh token, and token type.
+       :rtype: TokenModel
+       :raises HTTPException: 401 Unauthorized if the token is invalid, expired, revoked or was already used.
+
+       **Notes**:
+
+       Refresh tokens are single use. Presenting a token that was already exchanged revokes its whole family, so a stolen token stops working for both the thief and the device it was stolen from. Refreshing reads and writes Redis only, except in session mode where the user is read once for the snapshot of the new session.
+    """
     token = credentials.credentials
-    email = await auth_service.decode_refresh_token(token)
-    user = await repository_users.get_user_by_email(email, db)
-    if user.refresh_token != token:
+    payload = await auth_service.decode_refresh_payload(token)
+    email = payload["sub"]
+    if "fam" in payload:
+        family = payload["fam"]
+        token_id = await refresh_token_store.rotate(family, payload.get("jti", ""), email)
+        if token_id is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+    else:
+        # a token from before the families: checked against the users table once, then moved to a family
+        user = await repository_users.get_user_by_email(email, db)
+        if user is None or user.refresh_token != token:
+            if user is not None:
+                await repository_users.update_token(user, None, db)
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
         await repository_users.update_token(user, None, db)
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        family, token_id = await refresh_token_store.start_family(email)
+        return await create_tokens(email, family, token_id, db, user)
+    return await create_tokens(email, family, token_id, db)
 
-    access_token = await auth_service.create_access_token(data={"sub": email})
-    refresh_token = await auth_service.create_refresh_token(data={"sub": email})
-    await repository_users.update_token(user, refresh_token, db)
-    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+@router.post('/logout')
+async def logout(credentials: HTTPAuthorizationCredentials = Security(security)):
+    """
+    .. http:post:: /logout
+
+       Revoke the presented access token or session token before it expires, and the refresh tokens of its login.
+
+       :param credentials: The token to revoke, sent as a bearer token.
+       :type credentials: HTTPAuthorizationCredentials
+       :return: A message confirming the logout.
+       :rtype: dict
+       :raises HTTPException: 401 Unauthorized if the token is invalid, expired or already revoked.
+
+       **Notes**:
+
+       The id of the token is stored in Redis until the token expires and announced to every worker, which keep the revoked ids in memory, so authenticating later requests needs no extra Redis call. Tokens issued before the ids were added cannot be revoked and stay valid until they expire. The refresh token family of the login is revoked, so the refresh token cannot issue new access tokens; access tokens issued before they carried the family leave it to expire. A session token is deleted from Redis, with the refresh token family of its login; other workers may still accept it for up to ``SESSION_LOCAL_CACHE_SECONDS``.
+    """
+    if is_session_token(credentials.credentials):
+        record = await auth_service.get_session_record(credentials.credentials)
+        await session_store.revoke(credentials.credentials)
+        family = record.get("fam")
+    else:
+        payload = await auth_service.decode_access_payload(credentials.credentials)
+        if "jti" in payload:
+            await revocation_list.revoke(payload["jti"], payload["exp"])
+        family = payload.get("fam")
+    if family is not None:
+        await refresh_token_store.revoke(family)
+    return {"message": "Logged out sucsessfully."}
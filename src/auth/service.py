@@ -1,23 +1,49 @@
-import pickle
+import uuid
 
-from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.config import settings as s
+from src.config import Settings, settings as s
 from src.database_postgres import get_session
-from src.database_redis import redis_db
 from src.auth import repository as repository_users
+from src.auth.revocation import revocation_list
+from src.auth.sessions import session_store, is_session_token
+from src.auth.user_cache import user_cache
+
+
+ACCESS_TOKEN_TTL = timedelta(minutes=15)
+
+
+def credentials_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
 
 
 class Auth:
     secret_key = s.secret_key
     algorithm = s.algorithm
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    auth_mode = s.auth_mode
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+    _pwd_context = None
+
+    def configure(self, settings: Settings):
+        self.secret_key = settings.secret_key
+        self.algorithm = settings.algorithm
+        self.auth_mode = settings.auth_mode
+        session_store.configure(settings.session_ttl, settings.session_local_cache_seconds)
+
+    @property
+    def pwd_context(self):
+        # passlib and bcrypt are only loaded when a password is hashed or checked
+        if self._pwd_context is None:
+            from passlib.context import CryptContext
+            Auth._pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        return self._pwd_context
 
     def verify_password(self, plain_password, hashed_password):
         return self.pwd_context.verify(plain_password, hashed_password)
@@ -27,17 +53,21 @@ class Auth:
 
     # define a function to generate a new access token
     async def create_access_token(self, data: dict, expires_delta: float | None = None):
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
         else:
-            expire = datetime.utcnow() + timedelta(minutes=15)
-        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token"})
+            expire = datetime.utcnow() + ACCESS_TOKEN_TTL
+        to_encode.update({"iat": datetime.utcnow(), "exp": expire, "scope": "access_token", "jti": uuid.uuid4().hex})
         encoded_access_token = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
         return encoded_access_token
 
     # define a function to generate a new refresh token
     async def create_refresh_token(self, data: dict, expires_delta: float | None = None):
+        from jose import jwt
+
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + timedelta(seconds=expires_delta)
@@ -47,48 +77,65 @@ class Auth:
         encoded_refresh_token = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
         return encoded_refresh_token
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_payload(self, refresh_token: str) -> dict:
+        from jose import JWTError, jwt
+
         try:
             payload = jwt.decode(refresh_token, self.secret_key, algorithms=[self.algorithm])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)):
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Could not validate credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
+    async def decode_refresh_token(self, refresh_token: str):
+        payload = await self.decode_refresh_payload(refresh_token)
+        return payload['sub']
+
+    async def decode_access_payload(self, token: str) -> dict:
+        from jose import JWTError, jwt
 
         try:
             # Decode JWT
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
+            if payload['scope'] != 'access_token' or payload["sub"] is None:
+                raise credentials_exception()
         except JWTError:
-            raise credentials_exception
+            raise credentials_exception()
+        # checked against the in-memory mirror of the revocation list, no network call
+        if revocation_list.is_revoked(payload.get("jti"), payload["sub"], payload.get("iat")):
+            raise credentials_exception()
+        return payload
+
+    async def create_session_token(self, user, family: str | None = None) -> str:
+        return await session_store.create(user, family=family)
+
+    async def get_session_record(self, token: str) -> dict:
+        # one Redis GET at most, and no signature to check
+        record = await session_store.get(token)
+        if record is None or "access_token" not in record["scopes"]:
+            raise credentials_exception()
+        return record
+
+    async def get_session_user(self, token: str):
+        return (await self.get_session_record(token))["user"]
 
-        redis = await redis_db.get_redis_db()
-        user = await redis.get(f"user:{email}")
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_session)):
+        # both kinds of tokens are accepted whatever the mode, so switching it does not log anybody out
+        if is_session_token(token):
+            return await self.get_session_user(token)
+        payload = await self.decode_access_payload(token)
+        email = payload["sub"]
+
+        # concurrent misses of the same user are loaded once, see src/auth/user_cache.py
+        user = await user_cache.get(email, lambda: repository_users.get_user_by_email(email, db))
         if user is None:
-            user = await repository_users.get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            await redis.set(f"user:{email}", pickle.dumps(user))
-            await redis.expire(f"user:{email}", 900)
-        else:
-            user = pickle.loads(user)
+            raise credentials_exception()
         return user
 
     async def create_email_token(self, data: dict):
+        from jose import jwt
+
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
         to_encode.update({"iat": datetime.utcnow(), "exp": expire})
@@ -96,6 +143,8 @@ class Auth:
         return token
 
     async def get_email_from_token(self, token: str):
+        from jose import JWTError, jwt
+
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
             email = payload["sub"]
@@ -0,0 +1,127 @@
+"""
+Opaque session tokens, the alternative to JWT access tokens when ``AUTH_MODE=session``.
+
+A session token is a random string that means nothing by itself. Redis maps it to a pickled record holding a
+snapshot of the user, the expiry and the scopes of the session, so authenticating a request is one ``GET``
+and no signature check. Every worker also keeps the records it read for a few seconds
+(``SESSION_LOCAL_CACHE_SECONDS``), which saves the ``GET`` for bursts of requests of the same client; a
+revoked session may be accepted by the other workers until their copy runs out.
+
+The tokens of a user are also indexed in a set, so all of them can be revoked at once, e.g. when the password
+changes and the snapshots are stale.
+"""
+import pickle
+import secrets
+import time
+from collections import OrderedDict
+
+from src.database_redis import RedisConnector, redis_db
+
+KEY_PREFIX = "session:"
+USER_KEY_PREFIX = "sessions:user:"
+SESSION_TTL = 900
+LOCAL_CACHE_SECONDS = 5.0
+LOCAL_CACHE_SIZE = 10000
+
+
+def session_key(token: str) -> str:
+    return f"{KEY_PREFIX}{token}"
+
+
+def user_sessions_key(user_id: int) -> str:
+    return f"{USER_KEY_PREFIX}{user_id}"
+
+
+def is_session_token(token: str) -> bool:
+    # JWTs are three dot-separated segments, session tokens are url-safe base64 without dots
+    return "." not in token
+
+
+class SessionStore:
+
+    def __init__(self, redis_connector: RedisConnector, ttl: int = SESSION_TTL,
+                 local_ttl: float = LOCAL_CACHE_SECONDS, local_size: int = LOCAL_CACHE_SIZE):
+        self.redis_connector = redis_connector
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local_size = local_size
+        # token -> (monotonic time the copy is kept until, record), oldest first
+        self.local: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    def configure(self, ttl: int, local_ttl: float):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.local.clear()
+
+    async def create(self, user, scopes: tuple[str, ...] = ("access_token",), family: str | None = None) -> str:
+        """
+        Open a session for a user.
+
+        :param user: The user, stored as a snapshot in the session record.
+        :type user: User
+        :param scopes: Scopes granted to the session.
+        :type scopes: tuple[str, ...]
+        :param family: Refresh token family of the login, revoked with the session at logout.
+        :type family: str, optional
+        :return: The session token.
+        :rtype: str
+        """
+        token = secrets.token_urlsafe(32)
+        record = {"user": user, "exp": time.time() + self.ttl, "scopes": list(scopes), "fam": family}
+        redis = await self.redis_connector.get_redis_db()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(session_key(token), pickle.dumps(record), ex=self.ttl)
+            pipe.sadd(user_sessions_key(user.id), token)
+            pipe.expire(user_sessions_key(user.id), self.ttl)
+            await pipe.execute()
+        return token
+
+    async def get(self, token: str) -> dict | None:
+        """
+        Look up the record of a session, from the copy of this worker if it is recent enough.
+
+        :param token: The session token.
+        :type token: str
+        :return: The record with ``user``, ``exp``, ``scopes`` and ``fam``, or None if the session does not exist or expired.
+        :rtype: dict | None
+        """
+        cached = self.local.get(token)
+        if cached is not None and cached[0] > time.monotonic():
+            record = cached[1]
+        else:
+            redis = await self.redis_connector.get_redis_db()
+            data = await redis.get(session_key(token))
+            if data is None:
+                self.local.pop(token, None)
+                return None
+            record = pickle.loads(data)
+            if self.local_ttl > 0:
+                self.local[token] = (time.monotonic() + self.local_ttl, record)
+                self.local.move_to_end(token)
+                if len(self.local) > self.local_size:
+                    self.local.popitem(last=False)
+        if record["exp"] <= time.time():
+            self.local.pop(token, None)
+            return None
+        return record
+
+    async def revoke(self, token: str):
+        self.local.pop(token, None)
+        redis = await self.redis_connector.get_redis_db()
+        await redis.delete(session_key(token))
+
+    async def revoke_user(self, user_id: int):
+        """
+        Close every session of a user.
+
+        :param user_id: The user.
+        :type user_id: int
+        """
+        redis = await self.redis_connector.get_redis_db()
+        tokens = [token.decode() for token in await redis.smembers(user_sessions_key(user_id))]
+        for token in tokens:
+            self.local.pop(token, None)
+        await redis.delete(user_sessions_key(user_id), *[session_key(token) for token in tokens])
+
+
+session_store = SessionStore(redis_db)
@@ -0,0 +1,112 @@
+"""
+Refresh tokens kept in Redis by token family.
+
+Every login starts a family: one Redis key holding the id (``jti``) of the only refresh token of the family that
+may still be used. Refreshing swaps that id for the id of the next token with a single ``SET ... XX GET``, so
+rotation is atomic without a transaction. A token that is not the current one of its family has been used
+before, which means it leaked: the whole family is revoked and the device has to log in again. Logging out
+revokes the family too: the access tokens carry its id. Families expire with their last token, and every
+device of a user has its own family. The families of a user are indexed in a set, so all of them can be revoked
+at once when the password changes.
+
+Refresh tokens issued before the families carry no ``fam`` claim and are checked once more against
+``users.refresh_token``; a valid one is exchanged for a new family and cleared from the table. Once the
+longest-lived of them has expired (``REFRESH_TOKEN_TTL``) the column is no longer read.
+"""
+import uuid
+from datetime import timedelta
+
+from src.database_redis import RedisConnector, redis_db
+
+REFRESH_TOKEN_TTL = timedelta(days=7)
+KEY_PREFIX = "refresh:family:"
+USER_KEY_PREFIX = "refresh:user:"
+
+
+def family_key(family: str) -> str:
+    return f"{KEY_PREFIX}{family}"
+
+
+def user_families_key(email: str) -> str:
+    return f"{USER_KEY_PREFIX}{email}"
+
+
+class RefreshTokenStore:
+
+    def __init__(self, redis_connector: RedisConnector, ttl: timedelta = REFRESH_TOKEN_TTL):
+        self.redis_connector = redis_connector
+        self.ttl = ttl
+
+    async def start_family(self, email: str) -> tuple[str, str]:
+        """
+        Start the family of a new login.
+
+        :param email: Email of the user logging in, the subject of the tokens.
+        :type email: str
+        :return: Ids of the family and of its first token.
+        :rtype: tuple[str, str]
+        """
+        family, token_id = uuid.uuid4().hex, uuid.uuid4().hex
+        redis = await self.redis_connector.get_redis_db()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(family_key(family), token_id, ex=self.ttl)
+            self.index_family(pipe, email, family)
+            await pipe.execute()
+        return family, token_id
+
+    async def rotate(self, family: str, token_id: str, email: str) -> str | None:
+        """
+        Replace the current token of a family with a new one.
+
+        :param family: Family of the presented token.
+        :type family: str
+        :param token_id: Id of the presented token.
+        :type token_id: str
+        :param email: Subject of the presented token.
+        :type email: str
+        :return: Id of the next token, or None if the family expired or the token was already used, in which
+            case the family is revoked.
+        :rtype: str | None
+        """
+        next_id = uuid.uuid4().hex
+        redis = await self.redis_connector.get_redis_db()
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.set(family_key(family), next_id, ex=self.ttl, xx=True, get=True)
+            # the index lives as long as the longest-lived family; indexing a family that was just revoked is
+            # harmless, revoking it again deletes nothing
+            self.index_family(pipe, email, family)
+            current_id, _, _ = await pipe.execute()
+        if current_id is None:
+            return None
+        if current_id.decode() != token_id:
+            await self.revoke(family)
+            return None
+        return next_id
+
+    async def revoke(self, family: str):
+        """
+        End a family, after the reuse of one of its tokens or at logout.
+
+        :param family: The family.
+        :type family: str
+        """
+        redis = await self.redis_connector.get_redis_db()
+        await redis.delete(family_key(family))
+
+    async def revoke_user(self, email: str):
+        """
+        End every family of a user, e.g. when the password changes.
+
+        :param email: Email of the user.
+        :type email: str
+        """
+        redis = await self.redis_connector.get_redis_db()
+        families = [family.decode() for family in await redis.smembers(user_families_key(email))]
+        await redis.delete(user_families_key(email), *[family_key(family) for family in families])
+
+    def index_family(self, pipe, email: str, family: str):
+        pipe.sadd(user_families_key(email), family)
+        pipe.expire(user_families_key(email), self.ttl)
+
+
+refresh_token_store = RefreshTokenStore(redis_db)
@@ -0,0 +1,160 @@
+"""
+The Redis cache of the users behind JWT access tokens, safe against stampedes.
+
+When the entry of a busy user expires, the requests that miss it do not all go to Postgres:
+
+- within a worker, the first request loads the user and the others await the same future;
+- across workers, the loading request holds a short Redis lock, and the other workers poll the cache until it
+  is filled, or load the user themselves if the lock runs out first;
+- most of the time the entry does not expire at all: a request close to the expiry refreshes it early, with a
+  probability growing as the expiry nears and with the time a load takes ("XFetch", Vattani et al., 2015),
+  while the other requests keep being served the cached user.
+"""
+import asyncio
+import math
+import pickle
+import random
+import secrets
+import time
+from typing import Awaitable, Callable
+
+from src.database_redis import RedisConnector, redis_db
+
+KEY_PREFIX = "user:"
+LOCK_PREFIX = "lock:user:"
+USER_TTL = 900
+LOCK_SECONDS = 2
+POLL_SECONDS = 0.05
+EARLY_REFRESH_BETA = 1.0
+# deletes the lock only if it still holds the token of its load, in one step: a GET then DEL could delete the lock
+# another worker took between the two after this one ran out
+UNLOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def user_key(email: str) -> str:
+    return f"{KEY_PREFIX}{email}"
+
+
+def lock_key(email: str) -> str:
+    return f"{LOCK_PREFIX}{email}"
+
+
+def read_record(data: bytes | None) -> dict | None:
+    if data is None:
+        return None
+    record = pickle.loads(data)
+    # entries cached before the records carried their expiry hold the bare user; they are loaded again
+    return record if isinstance(record, dict) else None
+
+
+class UserCache:
+
+    def __init__(self, redis_connector: RedisConnector, ttl: int = USER_TTL, lock_seconds: float = LOCK_SECONDS,
+                 beta: float = EARLY_REFRESH_BETA):
+        self.redis_connector = redis_connector
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.beta = beta
+        # email -> future of the load in progress in this worker
+        self.loading: dict[str, asyncio.Future] = {}
+
+    def should_refresh(self, record: dict) -> bool:
+        # XFetch: -log(random()) is exponentially distributed, so the earlier the refresh, the less likely it is
+        return time.time() - record["delta"] * self.beta * math.log(1.0 - random.random()) >= record["expires"]
+
+    async def get(self, email: str, load: Callable[[], Awaitable]):
+        """
+        Get a user from the cache, loading it once per key when it is missing or due for an early refresh.
+
+        :param email: Email of the user.
+        :type email: str
+        :param load: Loads the user from the database; returns None if it does not exist.
+        :type load: Callable[[], Awaitable[User | None]]
+        :return: The user, or None if it does not exist.
+        :rtype: User | None
+        """
+        redis = await self.redis_connector.get_redis_db()
+        record = read_record(await redis.get(user_key(email)))
+        stale = None
+        if record is not None:
+            if not self.should_refresh(record):
+                return record["user"]
+            stale = record["user"]
+        while (future := self.loading.get(email)) is not None:
+            if stale is not None:
+                return stale
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the request that was loading the user was cancelled: load it again, unless this one was too
+                if not future.cancelled():
+                    raise
+        future = asyncio.get_running_loop().create_future()
+        self.loading[email] = future
+        try:
+            user = await self.load(email, load, stale)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as err:
+            future.set_exception(err)
+            # retrieved here, so a failed load nobody waited for is not reported as never retrieved
+            future.exception()
+            raise
+        else:
+            future.set_result(user)
+            return user
+        finally:
+            del self.loading[email]
+
+    async def load(self, email: str, load: Callable[[], Awaitable], stale):
+        redis = await self.redis_connector.get_redis_db()
+        token = secrets.token_hex(8)
+        deadline = time.monotonic() + self.lock_seconds
+        while not await redis.set(lock_key(email), token, nx=True, ex=math.ceil(self.lock_seconds)):
+            # another worker is loading the user: an early refresh leaves it to that worker, a miss waits for it
+            if stale is not None:
+                return stale
+            await asyncio.sleep(POLL_SECONDS)
+            record = read_record(await redis.get(user_key(email)))
+            if record is not None:
+                return record["user"]
+            if time.monotonic() >= deadline:
+                break
+        try:
+            # a worker that held the lock before this one may have filled the cache in the meantime
+            if stale is None and (record := read_record(await redis.get(user_key(email)))) is not None:
+                return record["user"]
+            start = time.monotonic()
+            user = await load()
+            if user is not None:
+                await self.set(user, time.monotonic() - start)
+            return user
+        finally:
+            # only the lock of this load is released, not one another worker took after this one ran out
+            await redis.eval(UNLOCK_SCRIPT, 1, lock_key(email), token)
+
+    async def set(self, user, delta: float = 0.0):
+        """
+        Cache a user.
+
+        :param user: The user.
+        :type user: User
+        :param delta: Seconds it took to load the user, which scale its early refresh.
+        :type delta: float
+        """
+        record = {"user": user, "delta": delta, "expires": time.time() + self.ttl}
+        redis = await self.redis_connector.get_redis_db()
+        await redis.set(user_key(user.email), pickle.dumps(record), ex=self.ttl)
+
+    async def delete(self, email: str):
+        redis = await self.redis_connector.get_redis_db()
+        await redis.delete(user_key(email))
+
+
+user_cache = UserCache(redis_db)
@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import Field
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
@@ -11,12 +13,25 @@ class Settings(BaseSettings):
     postgres_password: str = Field()
     postgres_port: str = Field()
     postgres_host: str = Field()
+    postgres_pool_size: int = Field(default=5)
+    postgres_max_overflow: int = Field(default=10)
+    postgres_replica_urls: list[str] = Field(default=[])
+    read_your_writes_window: float = Field(default=5)
+    # hash partitions of contacts, phones and emails by owner, 0 for plain tables; see src/partitioning.py
+    contacts_partitions: int = Field(default=0)
+
+    default_country_code: str = Field(default="")
+    sync_tombstone_days: int = Field(default=30)
 
     redis_host: str = Field()
     redis_port: str = Field()
 
     secret_key: str = Field()
     algorithm: str = Field()
+    # "jwt" issues signed access tokens, "session" opaque tokens looked up in Redis
+    auth_mode: Literal["jwt", "session"] = Field(default="jwt")
+    session_ttl: int = Field(default=900)
+    session_local_cache_seconds: float = Field(default=5)
 
     mail_username: str = Field()
     mail_password: str = Field()
@@ -29,6 +44,19 @@ class Settings(BaseSettings):
     cloudinary_api_key: str = Field()
     cloudinary_api_secret: str = Field()
 
+    server_host: str = Field(default="0.0.0.0")
+    server_port: int = Field(default=8000)
+    server_workers: int = Field(default=1)
+    server_keepalive: int = Field(default=5)
+    server_backlog: int = Field(default=2048)
+    server_graceful_timeout: int = Field(default=30)
+
+    compression_minimum_size: int = Field(default=1000)
+    compression_gzip_level: int = Field(default=6)
+    compression_brotli_quality: int = Field(default=4)
+    # bearer token of /metrics/encoding, which is not served without one
+    metrics_token: str = Field(default="")
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,349 @@
+"""
+Typeahead of contact names from a per-user prefix index in Redis.
+
+Every user has a sorted set ``autocomplete:<owner id>`` whose members all score 0, so Redis keeps them in
+lexicographic order and ``ZRANGE BYLEX`` returns the ones starting with a prefix in O(log n + k), one round trip
+per keystroke. A contact has a member for its normalized full name and for each later word of it, so "smi" finds
+"John Smith"::
+
+    <normalized words>\\x00<display name>\\x00<contact id>
+
+The display names are also kept in the hash ``autocomplete:<owner id>:names``: a changed or deleted contact
+removes its old members with them. The empty member marks an index as built; an index is built from the primary
+by the first search of its user, kept up to date by the writes to contacts in the application workers, and can
+be rebuilt with this module. Every write bumps ``autocomplete:<owner id>:version``, which a rebuild checks before
+renaming its keys over the index, and the indexes expire after ``INDEX_TTL``, so a write the index missed is seen
+after the next rebuild at the latest.
+
+Usage::
+
+    python -m src.contacts.autocomplete [--user-id ID ...] [--pause 0.1]
+"""
+import argparse
+import asyncio
+import logging
+import secrets
+from typing import Awaitable, Callable, Iterable
+
+from redis.exceptions import RedisError, WatchError
+
+from src.contacts.names import normalize_name
+from src.database_redis import RedisConnector, redis_db
+
+KEY_PREFIX = "autocomplete:"
+BUILT = ""
+# words of a name that start a member: first name, last name and a middle name or two
+MAX_TERMS = 4
+SEARCH_LIMIT = 10
+REBUILD_BATCH = 1000
+# an index is rebuilt from Postgres at least this often, which bounds how long a write it missed stays invisible
+INDEX_TTL = 24 * 3600
+# a rebuild that loses the race with writes to the user this many times leaves the index to the next search
+REBUILD_ATTEMPTS = 3
+# the keys of a rebuild in progress expire if the worker building them dies
+BUILD_TTL = 300
+
+logger = logging.getLogger(__name__)
+
+
+def index_key(owner_id: int) -> str:
+    return f"{KEY_PREFIX}{owner_id}"
+
+
+def names_key(owner_id: int) -> str:
+    return f"{KEY_PREFIX}{owner_id}:names"
+
+
+def version_key(owner_id: int) -> str:
+    return f"{KEY_PREFIX}{owner_id}:version"
+
+
+def build_keys(owner_id: int, token: str) -> tuple[str, str]:
+    return f"{KEY_PREFIX}{owner_id}:build:{token}", f"{KEY_PREFIX}{owner_id}:build:{token}:names"
+
+
+def display_name(first_name: str | None, last_name: str | None) -> str:
+    return ' '.join(filter(None, (first_name, last_name)))
+
+
+def members(contact_id: int, name: str) -> list[str]:
+    words = normalize_name(name).split()
+    return [f"{' '.join(words[i:])}\x00{name}\x00{contact_id}" for i in range(min(len(words), MAX_TERMS))]
+
+
+class AutocompleteIndex:
+
+    def __init__(self, redis_connector: RedisConnector):
+        self.redis_connector = redis_connector
+        # only the application workers maintain the indexes; scripts and tests write contacts without them
+        self.enabled = False
+        # users whose index missed a write because Redis could not be reached
+        self.unsynced: set[int] = set()
+
+    def start(self):
+        self.enabled = True
+
+    def close(self):
+        self.enabled = False
+
+    async def search(self, owner_id: int, prefix: str, limit: int = SEARCH_LIMIT) -> list[dict] | None:
+        """
+        Names of the contacts of a user with a word starting with ``prefix``, in alphabetical order.
+
+        :param owner_id: Owner of the contacts.
+        :type owner_id: int
+        :param prefix: Beginning of a name, normalized like the names.
+        :type prefix: str
+        :param limit: Maximum number of contacts.
+        :type limit: int
+        :return: ``id`` and ``name`` of the contacts, or None if the index of the user is not built.
+        :rtype: list[dict] | None
+        """
+        prefix = normalize_name(prefix).encode()
+        if not prefix:
+            return []
+        redis = await self.redis_connector.get_redis_db()
+        await self.forget_unsynced(redis)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.exists(index_key(owner_id))
+            # a contact may match with several of its words, so more members than contacts are read
+            pipe.zrangebylex(index_key(owner_id), b"[" + prefix, b"[" + prefix + b"\xff", 0, limit * MAX_TERMS)
+            built, found = await pipe.execute()
+        if not built:
+            return None
+        contacts = {}
+        for member in found:
+            if not member:
+                continue
+            _, name, contact_id = member.decode().split("\x00")
+            contacts.setdefault(int(contact_id), name)
+            if len(contacts) == limit:
+                break
+        return [{"id": contact_id, "name": name} for contact_id, name in contacts.items()]
+
+    async def rebuild(self, owner_id: int, load: Callable[[], Awaitable[Iterable[tuple[int, str | None, str | None]]]]) \
+            -> bool:
+        """
+        Replace the index of a user with one built from the database.
+
+        The new index is written to temporary keys and renamed over the old one in a transaction that only runs if
+        no write to the contacts of the user has bumped the version of the index since it was loaded; otherwise
+        the rebuild starts again, so an index missing a write is never installed.
+
+        :param owner_id: Owner of the contacts.
+        :type owner_id: int
+        :param load: Reads ``(id, first_name, last_name)`` of every live contact of the user, from the primary.
+        :type load: Callable[[], Awaitable[Iterable[tuple[int, str | None, str | None]]]]
+        :return: Whether the index was installed; False if writes kept racing the rebuild.
+        :rtype: bool
+        """
+        redis = await self.redis_connector.get_redis_db()
+        await self.forget_unsynced(redis)
+        for _ in range(REBUILD_ATTEMPTS):
+            version = await redis.get(version_key(owner_id))
+            contacts = await load()
+            build_index, build_names = build_keys(owner_id, secrets.token_hex(8))
+            try:
+                has_names = await self.write_build(redis, build_index, build_names, contacts)
+                if await self.install(redis, owner_id, version, build_index, build_names, has_names):
+                    return True
+            finally:
+                # gone once renamed; left behind by a lost race or an error
+                await redis.delete(build_index, build_names)
+        return False
+
+    async def write_build(self, redis, build_index: str, build_names: str,
+                          contacts: Iterable[tuple[int, str | None, str | None]]) -> bool:
+        # one round trip per batch; the keys expire on their own if the worker dies before installing them
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.zadd(build_index, {BUILT: 0})
+            pipe.expire(build_index, BUILD_TTL)
+            names, has_names = {}, False
+            for contact_id, first_name, last_name in contacts:
+                names[contact_id] = display_name(first_name, last_name)
+                if len(names) == REBUILD_BATCH:
+                    self.add_members(pipe, build_index, build_names, names)
+                    pipe.expire(build_names, BUILD_TTL)
+                    await pipe.execute()
+                    names, has_names = {}, True
+            if names:
+                self.add_members(pipe, build_index, build_names, names)
+                pipe.expire(build_names, BUILD_TTL)
+                has_names = True
+            await pipe.execute()
+        return has_names
+
+    @staticmethod
+    async def install(redis, owner_id: int, version: bytes | None, build_index: str, build_names: str,
+                      has_names: bool) -> bool:
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(version_key(owner_id))
+                if await pipe.get(version_key(owner_id)) != version:
+                    return False
+                pipe.multi()
+                pipe.rename(build_index, index_key(owner_id))
+                if has_names:
+                    pipe.rename(build_names, names_key(owner_id))
+                else:
+                    pipe.delete(names_key(owner_id))
+                pipe.expire(index_key(owner_id), INDEX_TTL)
+                pipe.expire(names_key(owner_id), INDEX_TTL)
+                await pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    @staticmethod
+    def add_members(pipe, index: str, names_hash: str, names: dict[int, str]):
+        members_ = {member: 0 for contact_id, name in names.items() for member in members(contact_id, name)}
+        if members_:
+            pipe.zadd(index, members_)
+        if names:
+            pipe.hset(names_hash, mapping=names)
+
+    async def update(self, owner_id: int, contacts: list[tuple[int, str | None, str | None]]):
+        """
+        Index new and renamed contacts of a user, replacing their previous names.
+
+        Like change events, the index is a convenience: a failed update is logged and the write goes on, and the
+        index it missed is dropped once Redis answers again. The index of a user that is not built is left for
+        the first search to build.
+
+        :param owner_id: Owner of the contacts.
+        :type owner_id: int
+        :param contacts: ``(id, first_name, last_name)`` of the contacts.
+        :type contacts: list[tuple[int, str | None, str | None]]
+        """
+        if not self.enabled or not contacts:
+            return
+        names = {contact_id: display_name(first_name, last_name) for contact_id, first_name, last_name in contacts}
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            await self.forget_unsynced(redis)
+            stale = await self.stale_members(redis, owner_id, list(names))
+            if stale is None:
+                return
+            async with redis.pipeline(transaction=True) as pipe:
+                if stale:
+                    pipe.zrem(index_key(owner_id), *stale)
+                self.add_members(pipe, index_key(owner_id), names_key(owner_id), names)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("cannot update the autocomplete index of user %s", owner_id, exc_info=True)
+            self.unsynced.add(owner_id)
+
+    async def remove(self, owner_id: int, contact_ids: list[int]):
+        """
+        Remove deleted contacts of a user from the index.
+
+        :param owner_id: Owner of the contacts.
+        :type owner_id: int
+        :param contact_ids: Deleted contacts.
+        :type contact_ids: list[int]
+        """
+        if not self.enabled or not contact_ids:
+            return
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            await self.forget_unsynced(redis)
+            stale = await self.stale_members(redis, owner_id, contact_ids)
+            if not stale:
+                return
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.zrem(index_key(owner_id), *stale)
+                pipe.hdel(names_key(owner_id), *contact_ids)
+                await pipe.execute()
+        except RedisError:
+            logger.warning("cannot update the autocomplete index of user %s", owner_id, exc_info=True)
+            self.unsynced.add(owner_id)
+
+    @staticmethod
+    async def stale_members(redis, owner_id: int, contact_ids: list[int]) -> list[str] | None:
+        # the members of the names the contacts are indexed under, or None if the index is not built; the version
+        # is bumped in the same transaction, so a rebuild either is installed before and seen here, or fails
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.incr(version_key(owner_id))
+            pipe.expire(version_key(owner_id), INDEX_TTL)
+            pipe.exists(index_key(owner_id))
+            pipe.hmget(names_key(owner_id), contact_ids)
+            _, _, built, names = await pipe.execute()
+        if not built:
+            return None
+        return [member for contact_id, name in zip(contact_ids, names) if name is not None
+                for member in members(contact_id, name.decode())]
+
+    async def forget_unsynced(self, redis):
+        # the indexes that missed a write while Redis could not be reached are dropped, and their versions bumped
+        # against the rebuilds in progress, so the next search of their users builds them again
+        if not self.unsynced:
+            return
+        owner_ids, self.unsynced = self.unsynced, set()
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                for owner_id in owner_ids:
+                    pipe.delete(index_key(owner_id), names_key(owner_id))
+                    pipe.incr(version_key(owner_id))
+                    pipe.expire(version_key(owner_id), INDEX_TTL)
+                await pipe.execute()
+        except RedisError:
+            self.unsynced |= owner_ids
+            raise
+
+
+async def rebuild_users(session_maker, index: AutocompleteIndex, user_ids: list[int] | None = None,
+                        pause: float = 0.1) -> int:
+    """
+    Rebuild the indexes of some users, or of every user, from the database.
+
+    :param session_maker: Session maker of the primary database.
+    :type session_maker: async_sessionmaker
+    :param index: The index to rebuild.
+    :type index: AutocompleteIndex
+    :param user_ids: Users to rebuild the index of, every user if None.
+    :type user_ids: list[int] | None
+    :param pause: Seconds to wait between two users.
+    :type pause: float
+    :return: Number of indexes rebuilt.
+    :rtype: int
+    """
+    # the repository maintains the indexes, so it is imported here rather than the other way around
+    from sqlalchemy import select
+    from src.models import User
+    from src.contacts import repository as repository_contacts
+
+    if user_ids is None:
+        async with session_maker() as session:
+            user_ids = (await session.execute(select(User.id).order_by(User.id))).scalars().all()
+    rebuilt = 0
+    for user_id in user_ids:
+        async def load():
+            async with session_maker() as session:
+                return await repository_contacts.get_contact_names(User(id=user_id), session)
+
+        rebuilt += await index.rebuild(user_id, load)
+        await asyncio.sleep(pause)
+    return rebuilt
+
+
+autocomplete_index = AutocompleteIndex(redis_db)
+
+
+async def main(user_ids: list[int] | None, pause: float):
+    from src.database_postgres import postgres_db
+
+    try:
+        count = await rebuild_users(postgres_db.get_session_maker(), autocomplete_index, user_ids, pause)
+        print(f"rebuilt the autocomplete index of {count} users")
+    finally:
+        await postgres_db.dispose()
+        await redis_db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the autocomplete indexes of contact names from Postgres.")
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                        help="user to rebuild the index of, may be repeated; every user by default")
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds between two users")
+    args = parser.parse_args()
+    asyncio.run(main(args.user_ids, args.pause))
@@ -0,0 +1,40 @@
+"""
+Normalized and phonetic keys of contact names, stored next to the names for the searches and sorts.
+
+Only the standard library and ``src.contacts.phonetic`` are imported, so the models can compute the keys
+without loading the application. The migrations that write keys carry their own copy of this module.
+"""
+import re
+import unicodedata
+
+from src.contacts.phonetic import phonetic_key
+
+NAME_FIELDS = ("first_name", "last_name")
+
+_non_alnum = re.compile(r'[^0-9a-z ]')
+
+
+def normalize_name(name: str | None) -> str:
+    if not name:
+        return ''
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return ' '.join(_non_alnum.sub(' ', name).split())
+
+
+def name_keys(values: dict) -> dict:
+    """
+    The normalized and phonetic columns of the names among ``values``, which the fuzzy search looks up.
+
+    :param values: Column values of a contact; the names left out are skipped.
+    :type values: dict
+    :return: ``<name>_normalized`` and ``<name>_phonetic`` of every name in ``values``.
+    :rtype: dict
+    """
+    keys = {}
+    for field in NAME_FIELDS:
+        if field in values:
+            normalized = normalize_name(values[field])
+            keys[f"{field}_normalized"] = normalized
+            keys[f"{field}_phonetic"] = phonetic_key(normalized)
+    return keys
@@ -0,0 +1,127 @@
+"""
+Phonetic keys and edit distances of contact names, for the fuzzy search.
+
+The keys are the Metaphone codes of Lawrence Philips (1990): the consonant sounds of a word, so that "Jon" and
+"John" are both ``JN`` and "Smith" and "Smyth" are both ``SM0``. Words are expected normalized by
+``src.contacts.names.normalize_name``: lowercase ASCII letters and digits, accents folded.
+"""
+VOWELS = frozenset("aeiou")
+FRONT_VOWELS = frozenset("eiy")
+# "h" is part of the sound of "ch", "sh", "ph", "th" and "gh"
+H_DIGRAPHS = frozenset("csptg")
+# silent first letters: "Knight", "Gnome", "Pneuma", "Wright", "Aeron"
+SILENT_STARTS = ("ae", "gn", "kn", "pn", "wr")
+SAME_SOUND = {"f": "F", "j": "J", "l": "L", "m": "M", "n": "N", "r": "R", "q": "K", "v": "F", "z": "S"}
+
+
+def metaphone(word: str) -> str:
+    """
+    The Metaphone code of a word.
+
+    :param word: A normalized word.
+    :type word: str
+    :return: The code, in uppercase letters with ``0`` for "th" and ``X`` for "sh"; empty for a word without
+        letters.
+    :rtype: str
+    """
+    word = ''.join(char for char in word if 'a' <= char <= 'z')
+    if word.startswith(SILENT_STARTS):
+        word = word[1:]
+    elif word.startswith("x"):
+        word = "s" + word[1:]
+    elif word.startswith("wh"):
+        word = "w" + word[2:]
+
+    code = []
+    for i, char in enumerate(word):
+        prev = word[i - 1] if i else ''
+        next_ = word[i + 1] if i + 1 < len(word) else ''
+        after = word[i + 2] if i + 2 < len(word) else ''
+        if char == prev and char != 'c':
+            continue
+        if char in VOWELS:
+            if i == 0:
+                code.append(char.upper())
+        elif char in SAME_SOUND:
+            code.append(SAME_SOUND[char])
+        elif char == 'b':
+            # "Plumb"
+            if not (prev == 'm' and not next_):
+                code.append('B')
+        elif char == 'c':
+            if next_ == 'i' and after == 'a' or next_ == 'h' and prev != 's':
+                code.append('X')
+            elif next_ in FRONT_VOWELS:
+                # "Science"
+                if prev != 's':
+                    code.append('S')
+            else:
+                code.append('K')
+        elif char == 'd':
+            code.append('J' if next_ == 'g' and after in FRONT_VOWELS else 'T')
+        elif char == 'g':
+            if next_ == 'h' and after and after not in VOWELS:
+                # "Knight"
+                continue
+            if next_ == 'n' and (i + 2 == len(word) or word[i + 2:] == "ed"):
+                # "Sign", "Signed"
+                continue
+            if prev == 'd' and next_ in FRONT_VOWELS:
+                # the "dg" of "Hodge" is one J
+                continue
+            code.append('J' if next_ in FRONT_VOWELS and prev != 'g' else 'K')
+        elif char == 'h':
+            # sounded only before a vowel, at the start or after another one (the rule of Double Metaphone), so
+            # "Jhon" is "John"
+            if prev not in H_DIGRAPHS and next_ in VOWELS and (i == 0 or prev in VOWELS):
+                code.append('H')
+        elif char == 'k':
+            if prev != 'c':
+                code.append('K')
+        elif char == 'p':
+            code.append('F' if next_ == 'h' else 'P')
+        elif char == 's':
+            if next_ == 'h' or next_ == 'i' and after in ('a', 'o'):
+                code.append('X')
+            else:
+                code.append('S')
+        elif char == 't':
+            if next_ == 'i' and after in ('a', 'o'):
+                code.append('X')
+            elif next_ == 'h':
+                code.append('0')
+            elif not (next_ == 'c' and after == 'h'):
+                code.append('T')
+        elif char == 'w' or char == 'y':
+            if next_ in VOWELS:
+                code.append(char.upper())
+        elif char == 'x':
+            code.append('KS')
+    return ''.join(code)
+
+
+def phonetic_key(normalized: str) -> str:
+    """
+    The Metaphone codes of the words of a normalized name, space separated.
+
+    :param normalized: A name normalized by ``normalize_name``.
+    :type normalized: str
+    :return: The key, empty when the name has no letters.
+    :rtype: str
+    """
+    return ' '.join(filter(None, (metaphone(word) for word in normalized.split())))
+
+
+def edit_distance(first: str, second: str) -> int:
+    """
+    The Levenshtein distance of two strings: the number of inserted, deleted and replaced characters.
+    """
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for i, first_char in enumerate(first, 1):
+        current = [i]
+        for j, second_char in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (first_char != second_char)))
+        previous = current
+    return previous[-1]
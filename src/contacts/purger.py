@@ -0,0 +1,89 @@
+"""
+Hard deletion of soft-deleted contacts and of expired tombstones.
+
+User-facing deletes only set ``contacts.deleted_at``, so they cost one row however large the contact or the
+book. The purger deletes those contacts with their phones and emails later, walking them in
+``(deleted_at, id)`` order in small batches of one short transaction each, and pauses between batches so a
+large deletion never holds locks for long or crowds out the requests. Tombstones older than
+``SYNC_TOMBSTONE_DAYS``, which no accepted sync token can ask for, are purged the same way.
+
+A contact soft-deleted in a transaction that commits after the walk went past it is purged by the next run.
+
+Usage::
+
+    python -m src.contacts.purger [--older-than 0] [--batch-size 500] [--pause 0.1] [--interval 0]
+"""
+import argparse
+import asyncio
+import time
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.contacts import repository as repository_contacts
+
+
+async def purge(session_maker: async_sessionmaker,
+                older_than: timedelta,
+                tombstone_age: timedelta,
+                batch_size: int = 500,
+                pause: float = 0.1) -> dict:
+    """
+    Purge every contact soft-deleted more than ``older_than`` ago and every tombstone older than ``tombstone_age``.
+
+    :param session_maker: Session maker of the primary database.
+    :type session_maker: async_sessionmaker
+    :param older_than: Age of the soft delete after which a contact is purged.
+    :type older_than: timedelta
+    :param tombstone_age: Age after which a tombstone is purged.
+    :type tombstone_age: timedelta
+    :param batch_size: Number of contacts or tombstones per transaction.
+    :type batch_size: int
+    :param pause: Seconds to wait between two batches.
+    :type pause: float
+    :return: Counters of the run: ``contacts``, ``tombstones``, ``batches`` and ``seconds``.
+    :rtype: dict
+    """
+    stats = {"contacts": 0, "tombstones": 0, "batches": 0}
+    start = time.perf_counter()
+    for name, purge_batch, age in (("contacts", repository_contacts.purge_deleted_contacts, older_than),
+                                   ("tombstones", repository_contacts.purge_tombstones, tombstone_age)):
+        after = None
+        while True:
+            async with session_maker() as session:
+                keys = await purge_batch(age, after, batch_size, session)
+            stats[name] += len(keys)
+            stats["batches"] += bool(keys)
+            if len(keys) < batch_size:
+                break
+            after = keys[-1]
+            await asyncio.sleep(pause)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+async def main(older_than: float, batch_size: int, pause: float, interval: float):
+    from src.config import settings
+    from src.database_postgres import postgres_db
+
+    try:
+        while True:
+            stats = await purge(postgres_db.get_session_maker(), timedelta(seconds=older_than),
+                                timedelta(days=settings.sync_tombstone_days), batch_size, pause)
+            print(f"{stats['contacts']} contacts and {stats['tombstones']} tombstones purged in "
+                  f"{stats['batches']} batches, {stats['seconds']:.2f} s")
+            if not interval:
+                break
+            await asyncio.sleep(interval)
+    finally:
+        await postgres_db.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Purge soft-deleted contacts and expired tombstones.")
+    parser.add_argument("--older-than", type=float, default=0, help="seconds since the soft delete")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1, help="seconds between two batches")
+    parser.add_argument("--interval", type=float, default=0, help="seconds between two runs, 0 to run once")
+    args = parser.parse_args()
+    asyncio.run(main(args.older_than, args.batch_size, args.pause, args.interval))
@@ -1,20 +1,184 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_, and_, func
-from src.models import Contact, Phone, Email, User
-from src.contacts.schemas import ContactIn
+from sqlalchemy import select, or_, and_, func, update, delete, insert, tuple_, literal, false, case
+from sqlalchemy.dialects import postgresql, sqlite
+from src.models import Contact, ContactTombstone, ContactTag, Phone, Email, Tag, User, naive_now
+from src.contacts.schemas import ContactIn, ContactsFilterIn, ContactsQueryIn, ContactPatchIn
+from src.emails.schemas import EmailIn
+from src.phones.schemas import PhoneIn
+from src.phones.service import normalize_number
+from src.contacts.service import find_duplicate_groups, normalize_phone, normalize_email, rank_fuzzy_matches, \
+    birthday_key, birthday_key_ranges, encode_sync_token, next_sync_cursor, parse_sort, SYNC_EPOCH, CHILD_FIELDS
+from src.contacts.names import normalize_name, name_keys
+from src.contacts.phonetic import phonetic_key
+from src.database_postgres import read_session, pin_to_primary
+from src.events import change_broker
+from src.contacts.autocomplete import autocomplete_index, display_name
 
+logger = logging.getLogger(__name__)
 
-async def get_contacts(current_user: User, session: AsyncSession) -> list[Contact]:
-    async with session.begin():
-        contacts = await session.execute(select(Contact).where(Contact.owner_id == current_user.id))
+BULK_CHUNK_SIZE = 500
+# candidates a fuzzy search ranks at most, and contacts it returns
+FUZZY_CANDIDATES = 1000
+FUZZY_LIMIT = 50
+AUTOCOMPLETE_LIMIT = 10
+# the columns of the sort keys of ContactsQueryIn, in the order of their indexes; the names are the normalized
+# ones, which are never null, and a birthday sort only lists contacts with a birthday
+SORT_COLUMNS = {
+    "id": (Contact.id,),
+    "first_name": (Contact.first_name_normalized, Contact.last_name_normalized, Contact.id),
+    "last_name": (Contact.last_name_normalized, Contact.first_name_normalized, Contact.id),
+    "birthday": (Contact.birthday_key, Contact.id),
+    "created": (Contact.created_at, Contact.id),
+}
+
+
+def live_contacts(*conditions):
+    # the one filter of every read of contacts: soft-deleted contacts stay in the table until they are purged
+    return and_(Contact.deleted_at.is_(None), *conditions)
+
+
+def tags_filter(owner_id: int, tags_any: list[str] | None = None, tags_all: list[str] | None = None) -> list:
+    # semi-joins answered from the (owner_id, tag_id, contact_id) index: the contacts with any of the tags, and the
+    # ones with as many of the tags as there are, which are all of them since a contact has a tag once
+    conditions = []
+    for names, every in ((tags_any, False), (tags_all, True)):
+        if not names:
+            continue
+        names = set(names)
+        tagged = select(ContactTag.contact_id).join(Tag, Tag.id == ContactTag.tag_id).where(
+            and_(ContactTag.owner_id == owner_id, Tag.owner_id == owner_id, Tag.name.in_(names))
+        )
+        if every:
+            tagged = tagged.group_by(ContactTag.contact_id).having(func.count() == len(names))
+        conditions.append(Contact.id.in_(tagged))
+    return conditions
+
+
+async def select_contact_fields(where, fields: tuple[str, ...], session: AsyncSession,
+                                order_by: tuple = (Contact.id,)) -> list[dict]:
+    # only the requested columns, and the children only when they are requested: one query per collection
+    # joined on the same filter instead of a contact x phones x emails join
+    columns = [getattr(Contact, name) for name in fields if name not in CHILD_FIELDS]
+    rows = await session.execute(select(*columns).where(where).order_by(*order_by))
+    contacts = [row._asdict() for row in rows]
+    for name, model, value in (("emails", Email, Email.address), ("phones", Phone, Phone.number)):
+        if name not in fields:
+            continue
+        children = await session.execute(
+            select(model.contact_id, model.id, value).join(model.contact).where(where).order_by(model.id)
+        )
+        by_contact = defaultdict(list)
+        for contact_id, child_id, child_value in children.tuples():
+            by_contact[contact_id].append({"id": child_id, value.key: child_value})
+        for contact in contacts:
+            contact[name] = by_contact[contact["id"]]
+    return contacts
+
+
+async def get_contacts(current_user: User,
+                       session: AsyncSession,
+                       fields: tuple[str, ...] | None = None,
+                       tags_any: list[str] | None = None,
+                       tags_all: list[str] | None = None) -> list[Contact] | list[dict]:
+    async with read_session(current_user.id, session) as session, session.begin():
+        where = live_contacts(Contact.owner_id == current_user.id, *tags_filter(current_user.id, tags_any, tags_all))
+        if fields is not None:
+            return await select_contact_fields(where, fields, session)
+        contacts = await session.execute(select(Contact).where(where))
         return [contact for contact in contacts.unique().scalars()]
 
 
+def query_filter(query: ContactsQueryIn, owner_id: int) -> list:
+    conditions = []
+    if query.name is not None:
+        # every word starts the first or the last name, like the autocomplete without Redis
+        tokens = normalize_name(query.name).split()
+        conditions += [or_(Contact.first_name_normalized.startswith(token),
+                           Contact.last_name_normalized.startswith(token)) for token in tokens] or [false()]
+    for flag, children in ((query.has_phone, Contact.phones), (query.has_email, Contact.emails)):
+        if flag is not None:
+            conditions.append(children.any() if flag else ~children.any())
+    if query.has_birthday is not None or parse_sort(query.sort)[0] == "birthday":
+        conditions.append(Contact.birthday_key.is_(None) if query.has_birthday is False
+                          else Contact.birthday_key.is_not(None))
+    for column, start, end in ((Contact.birthday, query.born_from, query.born_to),
+                               (Contact.created_at, query.created_from, query.created_to)):
+        if start is not None:
+            conditions.append(column >= start)
+        if end is not None:
+            conditions.append(column <= end)
+    return conditions + tags_filter(owner_id, query.tags_any, query.tags_all)
+
+
+async def list_contacts(query: ContactsQueryIn,
+                        current_user: User,
+                        session: AsyncSession,
+                        fields: tuple[str, ...] | None = None,
+                        limit: int | None = None,
+                        after: tuple | None = None) -> tuple[list[Contact] | list[dict], tuple | None]:
+    """
+    Contacts of the user matching the filters of a query, in the order of its sort key, one page at a time.
+
+    Every sort key is the tail of an index of contacts, so a page is read from one range of it: pages after the
+    first start from the keyset values of the previous one instead of an offset.
+
+    :param query: Filters and sort key.
+    :type query: ContactsQueryIn
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param fields: Fields of the contacts to return, every field if None.
+    :type fields: tuple[str, ...] | None
+    :param limit: Maximum number of contacts, every matching contact if None.
+    :type limit: int | None
+    :param after: Keyset values of the last contact of the previous page, or None for the first page.
+    :type after: tuple | None
+    :return: The contacts and the keyset values of the last one if more contacts follow, None otherwise.
+    :rtype: tuple[list[Contact] | list[dict], tuple | None]
+    """
+    key, descending = parse_sort(query.sort)
+    columns = SORT_COLUMNS[key]
+    conditions = [Contact.owner_id == current_user.id, *query_filter(query, current_user.id)]
+    if after is not None:
+        conditions.append(tuple_(*columns) < tuple_(*after) if descending else tuple_(*columns) > tuple_(*after))
+    order_by = tuple(column.desc() if descending else column for column in columns)
+    async with read_session(current_user.id, session) as session, session.begin():
+        if limit is None:
+            if fields is not None:
+                return await select_contact_fields(live_contacts(*conditions), fields, session, order_by), None
+            contacts = await session.execute(select(Contact).where(live_contacts(*conditions)).order_by(*order_by))
+            return [contact for contact in contacts.unique().scalars()], None
+
+        # the page is found on the index alone, then its contacts are read by id
+        page = await session.execute(
+            select(*columns).where(live_contacts(*conditions)).order_by(*order_by).limit(limit + 1)
+        )
+        page = page.tuples().all()
+        next_after = tuple(page[limit - 1]) if len(page) > limit else None
+        contact_ids = [row[-1] for row in page[:limit]]
+        if not contact_ids:
+            return [], None
+        where = live_contacts(Contact.owner_id == current_user.id, Contact.id.in_(contact_ids))
+        if fields is not None:
+            contacts = await select_contact_fields(where, fields, session)
+        else:
+            contacts = (await session.execute(select(Contact).where(where))).unique().scalars().all()
+    rank = {contact_id: position for position, contact_id in enumerate(contact_ids)}
+    return sorted(contacts, key=lambda contact: rank[contact["id"] if fields is not None else contact.id]), next_after
+
+
 async def get_contact(contact_id: int, current_user: User, session: AsyncSession) -> Contact | None:
-    async with session.begin():
+    async with read_session(current_user.id, session) as session, session.begin():
         contact = await session.execute(
             select(Contact).where(
-                and_(
+                live_contacts(
                     Contact.owner_id == current_user.id,
                     Contact.id == contact_id
                 )
@@ -23,30 +187,266 @@ async def get_contact(contact_id: int, current_user: User, session: AsyncSession
         return contact.scalars().unique().one_or_none()
 
 
-async def search_in_contacts(prompt: str, current_user: User, session: AsyncSession) -> list[Contact]:
+def search_filter(prompt: str):
+    prompt_lower = prompt.lower()
+    return or_(
+        func.lower(Contact.first_name).contains(prompt_lower),
+        func.lower(Contact.last_name).contains(prompt_lower),
+        Contact.emails.any(func.lower(Email.address).contains(prompt_lower)),
+        Contact.phones.any(func.lower(Phone.number).contains(prompt_lower))
+    )
+
+
+async def search_in_contacts(prompt: str,
+                             current_user: User,
+                             session: AsyncSession,
+                             fields: tuple[str, ...] | None = None,
+                             tags_any: list[str] | None = None,
+                             tags_all: list[str] | None = None) -> list[Contact] | list[dict]:
+    async with read_session(current_user.id, session) as session, session.begin():
+        where = live_contacts(Contact.owner_id == current_user.id, search_filter(prompt),
+                              *tags_filter(current_user.id, tags_any, tags_all))
+        if fields is not None:
+            return await select_contact_fields(where, fields, session)
+        results = await session.execute(select(Contact).where(where))
+        return [result for result in results.unique().scalars()]
+
+
+def fuzzy_keys(tokens: list[str]) -> set[str]:
+    # the phonetic keys of the words and of the whole prompt
+    keys = {phonetic_key(token) for token in tokens} | {phonetic_key(' '.join(tokens))}
+    keys.discard('')
+    return keys
+
+
+def phonetic_match(keys: set[str]):
+    if not keys:
+        return false()
+    return or_(Contact.first_name_phonetic.in_(keys), Contact.last_name_phonetic.in_(keys))
+
+
+def fuzzy_filter(tokens: list[str]):
+    # every condition is an index lookup: an equal phonetic key, of a word or of the whole prompt, or a prefix of
+    # a normalized name
+    conditions = [phonetic_match(fuzzy_keys(tokens))]
+    for token in tokens:
+        conditions += [Contact.first_name_normalized.startswith(token),
+                       Contact.last_name_normalized.startswith(token)]
+    return or_(*conditions)
+
+
+async def fuzzy_search_contacts(prompt: str,
+                                current_user: User,
+                                session: AsyncSession,
+                                fields: tuple[str, ...] | None = None,
+                                limit: int = FUZZY_LIMIT) -> list[Contact] | list[dict]:
+    """
+    Search contacts by name, tolerating misspellings: "Jon Smyth" finds John Smith.
+
+    Candidates are the contacts with a name that sounds like a word of the prompt or starts with it, found with
+    the indexes of the phonetic and normalized names; they are ranked by edit distance to the prompt. When there
+    are more than ``FUZZY_CANDIDATES``, the ones that sound the same are kept first, then the lowest ids.
+
+    :param prompt: Names searched for.
+    :type prompt: str
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param fields: Fields of the contacts to return, every field if None.
+    :type fields: tuple[str, ...] | None
+    :param limit: Maximum number of contacts returned.
+    :type limit: int
+    :return: The closest contacts, closest first.
+    :rtype: list[Contact] | list[dict]
+    """
+    tokens = normalize_name(prompt).split()
+    if not tokens:
+        return []
+    async with read_session(current_user.id, session) as session, session.begin():
+        candidates = await session.execute(
+            select(Contact.id, Contact.first_name_normalized, Contact.last_name_normalized)
+            .where(live_contacts(Contact.owner_id == current_user.id, fuzzy_filter(tokens)))
+            .order_by(case((phonetic_match(fuzzy_keys(tokens)), 0), else_=1), Contact.id)
+            .limit(FUZZY_CANDIDATES)
+        )
+        contact_ids = rank_fuzzy_matches(tokens, candidates.tuples())[:limit]
+        if not contact_ids:
+            return []
+        where = live_contacts(Contact.owner_id == current_user.id, Contact.id.in_(contact_ids))
+        if fields is not None:
+            contacts = await select_contact_fields(where, fields, session)
+        else:
+            contacts = (await session.execute(select(Contact).where(where))).unique().scalars().all()
+    rank = {contact_id: position for position, contact_id in enumerate(contact_ids)}
+    return sorted(contacts, key=lambda contact: rank[contact["id"] if fields is not None else contact.id])
+
+
+async def get_contact_names(current_user: User, session: AsyncSession) -> list[tuple[int, str, str | None]]:
+    # from the primary: an index built from a replica behind a write would miss it until the next rebuild
     async with session.begin():
-        prompt_lower = prompt.lower()
-        results = await session.execute(
+        contacts = await session.execute(
+            select(Contact.id, Contact.first_name, Contact.last_name)
+            .where(live_contacts(Contact.owner_id == current_user.id))
+        )
+        return contacts.tuples().all()
+
+
+async def autocomplete_contacts(prefix: str,
+                                current_user: User,
+                                session: AsyncSession,
+                                limit: int = AUTOCOMPLETE_LIMIT) -> list[dict]:
+    """
+    Names of the contacts with a first or last name starting with ``prefix``, for a search box.
+
+    They are read from the prefix index of the user in Redis, built from the database on its first use. Without
+    Redis, the indexes of the normalized names answer instead.
+
+    :param prefix: Beginning of a first or last name.
+    :type prefix: str
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param limit: Maximum number of contacts.
+    :type limit: int
+    :return: ``id`` and ``name`` of the contacts, in alphabetical order.
+    :rtype: list[dict]
+    """
+    try:
+        found = await autocomplete_index.search(current_user.id, prefix, limit)
+        if found is None and await autocomplete_index.rebuild(current_user.id,
+                                                              lambda: get_contact_names(current_user, session)):
+            found = await autocomplete_index.search(current_user.id, prefix, limit)
+        if found is not None:
+            return found
+    except RedisError:
+        logger.warning("autocomplete index of user %s unavailable, reading the database", current_user.id,
+                       exc_info=True)
+    tokens = normalize_name(prefix).split()
+    if not tokens:
+        return []
+    async with read_session(current_user.id, session) as session, session.begin():
+        contacts = await session.execute(
+            select(Contact.id, Contact.first_name, Contact.last_name)
+            .where(live_contacts(Contact.owner_id == current_user.id,
+                                 or_(Contact.first_name_normalized.startswith(tokens[0]),
+                                     Contact.last_name_normalized.startswith(tokens[0]))))
+            .order_by(Contact.first_name_normalized, Contact.last_name_normalized, Contact.id)
+            .limit(limit)
+        )
+        return [{"id": contact_id, "name": display_name(first_name, last_name)}
+                for contact_id, first_name, last_name in contacts.tuples()]
+
+
+def birthday_key_filter(key_ranges: list[tuple[int, int]]):
+    if not key_ranges:
+        return Contact.birthday_key.is_not(None)
+    return or_(*[Contact.birthday_key.between(start, end) for start, end in key_ranges])
+
+
+async def get_upcoming_birthdays(days: int,
+                                 current_user: User,
+                                 session: AsyncSession,
+                                 today: date | None = None) -> list[Contact]:
+    today = today or date.today()
+    ranges = birthday_key_ranges(today, days)
+    # the birthdays still ahead this year come first, the ones after New Year follow
+    order = [Contact.birthday_key < birthday_key(today)] if len(ranges) != 1 else []
+    async with read_session(current_user.id, session) as session, session.begin():
+        contacts = await session.execute(
             select(Contact).where(
-                and_(
+                live_contacts(
                     Contact.owner_id == current_user.id,
-                    or_(
-                        func.lower(Contact.first_name).contains(prompt_lower),
-                        func.lower(Contact.last_name).contains(prompt_lower),
-                        Contact.emails.any(func.lower(Email.address).contains(prompt_lower)),
-                        Contact.phones.any(func.lower(Phone.number).contains(prompt_lower))
-                    )
+                    birthday_key_filter(ranges)
                 )
-            )
+            ).order_by(*order, Contact.birthday_key, Contact.id)
+        )
+        return [contact for contact in contacts.unique().scalars()]
+
+
+def touch_contacts(owner_id: int, *contact_ids: int):
+    # writes to phones and emails move their contact forward in /contacts/changes
+    return update(Contact) \
+        .where(and_(Contact.owner_id == owner_id, Contact.id.in_(contact_ids))) \
+        .values(updated_at=func.now()) \
+        .execution_options(synchronize_session=False)
+
+
+async def get_changes(since: tuple[tuple[datetime, int], tuple[datetime, int]] | None,
+                      limit: int,
+                      current_user: User,
+                      session: AsyncSession,
+                      tombstone_days: int = 30) -> dict | None:
+    """
+    Contacts changed and deleted after the cursors of a sync token, oldest first.
+
+    :param since: Decoded contacts and tombstones cursors, or None for a full sync.
+    :type since: tuple | None
+    :param limit: Maximum number of contacts and of deleted ids in the page.
+    :type limit: int
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param tombstone_days: Age after which deletes are no longer guaranteed to be reported.
+    :type tombstone_days: int
+    :return: ``contacts``, ``deleted``, ``next_token`` and ``has_more``, or None if the token is too old.
+    :rtype: dict | None
+    """
+    async with read_session(current_user.id, session) as session, session.begin():
+        now = (await session.execute(select(naive_now()))).scalar_one()
+        if since is None:
+            # a full sync sends every live contact, so only deletes from now on matter
+            contacts_after, deleted_after = (SYNC_EPOCH, 0), (now, 0)
+        else:
+            contacts_after, deleted_after = since
+            if deleted_after[0] < now - timedelta(days=tombstone_days):
+                return None
+
+        contacts = await session.execute(
+            select(Contact).where(
+                live_contacts(
+                    Contact.owner_id == current_user.id,
+                    tuple_(Contact.updated_at, Contact.id) > tuple_(*contacts_after)
+                )
+            ).order_by(Contact.updated_at, Contact.id).limit(limit + 1)
+        )
+        contacts = [contact for contact in contacts.unique().scalars()]
+        tombstones = await session.execute(
+            select(ContactTombstone.deleted_at, ContactTombstone.id, ContactTombstone.contact_id).where(
+                and_(
+                    ContactTombstone.owner_id == current_user.id,
+                    tuple_(ContactTombstone.deleted_at, ContactTombstone.id) > tuple_(*deleted_after)
+                )
+            ).order_by(ContactTombstone.deleted_at, ContactTombstone.id).limit(limit + 1)
         )
-    return [result for result in results.unique().scalars()]
+        tombstones = tombstones.all()
+
+    contacts_more, deleted_more = len(contacts) > limit, len(tombstones) > limit
+    contacts, tombstones = contacts[:limit], tombstones[:limit]
+    if contacts:
+        contacts_after = (contacts[-1].updated_at, contacts[-1].id)
+    if tombstones:
+        deleted_after = (tombstones[-1].deleted_at, tombstones[-1].id)
+    return {
+        "contacts": contacts,
+        "deleted": [tombstone.contact_id for tombstone in tombstones],
+        "next_token": encode_sync_token(next_sync_cursor(contacts_after, contacts_more, now),
+                                        next_sync_cursor(deleted_after, deleted_more, now)),
+        "has_more": contacts_more or deleted_more,
+    }
 
 
 async def add_contact(contact: ContactIn, current_user: User, session: AsyncSession):
     async with session.begin():
         contact_to_add = Contact(**contact.model_dump(), owner_id=current_user.id)
         session.add(contact_to_add)
-        return contact_to_add
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "created", contact_to_add.id)
+    await autocomplete_index.update(current_user.id,
+                                    [(contact_to_add.id, contact_to_add.first_name, contact_to_add.last_name)])
+    return contact_to_add
 
 
 async def update_contact(contact_update: ContactIn,
@@ -56,7 +456,7 @@ async def update_contact(contact_update: ContactIn,
     async with session.begin():
         contact = await session.execute(
             select(Contact).where(
-                and_(
+                live_contacts(
                     Contact.owner_id == current_user.id,
                     Contact.id == contact_id
                 )
@@ -69,20 +469,503 @@ async def update_contact(contact_update: ContactIn,
             contact.birthday = contact_update.birthday
             contact.description = contact_update.description
             await session.flush()
+    if contact:
+        await pin_to_primary(current_user.id)
+        await change_broker.publish(current_user.id, "updated", contact_id)
+        await autocomplete_index.update(current_user.id, [(contact_id, contact.first_name, contact.last_name)])
     return contact
 
 
 async def remove_contact(contact_id: int, current_user: User, session: AsyncSession):
+    # a soft delete: one row updated whatever the size of the contact, the purger deletes it with its children
     async with session.begin():
-        contact = await session.execute(
-            select(Contact).where(
-                and_(
+        deleted = await session.execute(
+            update(Contact).where(
+                live_contacts(
                     Contact.owner_id == current_user.id,
                     Contact.id == contact_id
                 )
+            ).values(deleted_at=func.now()).execution_options(synchronize_session=False)
+        )
+        if not deleted.rowcount:
+            return
+        session.add(ContactTombstone(owner_id=current_user.id, contact_id=contact_id))
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "deleted", contact_id)
+    await autocomplete_index.remove(current_user.id, [contact_id])
+    return True
+
+
+def contacts_filter(criteria: ContactsFilterIn, owner_id: int):
+    conditions = [Contact.owner_id == owner_id]
+    if criteria.ids is not None:
+        conditions.append(Contact.id.in_(criteria.ids))
+    if criteria.search is not None:
+        conditions.append(search_filter(criteria.search))
+    if criteria.without_phones:
+        conditions.append(~Contact.phones.any())
+    if criteria.without_emails:
+        conditions.append(~Contact.emails.any())
+    conditions += tags_filter(owner_id, criteria.tags_any, criteria.tags_all)
+    return live_contacts(*conditions)
+
+
+async def update_in_chunks(where, values: dict, event_type: str, current_user: User, session: AsyncSession,
+                           chunk_size: int) -> int:
+    # one set-based UPDATE of the next chunk of matching ids per transaction, walking the ids in order, so locks
+    # are held for one chunk at a time and rows the update stops matching are not visited again
+    count, after_id = 0, 0
+    while True:
+        chunk = select(Contact.id).where(and_(where, Contact.id > after_id)).order_by(Contact.id).limit(chunk_size)
+        async with session.begin():
+            contacts = await session.execute(
+                update(Contact)
+                .where(and_(Contact.owner_id == current_user.id, Contact.id.in_(chunk)))
+                .values(**values)
+                .returning(Contact.id, Contact.first_name, Contact.last_name)
+                .execution_options(synchronize_session=False)
+            )
+            contacts = sorted(contacts.tuples().all())
+            contact_ids = [contact_id for contact_id, _, _ in contacts]
+            if contact_ids and event_type == "deleted":
+                await session.execute(insert(ContactTombstone), [
+                    {"owner_id": current_user.id, "contact_id": contact_id} for contact_id in contact_ids
+                ])
+        if not contact_ids:
+            return count
+        await pin_to_primary(current_user.id)
+        await change_broker.publish_many(current_user.id, event_type, contact_ids)
+        if event_type == "deleted":
+            await autocomplete_index.remove(current_user.id, contact_ids)
+        elif "first_name" in values or "last_name" in values:
+            await autocomplete_index.update(current_user.id, contacts)
+        count += len(contact_ids)
+        after_id = contact_ids[-1]
+
+
+async def bulk_remove_contacts(criteria: ContactsFilterIn,
+                               current_user: User,
+                               session: AsyncSession,
+                               chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Soft-delete every contact of the user matching the criteria, one chunk per transaction.
+
+    :param criteria: Ids, search prompt and missing children the contacts must match, all of them.
+    :type criteria: ContactsFilterIn
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param chunk_size: Number of contacts per statement.
+    :type chunk_size: int
+    :return: Number of contacts deleted.
+    :rtype: int
+    """
+    return await update_in_chunks(contacts_filter(criteria, current_user.id), {"deleted_at": func.now()},
+                                  "deleted", current_user, session, chunk_size)
+
+
+async def bulk_update_contacts(criteria: ContactsFilterIn,
+                               patch: ContactPatchIn,
+                               current_user: User,
+                               session: AsyncSession,
+                               chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Set the same fields on every contact of the user matching the criteria, one chunk per transaction.
+
+    :param criteria: Ids, search prompt and missing children the contacts must match, all of them.
+    :type criteria: ContactsFilterIn
+    :param patch: The fields to set; the fields left out keep their values.
+    :type patch: ContactPatchIn
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param chunk_size: Number of contacts per statement.
+    :type chunk_size: int
+    :return: Number of contacts updated.
+    :rtype: int
+    """
+    values = patch.model_dump(exclude_unset=True)
+    # Core updates skip the ORM validators, so the birthday key and the name keys are filled in here
+    if "birthday" in values:
+        values["birthday_key"] = birthday_key(values["birthday"]) if values["birthday"] else None
+    values.update(name_keys(values))
+    return await update_in_chunks(contacts_filter(criteria, current_user.id), values, "updated", current_user,
+                                  session, chunk_size)
+
+
+def insert_ignoring_conflicts(session: AsyncSession, model):
+    # INSERT ... ON CONFLICT DO NOTHING is spelled the same on both databases but built by their own dialects
+    dialect = postgresql if session.get_bind(model).dialect.name == "postgresql" else sqlite
+    return dialect.insert(model).on_conflict_do_nothing()
+
+
+async def get_tag_ids(names: list[str], owner_id: int, session: AsyncSession, create: bool = False) -> list[int]:
+    names = sorted(set(names))
+    if create:
+        await session.execute(insert_ignoring_conflicts(session, Tag),
+                              [{"owner_id": owner_id, "name": name} for name in names])
+    tag_ids = await session.execute(select(Tag.id).where(and_(Tag.owner_id == owner_id, Tag.name.in_(names))))
+    return tag_ids.scalars().all()
+
+
+async def tag_in_chunks(where, tag_ids: list[int], add: bool, current_user: User, session: AsyncSession,
+                        chunk_size: int) -> int:
+    # like update_in_chunks: the next chunk of matching ids per transaction, tagged with one INSERT ... SELECT or
+    # untagged with one DELETE
+    count, after_id = 0, 0
+    while True:
+        async with session.begin():
+            contact_ids = await session.execute(
+                select(Contact.id).where(and_(where, Contact.id > after_id)).order_by(Contact.id).limit(chunk_size)
+            )
+            contact_ids = contact_ids.scalars().all()
+            if contact_ids and add:
+                await session.execute(
+                    insert_ignoring_conflicts(session, ContactTag).from_select(
+                        ["contact_id", "tag_id", "owner_id"],
+                        select(Contact.id, Tag.id, Contact.owner_id)
+                        .join(Tag, Tag.owner_id == Contact.owner_id)
+                        .where(and_(Contact.owner_id == current_user.id, Contact.id.in_(contact_ids),
+                                    Tag.id.in_(tag_ids)))
+                    )
+                )
+            elif contact_ids:
+                await session.execute(
+                    delete(ContactTag)
+                    .where(and_(ContactTag.owner_id == current_user.id, ContactTag.tag_id.in_(tag_ids),
+                                ContactTag.contact_id.in_(contact_ids)))
+                    .execution_options(synchronize_session=False)
+                )
+        if not contact_ids:
+            return count
+        await pin_to_primary(current_user.id)
+        count += len(contact_ids)
+        after_id = contact_ids[-1]
+
+
+async def tag_contacts(criteria: ContactsFilterIn,
+                       names: list[str],
+                       current_user: User,
+                       session: AsyncSession,
+                       chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Add tags to every contact of the user matching the criteria, one chunk per transaction.
+
+    :param criteria: The criteria the contacts must match, all of them.
+    :type criteria: ContactsFilterIn
+    :param names: Tags to add, created if the user does not have them yet.
+    :type names: list[str]
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param chunk_size: Number of contacts per statement.
+    :type chunk_size: int
+    :return: Number of contacts matching the criteria.
+    :rtype: int
+    """
+    async with session.begin():
+        tag_ids = await get_tag_ids(names, current_user.id, session, create=True)
+    return await tag_in_chunks(contacts_filter(criteria, current_user.id), tag_ids, True, current_user, session,
+                               chunk_size)
+
+
+async def untag_contacts(criteria: ContactsFilterIn,
+                         names: list[str],
+                         current_user: User,
+                         session: AsyncSession,
+                         chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """
+    Remove tags from every contact of the user matching the criteria, one chunk per transaction.
+
+    :param criteria: The criteria the contacts must match, all of them.
+    :type criteria: ContactsFilterIn
+    :param names: Tags to remove; the ones the user does not have are ignored.
+    :type names: list[str]
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :param chunk_size: Number of contacts per statement.
+    :type chunk_size: int
+    :return: Number of contacts matching the criteria.
+    :rtype: int
+    """
+    async with session.begin():
+        tag_ids = await get_tag_ids(names, current_user.id, session)
+    if not tag_ids:
+        return 0
+    return await tag_in_chunks(contacts_filter(criteria, current_user.id), tag_ids, False, current_user, session,
+                               chunk_size)
+
+
+async def get_tags(current_user: User, session: AsyncSession) -> list[dict]:
+    # the tags of the live contacts only, so a tag disappears with the last contact carrying it
+    async with read_session(current_user.id, session) as session, session.begin():
+        tags = await session.execute(
+            select(Tag.name, func.count().label("contacts"))
+            .join(ContactTag, and_(ContactTag.owner_id == Tag.owner_id, ContactTag.tag_id == Tag.id))
+            .join(Contact, and_(Contact.owner_id == ContactTag.owner_id, Contact.id == ContactTag.contact_id))
+            .where(live_contacts(Tag.owner_id == current_user.id))
+            .group_by(Tag.name)
+            .order_by(Tag.name)
+        )
+        return [row._asdict() for row in tags]
+
+
+async def find_duplicates(current_user: User, session: AsyncSession) -> list[dict]:
+    # plain column rows instead of ORM objects with joined children keep 100k-contact books fast
+    async with read_session(current_user.id, session) as session, session.begin():
+        contacts = await session.execute(
+            select(Contact.id, Contact.first_name, Contact.last_name)
+            .where(live_contacts(Contact.owner_id == current_user.id))
+        )
+        phones = await session.execute(
+            select(Phone.contact_id, Phone.number).join(Phone.contact)
+            .where(and_(Phone.owner_id == current_user.id, live_contacts()))
+        )
+        emails = await session.execute(
+            select(Email.contact_id, Email.address).join(Email.contact)
+            .where(and_(Email.owner_id == current_user.id, live_contacts()))
+        )
+        return find_duplicate_groups(contacts.tuples(), phones.tuples(), emails.tuples())
+
+
+async def merge_contacts(survivor_id: int,
+                         duplicate_ids: list[int],
+                         current_user: User,
+                         session: AsyncSession) -> bool:
+    duplicate_ids = [contact_id for contact_id in set(duplicate_ids) if contact_id != survivor_id]
+    contact_ids = [survivor_id, *duplicate_ids]
+    async with session.begin():
+        owned = await session.execute(
+            select(Contact.id).where(live_contacts(Contact.owner_id == current_user.id, Contact.id.in_(contact_ids)))
+        )
+        if len(owned.all()) != len(contact_ids):
+            return False
+
+        for model, value, normalize in ((Phone, Phone.number, normalize_phone),
+                                        (Email, Email.address, normalize_email)):
+            owned = model.owner_id == current_user.id
+            rows = await session.execute(
+                select(model.id, model.contact_id, value).where(and_(owned, model.contact_id.in_(contact_ids)))
+            )
+            seen, move, drop = set(), [], []
+            # the survivor's own children come first so they are the ones that are kept
+            for child_id, contact_id, child_value in sorted(rows.tuples(), key=lambda row: row[1] != survivor_id):
+                key = normalize(child_value)
+                if key in seen:
+                    drop.append(child_id)
+                else:
+                    seen.add(key)
+                    if contact_id != survivor_id:
+                        move.append(child_id)
+            if move:
+                await session.execute(
+                    update(model).where(and_(owned, model.id.in_(move))).values(contact_id=survivor_id)
+                )
+            if drop:
+                await session.execute(delete(model).where(and_(owned, model.id.in_(drop))))
+
+        if duplicate_ids:
+            # the survivor gets the tags of the duplicates, once each
+            await session.execute(
+                insert_ignoring_conflicts(session, ContactTag).from_select(
+                    ["contact_id", "tag_id", "owner_id"],
+                    select(literal(survivor_id), ContactTag.tag_id, ContactTag.owner_id).where(
+                        and_(ContactTag.owner_id == current_user.id, ContactTag.contact_id.in_(duplicate_ids))
+                    )
+                )
             )
+            await session.execute(
+                delete(ContactTag)
+                .where(and_(ContactTag.owner_id == current_user.id, ContactTag.contact_id.in_(duplicate_ids)))
+                .execution_options(synchronize_session=False)
+            )
+            # the duplicates have no children left, so they are deleted right away rather than left to the purger
+            await session.execute(
+                delete(Contact).where(and_(Contact.owner_id == current_user.id, Contact.id.in_(duplicate_ids)))
+            )
+            session.add_all([ContactTombstone(owner_id=current_user.id, contact_id=contact_id)
+                             for contact_id in duplicate_ids])
+        await session.execute(touch_contacts(current_user.id, survivor_id))
+    await pin_to_primary(current_user.id)
+    for contact_id in duplicate_ids:
+        await change_broker.publish(current_user.id, "deleted", contact_id)
+    await autocomplete_index.remove(current_user.id, duplicate_ids)
+    await change_broker.publish(current_user.id, "updated", survivor_id)
+    return True
+
+
+async def stream_contacts(current_user: User,
+                          session: AsyncSession,
+                          batch_size: int = 500) -> AsyncIterator[list[tuple]]:
+    """
+    Read every contact of the user through a server-side cursor, one batch at a time.
+
+    :param current_user: Owner of the contacts.
+    :type current_user: User
+    :param session: Database session, kept in one transaction until the last batch is read.
+    :type session: AsyncSession
+    :param batch_size: Number of contacts fetched from the cursor at once.
+    :type batch_size: int
+    :return: Batches of ``(contact row, phone numbers, email addresses)`` ordered by contact id.
+    :rtype: AsyncIterator[list[tuple]]
+    """
+    async with read_session(current_user.id, session) as session, session.begin():
+        contacts = await session.stream(
+            select(Contact.id, Contact.first_name, Contact.last_name, Contact.birthday, Contact.description)
+            .where(live_contacts(Contact.owner_id == current_user.id))
+            .order_by(Contact.id)
+            .execution_options(yield_per=batch_size)
         )
-        contact = contact.scalars().unique().one_or_none()
-        if contact:
-            await session.delete(contact)
-            return True
+        async for partition in contacts.partitions():
+            contact_ids = [contact.id for contact in partition]
+            children = {}
+            for model, value in ((Phone, Phone.number), (Email, Email.address)):
+                rows = await session.execute(
+                    select(model.contact_id, value)
+                    .where(and_(model.owner_id == current_user.id, model.contact_id.in_(contact_ids)))
+                    .order_by(model.id)
+                )
+                children[model] = defaultdict(list)
+                for contact_id, child_value in rows.tuples():
+                    children[model][contact_id].append(child_value)
+            yield [(contact, children[Phone][contact.id], children[Email][contact.id]) for contact in partition]
+
+
+async def add_contacts_batch(cards: list[tuple[ContactIn, list[PhoneIn], list[EmailIn]]],
+                             current_user: User,
+                             session: AsyncSession) -> int:
+    """
+    Insert a batch of contacts with their phones and emails in one transaction.
+
+    Rows are written with multi-row inserts, so a batch costs three round trips whatever its size, and the new
+    contacts are announced to the change stream in one more.
+
+    :param cards: Validated contacts with their phones and emails.
+    :type cards: list[tuple[ContactIn, list[PhoneIn], list[EmailIn]]]
+    :param current_user: Owner of the new contacts.
+    :type current_user: User
+    :param session: Database session.
+    :type session: AsyncSession
+    :return: Number of contacts inserted.
+    :rtype: int
+    """
+    if not cards:
+        return 0
+    async with session.begin():
+        # Core inserts skip the ORM validators, so the birthday key and the name keys are filled in here
+        contact_ids = await session.scalars(
+            insert(Contact).returning(Contact.id, sort_by_parameter_order=True),
+            [{**contact.model_dump(), "owner_id": current_user.id,
+              "birthday_key": birthday_key(contact.birthday) if contact.birthday else None,
+              **name_keys(contact.model_dump())}
+             for contact, _, _ in cards]
+        )
+        contact_ids = contact_ids.all()
+        phones, emails = [], []
+        for contact_id, (_, contact_phones, contact_emails) in zip(contact_ids, cards):
+            phones += [{"number": phone.number, "normalized": normalize_number(phone.number),
+                        "contact_id": contact_id, "owner_id": current_user.id} for phone in contact_phones]
+            emails += [{"address": email.address, "contact_id": contact_id, "owner_id": current_user.id}
+                       for email in contact_emails]
+        if phones:
+            await session.execute(insert(Phone), phones)
+        if emails:
+            await session.execute(insert(Email), emails)
+    await pin_to_primary(current_user.id)
+    await change_broker.publish_many(current_user.id, "created", contact_ids)
+    await autocomplete_index.update(current_user.id, [(contact_id, contact.first_name, contact.last_name)
+                                                      for contact_id, (contact, _, _) in zip(contact_ids, cards)])
+    return len(cards)
+
+
+async def purge_deleted_contacts(older_than: timedelta,
+                                 after: tuple[datetime, int] | None,
+                                 limit: int,
+                                 session: AsyncSession) -> list[tuple[datetime, int]]:
+    """
+    Delete the next batch of soft-deleted contacts with their phones, emails and tags, in one transaction.
+
+    :param older_than: Age of the soft delete after which a contact is purged.
+    :type older_than: timedelta
+    :param after: ``(deleted_at, id)`` of the last contact of the previous batch, or None for the first batch.
+    :type after: tuple[datetime, int] | None
+    :param limit: Maximum number of contacts in the batch.
+    :type limit: int
+    :param session: Database session.
+    :type session: AsyncSession
+    :return: ``(deleted_at, id)`` of the purged contacts, in that order.
+    :rtype: list[tuple[datetime, int]]
+    """
+    async with session.begin():
+        now = (await session.execute(select(naive_now()))).scalar_one()
+        where = Contact.deleted_at < now - older_than
+        if after is not None:
+            where = and_(where, tuple_(Contact.deleted_at, Contact.id) > tuple_(*after))
+        rows = await session.execute(
+            select(Contact.deleted_at, Contact.id, Contact.owner_id)
+            .where(where)
+            .order_by(Contact.deleted_at, Contact.id)
+            .limit(limit)
+        )
+        rows = rows.tuples().all()
+        if not rows:
+            return []
+        # the owners only narrow the statements down to their partitions, the contact ids are unique
+        owner_ids = {owner_id for _, _, owner_id in rows}
+        contact_ids = [contact_id for _, contact_id, _ in rows]
+        for model in (Phone, Email, ContactTag):
+            await session.execute(
+                delete(model)
+                .where(and_(model.owner_id.in_(owner_ids), model.contact_id.in_(contact_ids)))
+                .execution_options(synchronize_session=False)
+            )
+        await session.execute(
+            delete(Contact)
+            .where(and_(Contact.owner_id.in_(owner_ids), Contact.id.in_(contact_ids), Contact.deleted_at.is_not(None)))
+            .execution_options(synchronize_session=False)
+        )
+    return [(deleted_at, contact_id) for deleted_at, contact_id, _ in rows]
+
+
+async def purge_tombstones(older_than: timedelta,
+                           after: tuple[datetime, int] | None,
+                           limit: int,
+                           session: AsyncSession) -> list[tuple[datetime, int]]:
+    """
+    Delete the next batch of tombstones older than any sync token still accepted, in one transaction.
+
+    :param older_than: Age after which a tombstone is no longer needed.
+    :type older_than: timedelta
+    :param after: ``(deleted_at, id)`` of the last tombstone of the previous batch, or None for the first batch.
+    :type after: tuple[datetime, int] | None
+    :param limit: Maximum number of tombstones in the batch.
+    :type limit: int
+    :param session: Database session.
+    :type session: AsyncSession
+    :return: ``(deleted_at, id)`` of the purged tombstones, in that order.
+    :rtype: list[tuple[datetime, int]]
+    """
+    async with session.begin():
+        now = (await session.execute(select(naive_now()))).scalar_one()
+        where = ContactTombstone.deleted_at < now - older_than
+        if after is not None:
+            where = and_(where, tuple_(ContactTombstone.deleted_at, ContactTombstone.id) > tuple_(*after))
+        rows = await session.execute(
+            select(ContactTombstone.deleted_at, ContactTombstone.id)
+            .where(where)
+            .order_by(ContactTombstone.deleted_at, ContactTombstone.id)
+            .limit(limit)
+        )
+        rows = rows.tuples().all()
+        if rows:
+            await session.execute(
+                delete(ContactTombstone)
+                .where(ContactTombstone.id.in_([tombstone_id for _, tombstone_id in rows]))
+                .execution_options(synchronize_session=False)
+            )
+    return rows
@@ -1,42 +1,133 @@
+from datetime import date, datetime
+
+from pydantic import ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, UploadFile, File, status
+from fastapi.responses import StreamingResponse
 from fastapi_limiter.depends import RateLimiter
 
 import src.contacts.repository as contacts_db
 from src.database_postgres import get_session
-from src.contacts.schemas import ContactOut, ContactIn
+from src.contacts.schemas import ContactOut, ContactIn, MergeIn, DuplicateGroupOut, ChangesOut, \
+    ContactsFilterIn, ContactsQueryIn, BulkUpdateIn, BulkOut, AutocompleteOut, TagsIn, TagOut, TagName, \
+    contact_fields_adapter
+from src.contacts.service import decode_sync_token, parse_fields, encode_page_cursor, decode_page_cursor
+from src.contacts.vcard import write_cards, read_chunks, import_cards
+from src.config import settings
+from src.encoding import NegotiatedResponse
+from src.events import change_broker, event_stream
 from src.models import User
 from src.auth.service import auth_service
 
 router = APIRouter(prefix='/contacts', tags=["contacts"])
 
 
+def fields_param(fields: str | None = None) -> tuple[str, ...] | None:
+    try:
+        return parse_fields(fields)
+    except ValueError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+
+
+def query_param(name: str | None = None,
+                has_phone: bool | None = None,
+                has_email: bool | None = None,
+                has_birthday: bool | None = None,
+                born_from: date | None = None,
+                born_to: date | None = None,
+                created_from: datetime | None = None,
+                created_to: datetime | None = None,
+                tags_any: list[str] | None = Query(default=None),
+                tags_all: list[str] | None = Query(default=None),
+                sort: str = "id") -> ContactsQueryIn:
+    try:
+        return ContactsQueryIn(name=name, has_phone=has_phone, has_email=has_email, has_birthday=has_birthday,
+                               born_from=born_from, born_to=born_to, created_from=created_from,
+                               created_to=created_to, tags_any=tags_any, tags_all=tags_all, sort=sort)
+    except ValidationError as err:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="; ".join(error["msg"] for error in err.errors()))
+
+
+def fields_response(contacts: list[dict], fields: tuple[str, ...]) -> NegotiatedResponse:
+    # serialized with a ContactOut reduced to the requested fields instead of the full response model
+    adapter = contact_fields_adapter(fields)
+    return NegotiatedResponse(adapter.dump_python(adapter.validate_python(contacts), mode="json"))
+
+
 @router.get("/read", response_model=list[ContactOut])
-async def read_contacts(current_user: User = Depends(auth_service.get_current_user),
+async def read_contacts(request: Request,
+                        response: Response,
+                        query: ContactsQueryIn = Depends(query_param),
+                        fields: tuple[str, ...] | None = Depends(fields_param),
+                        limit: int | None = Query(default=None, ge=1, le=1000),
+                        after: str | None = None,
+                        current_user: User = Depends(auth_service.get_current_user),
                         db: AsyncSession = Depends(get_session)):
     """
-    .. http:get:: /read
-
-       Retrieve the list of contacts for the current user.
-
+    .. http:get:: /read?name={name}&has_phone={bool}&sort={sort}&limit={limit}&after={cursor}&fields={fields}
+
+       Retrieve the list of contacts for the current user, filtered and sorted, in pages.
+
+       :param name: Only the contacts with a first or last name starting with every word of it. Case and accents are ignored.
+       :type name: str, optional
+       :param has_phone: Only the contacts with (true) or without (false) a phone.
+       :type has_phone: bool, optional
+       :param has_email: Only the contacts with (true) or without (false) an email.
+       :type has_email: bool, optional
+       :param has_birthday: Only the contacts with (true) or without (false) a birthday.
+       :type has_birthday: bool, optional
+       :param born_from: Only the contacts born on this date or later.
+       :type born_from: date, optional
+       :param born_to: Only the contacts born on this date or earlier.
+       :type born_to: date, optional
+       :param created_from: Only the contacts created at this time or later. Times without an offset are UTC.
+       :type created_from: datetime, optional
+       :param created_to: Only the contacts created at this time or earlier. Times without an offset are UTC.
+       :type created_to: datetime, optional
+       :param tags_any: Only the contacts with at least one of these tags. May be repeated.
+       :type tags_any: List[str], optional
+       :param tags_all: Only the contacts with every one of these tags. May be repeated.
+       :type tags_all: List[str], optional
+       :param sort: `id` (default), `first_name`, `last_name`, `birthday` (month and day, contacts with a birthday only, so not with `has_birthday=false`) or `created`; prefixed with `-` for descending order. Names are sorted ignoring case and accents.
+       :type sort: str, optional
+       :param limit: Maximum number of contacts in the page, every contact by default.
+       :type limit: int, optional
+       :param after: Cursor of the next page, from the `Link` header of the previous one. The other parameters must be the same.
+       :type after: str, optional
+       :param fields: Comma separated fields of the contacts to return, e.g. `id,first_name,last_name`. Every field by default; `id` is always returned.
+       :type fields: str, optional
        :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
        :type current_user: User, optional
        :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
        :type db: AsyncSession, optional
        :return: A list of `ContactOut` objects representing the contacts associated with the current user.
        :rtype: List[ContactOut]
-       :raises HTTPException: If no contacts are found for the current user, an HTTPException with a 404 status code is raised.
+       :raises HTTPException: If no contacts are found for the current user, an HTTPException with a 404 status code is raised. If a field or a sort key is unknown, a filter is invalid or the cursor is malformed or made for another sort, an HTTPException with a 400 status code is raised.
 
        **Dependencies**:
 
        - RateLimiter: Limits the number of requests to 2 every 5 seconds.
        - get_current_user: Dependency to get the currently authenticated user.
        - get_session: Dependency to get the current asynchronous database session.
+
+       **Notes**:
+
+       Only the columns of the requested fields are read, and emails and phones are not loaded unless requested. When more contacts follow a page, its `Link` header has the URL of the next one (`rel="next"`); every sort key is backed by an index, so each page is read from where the previous one ended whatever its depth.
     """
-    all_contacts = await contacts_db.get_contacts(current_user, db)
-    if all_contacts:
-        return all_contacts
-    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
+    try:
+        cursor = decode_page_cursor(after, query.sort) if after else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor.")
+    contacts, next_after = await contacts_db.list_contacts(query, current_user, db, fields, limit, cursor)
+    if not contacts:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
+    if fields:
+        response = fields_response(contacts, fields)
+    if next_after is not None:
+        next_url = request.url.include_query_params(after=encode_page_cursor(query.sort, next_after))
+        response.headers["Link"] = f'<{next_url}>; rel="next"'
+    return response if fields else contacts
 
 
 @router.get("/contact={contact_id}", response_model=ContactOut)
@@ -49,7 +140,12 @@ async def read_contact(contact_id: int, current_user: User = Depends(auth_servic
 
 
 @router.get("/search/string={search_string}", response_model=list[ContactOut])
-async def search_contact(search_string: str, current_user: User = Depends(auth_service.get_current_user),
+async def search_contact(search_string: str,
+                         fuzzy: bool = False,
+                         fields: tuple[str, ...] | None = Depends(fields_param),
+                         tags_any: list[TagName] | None = Query(default=None, max_length=50),
+                         tags_all: list[TagName] | None = Query(default=None, max_length=50),
+                         current_user: User = Depends(auth_service.get_current_user),
                          db: AsyncSession = Depends(get_session)):
     """
     .. http:get:: /contact={contact_id}
@@ -58,13 +154,21 @@ async def search_contact(search_string: str, current_user: User = Depends(auth_s
 
        :param contact_id: The unique identifier of the contact to retrieve.
        :type contact_id: int
+       :param fuzzy: Search names tolerating misspellings ("Jon Smyth" finds John Smith), closest matches first, instead of substrings of names, emails and phones.
+       :type fuzzy: bool, optional
+       :param fields: Comma separated fields of the contacts to return, e.g. `id,first_name,last_name`. Every field by default; `id` is always returned.
+       :type fields: str, optional
+       :param tags_any: Only the contacts with at least one of these tags. May be repeated. Not supported with `fuzzy`.
+       :type tags_any: List[str], optional
+       :param tags_all: Only the contacts with every one of these tags. May be repeated. Not supported with `fuzzy`.
+       :type tags_all: List[str], optional
        :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
        :type current_user: User, optional
        :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
        :type db: AsyncSession, optional
        :return: A `ContactOut` object representing the contact associated with the given ID for the current user.
        :rtype: ContactOut
-       :raises HTTPException: If the contact is not found for the given ID and current user, an HTTPException with a 404 status code is raised.
+       :raises HTTPException: If the contact is not found for the given ID and current user, an HTTPException with a 404 status code is raised. If tags are combined with `fuzzy`, an HTTPException with a 400 status code is raised.
 
        **Dependencies**:
 
@@ -72,12 +176,46 @@ async def search_contact(search_string: str, current_user: User = Depends(auth_s
        - get_current_user: Dependency to get the currently authenticated user.
        - get_session: Dependency to get the current asynchronous database session.
     """
-    all_contacts = await contacts_db.search_in_contacts(search_string, current_user, db)
+    if fuzzy and (tags_any or tags_all):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tags are not supported with fuzzy.")
+    if fuzzy:
+        all_contacts = await contacts_db.fuzzy_search_contacts(search_string, current_user, db, fields)
+    else:
+        all_contacts = await contacts_db.search_in_contacts(search_string, current_user, db, fields, tags_any,
+                                                            tags_all)
     if all_contacts:
-        return all_contacts
+        return fields_response(all_contacts, fields) if fields else all_contacts
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
 
 
+@router.get("/autocomplete", response_model=list[AutocompleteOut])
+async def autocomplete(q: str = Query(min_length=1, max_length=100),
+                       limit: int = Query(default=10, ge=1, le=50),
+                       current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /autocomplete?q={q}&limit={limit}
+
+       Suggest contacts of the current user while their name is typed.
+
+       :param q: What was typed so far: the beginning of the first name, of the last name or of any other word of the name. Case and accents are ignored.
+       :type q: str
+       :param limit: Maximum number of contacts, 10 by default.
+       :type limit: int, optional
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A list of `AutocompleteOut` objects with the id and the full name of the contacts, in alphabetical order; empty when nothing matches.
+       :rtype: List[AutocompleteOut]
+
+       **Notes**:
+
+       Suggestions come from a per-user prefix index in Redis, one lookup per keystroke, kept up to date by the writes to contacts. Call `/search` for the contacts themselves.
+    """
+    return await contacts_db.autocomplete_contacts(q, current_user, db, limit)
+
+
 @router.post("/create", status_code=status.HTTP_201_CREATED)
 async def create_contact(contact: ContactIn, current_user: User = Depends(auth_service.get_current_user),
                          db: AsyncSession = Depends(get_session)):
@@ -167,3 +305,315 @@ async def delete_contact(contact_id: int, current_user: User = Depends(auth_serv
     if respond:
         return {"detail": "Contact deleted sucsessfully."}
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
+
+
+@router.get("/duplicates", response_model=list[DuplicateGroupOut])
+async def read_duplicates(current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /duplicates
+
+       Find groups of contacts of the current user that are likely duplicates.
+
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A list of `DuplicateGroupOut` objects with the ids of the grouped contacts, the suggested surviving contact and the reasons (`phone`, `email`, `name`) they were grouped by.
+       :rtype: List[DuplicateGroupOut]
+       :raises HTTPException: If no duplicates are found for the current user, an HTTPException with a 404 status code is raised.
+
+       **Notes**:
+
+       Contacts sharing a normalized phone number or email address are grouped when their names are similar. Contacts with the same normalized first and last name are grouped as well.
+    """
+    groups = await contacts_db.find_duplicates(current_user, db)
+    if groups:
+        return groups
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Duplicates not found.")
+
+
+@router.post("/merge")
+async def merge_contacts(body: MergeIn, current_user: User = Depends(auth_service.get_current_user),
+                         db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /merge
+
+       Merge duplicate contacts of the current user into one surviving contact.
+
+       :param body: The surviving contact ID and the IDs of the duplicates to merge into it.
+       :type body: MergeIn
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A message indicating the successful merge of the contacts.
+       :rtype: dict
+       :raises HTTPException: If any of the contacts is not found for the current user, an HTTPException with a 404 status code is raised.
+
+       **Notes**:
+
+       Phones and emails of the duplicates are moved to the surviving contact in one transaction, skipping numbers and addresses it already has, and the duplicates are deleted.
+    """
+    respond = await contacts_db.merge_contacts(body.survivor_id, body.duplicate_ids, current_user, db)
+    if respond:
+        return {"detail": "Contacts merged sucsessfully."}
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
+
+
+@router.post("/bulk/delete", response_model=BulkOut)
+async def bulk_delete_contacts(body: ContactsFilterIn, current_user: User = Depends(auth_service.get_current_user),
+                               db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /bulk/delete
+
+       Delete every contact of the current user matching the given criteria.
+
+       :param body: The criteria the contacts must all match: `ids`, `search` (the contacts `/search` would return), `without_phones`, `without_emails`, `tags_any` (any of the tags), `tags_all` (every tag). At least one is required.
+       :type body: ContactsFilterIn
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: The number of deleted contacts.
+       :rtype: BulkOut
+
+       **Notes**:
+
+       The contacts are deleted with set-based statements of a few hundred contacts each, every one in its own transaction, and reported as deleted by `/changes` and `/events`.
+    """
+    return {"count": await contacts_db.bulk_remove_contacts(body, current_user, db)}
+
+
+@router.post("/bulk/update", response_model=BulkOut)
+async def bulk_update_contacts(body: BulkUpdateIn, current_user: User = Depends(auth_service.get_current_user),
+                               db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /bulk/update
+
+       Set the same fields on every contact of the current user matching the given criteria.
+
+       :param body: `where`, the criteria of `/bulk/delete`, and `values`, the fields to set; fields left out keep their values.
+       :type body: BulkUpdateIn
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: The number of updated contacts.
+       :rtype: BulkOut
+
+       **Notes**:
+
+       The contacts are updated with set-based statements of a few hundred contacts each, every one in its own transaction, and reported as updated by `/changes` and `/events`.
+    """
+    return {"count": await contacts_db.bulk_update_contacts(body.where, body.values, current_user, db)}
+
+
+@router.get("/tags", response_model=list[TagOut])
+async def read_tags(current_user: User = Depends(auth_service.get_current_user),
+                    db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /tags
+
+       Retrieve the tags of the contacts of the current user.
+
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A list of `TagOut` objects with the name of every tag and the number of contacts carrying it, in alphabetical order.
+       :rtype: List[TagOut]
+    """
+    return await contacts_db.get_tags(current_user, db)
+
+
+@router.post("/tags/add", response_model=BulkOut)
+async def tag_contacts(body: TagsIn, current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /tags/add
+
+       Add tags to every contact of the current user matching the given criteria.
+
+       :param body: `where`, the criteria of `/bulk/delete`, and `tags`, the tags to add. Tags are trimmed and lowercased, and created on first use.
+       :type body: TagsIn
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: The number of contacts matching the criteria.
+       :rtype: BulkOut
+
+       **Notes**:
+
+       The contacts are tagged a few hundred at a time with one set-based statement each; tags a contact already has are kept once.
+    """
+    return {"count": await contacts_db.tag_contacts(body.where, body.tags, current_user, db)}
+
+
+@router.post("/tags/remove", response_model=BulkOut)
+async def untag_contacts(body: TagsIn, current_user: User = Depends(auth_service.get_current_user),
+                         db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /tags/remove
+
+       Remove tags from every contact of the current user matching the given criteria.
+
+       :param body: `where`, the criteria of `/bulk/delete`, and `tags`, the tags to remove.
+       :type body: TagsIn
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: The number of contacts matching the criteria; 0 if the user has none of the tags.
+       :rtype: BulkOut
+    """
+    return {"count": await contacts_db.untag_contacts(body.where, body.tags, current_user, db)}
+
+
+@router.get("/birthdays", response_model=list[ContactOut])
+async def read_upcoming_birthdays(days: int = Query(default=7, ge=0, le=366),
+                                  current_user: User = Depends(auth_service.get_current_user),
+                                  db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /birthdays?days={days}
+
+       Retrieve the contacts of the current user whose birthday is within the next `days` days.
+
+       :param days: Length of the window starting today, 7 by default.
+       :type days: int, optional
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A list of `ContactOut` objects ordered by the upcoming birthday.
+       :rtype: List[ContactOut]
+       :raises HTTPException: If no birthday falls within the window, an HTTPException with a 404 status code is raised.
+
+       **Notes**:
+
+       Windows crossing New Year are supported. In non-leap years birthdays on February 29 are listed on February 28.
+    """
+    contacts = await contacts_db.get_upcoming_birthdays(days, current_user, db)
+    if contacts:
+        return contacts
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
+
+
+@router.get("/changes", response_model=ChangesOut)
+async def read_changes(since: str | None = None,
+                       limit: int = Query(default=500, ge=1, le=1000),
+                       current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /changes?since={token}&limit={limit}
+
+       Retrieve the contacts of the current user created, updated or deleted since the previous sync.
+
+       :param since: The `next_token` of the previous response. Omit it to get every contact.
+       :type since: str, optional
+       :param limit: Maximum number of contacts and of deleted IDs in one page, 500 by default.
+       :type limit: int, optional
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A `ChangesOut` object with the changed contacts, the IDs of the deleted ones, the token of the next sync and whether more changes are waiting.
+       :rtype: ChangesOut
+       :raises HTTPException: If the token is malformed, an HTTPException with a 400 status code is raised. If it is older than the tombstone retention, an HTTPException with a 410 status code is raised and the client has to sync from scratch.
+
+       **Notes**:
+
+       Request again with `next_token` while `has_more` is true. A contact is sent again whenever it or one of its phones or emails changes, and the last few seconds of changes may be repeated on the next sync, so clients should upsert by ID.
+    """
+    try:
+        cursors = decode_sync_token(since) if since else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid sync token.")
+    changes = await contacts_db.get_changes(cursors, limit, current_user, db, settings.sync_tombstone_days)
+    if changes is None:
+        raise HTTPException(status_code=status.HTTP_410_GONE, detail="Sync token expired.")
+    return changes
+
+
+@router.get("/events", response_class=StreamingResponse)
+async def stream_events(current_user: User = Depends(auth_service.get_current_user)):
+    """
+    .. http:get:: /events
+
+       Stream the changes of the contacts of the current user as Server-Sent Events.
+
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :return: A `text/event-stream` response with one `data` event per change, e.g. `{"type": "updated", "contact_id": 1}`. The type is `created`, `updated` or `deleted`; phone and email writes are reported as `updated` events of their contact.
+       :rtype: StreamingResponse
+       :raises HTTPException: If the change events are not available on this server, an HTTPException with a 503 status code is raised.
+
+       **Notes**:
+
+       Events are hints to sync: on every event, and on a `resync` event sent when a client falls too far behind, clients should fetch `/contacts/changes`. A comment line is sent every 15 seconds to keep idle connections open.
+    """
+    if not change_broker.started:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Change events unavailable.")
+    return StreamingResponse(event_stream(change_broker, current_user.id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_contacts(version: str = Query(default="3.0", pattern=r"^(3\.0|4\.0)$"),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /export?version={version}
+
+       Download every contact of the current user with its phones and emails as a vCard file.
+
+       :param version: vCard version, `3.0` (default) or `4.0`.
+       :type version: str, optional
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A `text/vcard` attachment named `contacts.vcf`.
+       :rtype: StreamingResponse
+
+       **Notes**:
+
+       The cards are generated while they are sent, one batch of contacts read from a server-side cursor at a time, so large address books start downloading at once and are never held in memory.
+    """
+    return StreamingResponse(write_cards(contacts_db.stream_contacts(current_user, db), version),
+                             media_type="text/vcard",
+                             headers={"Content-Disposition": 'attachment; filename="contacts.vcf"'})
+
+
+@router.post("/import", status_code=status.HTTP_201_CREATED)
+async def import_contacts(file: UploadFile = File(),
+                          current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_session)):
+    """
+    .. http:post:: /import
+
+       Create contacts of the current user from an uploaded vCard (`.vcf`) file.
+
+       :param file: vCard 3.0 or 4.0 file with any number of cards.
+       :type file: UploadFile
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A message with the number of imported cards and of the cards skipped because a field is invalid.
+       :rtype: dict
+       :raises HTTPException: If the file is not a vCard file, an HTTPException with a 400 status code is raised. Batches imported before the malformed part are kept.
+
+       **Notes**:
+
+       The file is parsed while it is read and the contacts are inserted 500 at a time, each batch in its own transaction.
+    """
+    async def save_batch(cards: list) -> int:
+        return await contacts_db.add_contacts_batch(cards, current_user, db)
+
+    try:
+        counts = await import_cards(read_chunks(file), save_batch)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid vCard file.")
+    return {"detail": "Contacts imported sucsessfully.", **counts}
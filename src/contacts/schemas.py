@@ -1,12 +1,20 @@
-from pydantic import BaseModel, Field
-from datetime import date
+from functools import lru_cache
+from typing import Annotated
+
+from pydantic import BaseModel, Field, StringConstraints, TypeAdapter, create_model, field_validator, \
+    model_validator
+from datetime import date, datetime, timezone
 
 from src.phones.schemas import PhoneOut
 from src.emails.schemas import EmailOut
+from src.contacts.service import parse_sort
 
 
 # Input pydantic schemas
 
+# tags are matched exactly, so "Work " and "work" are the same tag
+TagName = Annotated[str, StringConstraints(strip_whitespace=True, to_lower=True, min_length=1, max_length=50)]
+
 
 class ContactIn(BaseModel):
     first_name: str = Field(min_length=2, max_length=50, default="First name")
@@ -15,6 +23,95 @@ class ContactIn(BaseModel):
     description: str | None = Field(max_length=300, default="Description")
 
 
+class MergeIn(BaseModel):
+    survivor_id: int
+    duplicate_ids: list[int] = Field(min_length=1)
+
+
+class ContactsFilterIn(BaseModel):
+    # the criteria are combined, and at least one is required so a bulk operation never hits a whole book by mistake
+    ids: list[int] | None = Field(min_length=1, max_length=10000, default=None)
+    search: str | None = Field(min_length=1, default=None)
+    without_phones: bool = False
+    without_emails: bool = False
+    # contacts with at least one of the tags, and contacts with every one of them
+    tags_any: list[TagName] | None = Field(min_length=1, max_length=50, default=None)
+    tags_all: list[TagName] | None = Field(min_length=1, max_length=50, default=None)
+
+    @model_validator(mode="after")
+    def check_criteria(self):
+        if self.ids is None and self.search is None and not self.without_phones and not self.without_emails \
+                and self.tags_any is None and self.tags_all is None:
+            raise ValueError("At least one of ids, search, without_phones, without_emails, tags_any and tags_all "
+                             "is required.")
+        return self
+
+
+class ContactsQueryIn(BaseModel):
+    # the filters of /contacts/read, all optional and combined
+    name: str | None = Field(min_length=1, max_length=50, default=None)
+    has_phone: bool | None = None
+    has_email: bool | None = None
+    has_birthday: bool | None = None
+    born_from: date | None = None
+    born_to: date | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    tags_any: list[TagName] | None = Field(min_length=1, max_length=50, default=None)
+    tags_all: list[TagName] | None = Field(min_length=1, max_length=50, default=None)
+    sort: str = "id"
+
+    @field_validator("sort")
+    @classmethod
+    def check_sort(cls, sort: str):
+        parse_sort(sort)
+        return sort
+
+    @field_validator("created_from", "created_to")
+    @classmethod
+    def to_naive_utc(cls, value: datetime | None):
+        # created_at is stored without a time zone, in UTC (the time zone of the database sessions, see
+        # build_engine_options); an offset given with the bound is applied to it
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @model_validator(mode="after")
+    def check_ranges(self):
+        for start, end in (("born_from", "born_to"), ("created_from", "created_to")):
+            if getattr(self, start) is not None and getattr(self, end) is not None \
+                    and getattr(self, start) > getattr(self, end):
+                raise ValueError(f"{start} is after {end}.")
+        # a birthday sort only lists the contacts with a birthday
+        if self.has_birthday is False and self.sort.removeprefix("-") == "birthday":
+            raise ValueError("has_birthday=false cannot be sorted by birthday.")
+        return self
+
+
+class ContactPatchIn(BaseModel):
+    # only the fields that are set are written
+    first_name: str = Field(min_length=2, max_length=50, default=None)
+    last_name: str | None = Field(min_length=2, max_length=50, default=None)
+    birthday: date | None = None
+    description: str | None = Field(max_length=300, default=None)
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if not self.model_fields_set:
+            raise ValueError("At least one field to update is required.")
+        return self
+
+
+class BulkUpdateIn(BaseModel):
+    where: ContactsFilterIn
+    values: ContactPatchIn
+
+
+class TagsIn(BaseModel):
+    where: ContactsFilterIn
+    tags: list[TagName] = Field(min_length=1, max_length=50)
+
+
 # Output pydantic schemas
 
 class ContactOut(ContactIn):
@@ -24,3 +121,38 @@ class ContactOut(ContactIn):
 
     class Config:
         from_attributes = True
+
+
+@lru_cache(maxsize=None)
+def contact_fields_adapter(fields: tuple[str, ...]) -> TypeAdapter:
+    # one reduced ContactOut per distinct field set, built on first use
+    model = create_model("ContactFieldsOut", **{name: (ContactOut.model_fields[name].annotation, ...)
+                                                  for name in fields})
+    return TypeAdapter(list[model])
+
+
+class BulkOut(BaseModel):
+    count: int
+
+
+class TagOut(BaseModel):
+    name: str
+    contacts: int
+
+
+class AutocompleteOut(BaseModel):
+    id: int
+    name: str
+
+
+class DuplicateGroupOut(BaseModel):
+    contact_ids: list[int]
+    survivor_id: int
+    reasons: list[str]
+
+
+class ChangesOut(BaseModel):
+    contacts: list[ContactOut]
+    deleted: list[int]
+    next_token: str
+    has_more: bool
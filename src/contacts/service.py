@@ -0,0 +1,367 @@
+import base64
+import calendar
+import json
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from difflib import SequenceMatcher
+from typing import Iterable
+
+from src.contacts.names import normalize_name
+from src.contacts.phonetic import metaphone, edit_distance
+
+# trailing digits of a phone number used as its blocking key, so "+38 050 123 45 67" and "050-123-45-67" collide
+PHONE_KEY_DIGITS = 9
+# blocks bigger than this are shared numbers/addresses (switchboards, info@...) rather than duplicates
+MAX_BLOCK_SIZE = 50
+NAME_SIMILARITY = 0.8
+# a word of a fuzzy search matches a name with one typo, or one per three characters of longer words
+FUZZY_TYPOS = 1
+FUZZY_TYPO_LENGTH = 3
+# changes committed later than they were stamped (long transactions, clock skew between writers) land this far
+# behind the newest row at most; a caught-up sync cursor is kept this far back so they are sent on the next sync
+SYNC_SAFETY_LAG = timedelta(seconds=5)
+SYNC_EPOCH = datetime(1970, 1, 1)
+# fields of ContactOut that can be picked with ?fields=, in output order; the last two are child collections
+CONTACT_FIELDS = ("id", "first_name", "last_name", "birthday", "description", "emails", "phones")
+CHILD_FIELDS = ("emails", "phones")
+# sort keys of /contacts/read with the types of their keyset values; each is the tail of an index of contacts
+SORT_KEYS = {
+    "id": (int,),
+    "first_name": (str, str, int),
+    "last_name": (str, str, int),
+    "birthday": (int, int),
+    "created": (datetime, int),
+}
+
+_non_digits = re.compile(r'\D')
+_gmail_domains = {"gmail.com", "googlemail.com"}
+
+
+def normalize_phone(number: str) -> str:
+    """
+    Reduce a phone number to its digits, dropping the ``00`` international prefix.
+
+    :param number: Phone number as entered by the user.
+    :type number: str
+    :return: The digits of the number.
+    :rtype: str
+    """
+    digits = _non_digits.sub('', number)
+    if digits.startswith('00'):
+        digits = digits[2:]
+    return digits
+
+
+def normalize_email(address: str) -> str:
+    """
+    Lowercase an email address and drop its ``+tag`` (and the dots of a Gmail local part).
+
+    :param address: Email address as entered by the user.
+    :type address: str
+    :return: The normalized address.
+    :rtype: str
+    """
+    address = address.strip().lower()
+    local, _, domain = address.rpartition('@')
+    if not local:
+        return address
+    local = local.split('+', 1)[0]
+    if domain in _gmail_domains:
+        local = local.replace('.', '')
+    return f'{local}@{domain}'
+
+
+def rank_fuzzy_matches(tokens: list[str], candidates: Iterable[tuple[int, str | None, str | None]]) -> list[int]:
+    """
+    Order the candidates of a fuzzy search by the edit distance of their names to the words searched for.
+
+    Every word searched for is matched with the closest word of the name: a word that sounds the same, or
+    starts the same, so "alex" matches "Alexander", is as close as an equal one. Candidates with a word searched
+    for that is further than ``FUZZY_TYPOS`` per ``FUZZY_TYPO_LENGTH`` characters from all of their words are
+    left out; among matches as close, the edit distance of whole words decides.
+
+    :param tokens: Normalized words searched for.
+    :type tokens: list[str]
+    :param candidates: ``(id, first_name_normalized, last_name_normalized)`` of the contacts.
+    :type candidates: Iterable[tuple[int, str | None, str | None]]
+    :return: Ids of the matching candidates, closest first.
+    :rtype: list[int]
+    """
+    token_keys = [(token, metaphone(token), max(FUZZY_TYPOS, len(token) // FUZZY_TYPO_LENGTH)) for token in tokens]
+    ranked = []
+    for contact_id, first_name, last_name in candidates:
+        words = [(word, metaphone(word)) for word in f"{first_name or ''} {last_name or ''}".split()]
+        distance = whole_distance = 0
+        for token, key, typos in token_keys:
+            whole = min((edit_distance(token, word) for word, _ in words), default=len(token))
+            closest = min((0 if key and word_key == key else edit_distance(token, word[:len(token)])
+                           for word, word_key in words), default=len(token))
+            closest = min(closest, whole)
+            if closest > typos:
+                break
+            distance += closest
+            whole_distance += whole
+        else:
+            ranked.append((distance, whole_distance, contact_id))
+    return [contact_id for *_, contact_id in sorted(ranked)]
+
+
+def names_match(first: tuple[str, str], second: tuple[str, str]) -> bool:
+    """
+    Compare two normalized ``(first_name, last_name)`` pairs.
+
+    A missing last name on either side is ignored, so "John" matches "John Smith".
+    """
+    if not first[1] or not second[1]:
+        first, second = (first[0], ''), (second[0], '')
+    first_full, second_full = ' '.join(first).strip(), ' '.join(second).strip()
+    if first_full == second_full:
+        return True
+    return SequenceMatcher(None, first_full, second_full).ratio() >= NAME_SIMILARITY
+
+
+def birthday_key(day: date) -> int:
+    return day.month * 100 + day.day
+
+
+def birthday_key_ranges(today: date, days: int) -> list[tuple[int, int]]:
+    """
+    Ranges of ``Contact.birthday_key`` for the birthdays from ``today`` to ``today + days`` inclusive.
+
+    A window that crosses New Year is split in two ranges. In a non-leap year the Feb 29 birthdays are
+    celebrated on Feb 28, so a window ending on Feb 28 also takes in key 229.
+
+    :param today: First day of the window.
+    :type today: date
+    :param days: Length of the window in days.
+    :type days: int
+    :return: Inclusive ``(start, end)`` key ranges, or an empty list when the window covers the whole year.
+    :rtype: list[tuple[int, int]]
+    """
+    if days >= 365:
+        return []
+    last_day = today + timedelta(days=days)
+    start, end = birthday_key(today), birthday_key(last_day)
+    if end == 228 and not calendar.isleap(last_day.year):
+        end = 229
+    if last_day.year == today.year:
+        return [(start, end)]
+    return [(start, 1231), (101, end)]
+
+
+class _DisjointSet:
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        while parent != self.parent[parent]:
+            self.parent[parent] = self.parent[self.parent[parent]]
+            parent = self.parent[parent]
+        return parent
+
+    def union(self, first, second):
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def find_duplicate_groups(contacts: Iterable[tuple[int, str, str | None]],
+                          phones: Iterable[tuple[int, str]],
+                          emails: Iterable[tuple[int, str]]) -> list[dict]:
+    """
+    Group contacts that are likely the same person.
+
+    Contacts are put into blocks keyed by normalized phone, normalized email and normalized full name in one
+    pass. Only contacts that share a block are compared, and only by name, so the work is linear in the
+    number of contacts instead of comparing every pair.
+
+    :param contacts: ``(id, first_name, last_name)`` rows.
+    :type contacts: Iterable[tuple[int, str, str | None]]
+    :param phones: ``(contact_id, number)`` rows.
+    :type phones: Iterable[tuple[int, str]]
+    :param emails: ``(contact_id, address)`` rows.
+    :type emails: Iterable[tuple[int, str]]
+    :return: Groups with ``contact_ids``, the suggested ``survivor_id`` and the ``reasons`` they were grouped by.
+    :rtype: list[dict]
+    """
+    names = {contact_id: (normalize_name(first_name), normalize_name(last_name))
+             for contact_id, first_name, last_name in contacts}
+    children = defaultdict(int)
+    blocks = defaultdict(list)
+
+    for contact_id, number in phones:
+        children[contact_id] += 1
+        digits = normalize_phone(number)
+        if len(digits) >= 7:
+            blocks[('phone', digits[-PHONE_KEY_DIGITS:])].append(contact_id)
+    for contact_id, address in emails:
+        children[contact_id] += 1
+        blocks[('email', normalize_email(address))].append(contact_id)
+    for contact_id, (first_name, last_name) in names.items():
+        if first_name and last_name:
+            blocks[('name', f'{first_name} {last_name}')].append(contact_id)
+
+    groups = _DisjointSet()
+    matches = []
+    for (reason, _), members in blocks.items():
+        members = list(dict.fromkeys(member for member in members if member in names))
+        if len(members) < 2 or len(members) > MAX_BLOCK_SIZE:
+            continue
+        for i, member in enumerate(members):
+            for other in members[:i]:
+                if groups.find(member) == groups.find(other) or reason == 'name' \
+                        or names_match(names[member], names[other]):
+                    groups.union(member, other)
+                    matches.append((member, reason))
+
+    reasons = defaultdict(set)
+    for member, reason in matches:
+        reasons[groups.find(member)].add(reason)
+
+    clusters = defaultdict(list)
+    for contact_id in groups.parent:
+        clusters[groups.find(contact_id)].append(contact_id)
+
+    result = []
+    for root, contact_ids in clusters.items():
+        if len(contact_ids) < 2:
+            continue
+        contact_ids.sort()
+        survivor_id = max(contact_ids, key=lambda contact_id: (children[contact_id], -contact_id))
+        result.append({"contact_ids": contact_ids, "survivor_id": survivor_id, "reasons": sorted(reasons[root])})
+    result.sort(key=lambda group: group["contact_ids"][0])
+    return result
+
+
+def encode_sync_token(contacts_after: tuple[datetime, int], deleted_after: tuple[datetime, int]) -> str:
+    """
+    Pack the two keyset cursors of a delta sync into an opaque url-safe token.
+
+    :param contacts_after: ``(updated_at, id)`` of the last contact sent.
+    :type contacts_after: tuple[datetime, int]
+    :param deleted_after: ``(deleted_at, id)`` of the last tombstone sent.
+    :type deleted_after: tuple[datetime, int]
+    :return: The token to pass as ``since`` on the next sync.
+    :rtype: str
+    """
+    payload = {"c": [contacts_after[0].isoformat(), contacts_after[1]],
+               "d": [deleted_after[0].isoformat(), deleted_after[1]]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_sync_token(token: str) -> tuple[tuple[datetime, int], tuple[datetime, int]]:
+    """
+    Unpack a token made by :func:`encode_sync_token`.
+
+    :param token: Token received from the client.
+    :type token: str
+    :return: The contacts and the tombstones cursors.
+    :rtype: tuple[tuple[datetime, int], tuple[datetime, int]]
+    :raises ValueError: If the token is malformed.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return tuple((datetime.fromisoformat(payload[key][0]), int(payload[key][1])) for key in ("c", "d"))
+    except (TypeError, KeyError, IndexError, AttributeError, ValueError) as err:
+        raise ValueError("Malformed sync token") from err
+
+
+def next_sync_cursor(last: tuple[datetime, int], has_more: bool, now: datetime) -> tuple[datetime, int]:
+    """
+    Cursor to resume a change stream from.
+
+    While there are more pages the cursor follows the last row sent. Once the stream is caught up it is held
+    :data:`SYNC_SAFETY_LAG` behind ``now``, so the rows of the last few seconds are sent again next time
+    instead of missing the ones that were committed out of order. Clients upsert, so repeats are harmless.
+
+    :param last: Cursor of the last row sent, or the previous cursor if none was.
+    :type last: tuple[datetime, int]
+    :param has_more: Whether the stream has more rows after ``last``.
+    :type has_more: bool
+    :param now: Current time of the database.
+    :type now: datetime
+    :return: The next cursor.
+    :rtype: tuple[datetime, int]
+    """
+    if has_more:
+        return last
+    return min(last, (now - SYNC_SAFETY_LAG, 0))
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...] | None:
+    """
+    Parse a ``?fields=`` parameter into the fields of :class:`ContactOut` to return.
+
+    :param fields: Comma separated field names, e.g. ``id,first_name,last_name``.
+    :type fields: str | None
+    :return: The requested fields in output order, always with ``id``, or None for every field.
+    :rtype: tuple[str, ...] | None
+    :raises ValueError: If a name is not a field of a contact.
+    """
+    if not fields:
+        return None
+    requested = {name.strip() for name in fields.split(',') if name.strip()}
+    unknown = requested.difference(CONTACT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return tuple(name for name in CONTACT_FIELDS if name in requested or name == "id")
+
+
+def parse_sort(sort: str) -> tuple[str, bool]:
+    """
+    Parse a ``?sort=`` parameter.
+
+    :param sort: A key of :data:`SORT_KEYS`, prefixed with ``-`` for descending order.
+    :type sort: str
+    :return: The key and whether the order is descending.
+    :rtype: tuple[str, bool]
+    :raises ValueError: If the key is not a sort key.
+    """
+    key = sort.removeprefix('-')
+    if key not in SORT_KEYS:
+        raise ValueError(f"Unknown sort key: {key}, expected one of {', '.join(SORT_KEYS)}")
+    return key, sort.startswith('-')
+
+
+def encode_page_cursor(sort: str, values: tuple) -> str:
+    """
+    Pack the keyset values of the last contact of a page into an opaque url-safe cursor.
+
+    :param sort: The ``?sort=`` parameter of the page.
+    :type sort: str
+    :param values: Values of the sort key of the last contact, ending with its id.
+    :type values: tuple
+    :return: The cursor to pass as ``after`` for the next page.
+    :rtype: str
+    """
+    payload = {"s": sort, "v": [value.isoformat() if isinstance(value, datetime) else value for value in values]}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_page_cursor(token: str, sort: str) -> tuple:
+    """
+    Unpack a cursor made by :func:`encode_page_cursor`.
+
+    :param token: Cursor received from the client.
+    :type token: str
+    :param sort: The ``?sort=`` parameter of the request, which must be the one of the cursor.
+    :type sort: str
+    :return: The keyset values to continue after.
+    :rtype: tuple
+    :raises ValueError: If the cursor is malformed or was made for another sort.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        types = SORT_KEYS[parse_sort(payload["s"])[0]]
+        if payload["s"] != sort or len(payload["v"]) != len(types):
+            raise ValueError("Cursor of another sort")
+        values = tuple(datetime.fromisoformat(value) if kind is datetime else value
+                       for kind, value in zip(types, payload["v"]))
+    except (TypeError, KeyError, AttributeError, ValueError) as err:
+        raise ValueError("Malformed page cursor") from err
+    if not all(isinstance(value, kind) and not isinstance(value, bool) for kind, value in zip(types, values)):
+        raise ValueError("Malformed page cursor")
+    return values
@@ -0,0 +1,251 @@
+"""
+vCard 3.0 / 4.0 (RFC 2426 / RFC 6350) reading and writing.
+
+Both directions work on streams: cards are written one batch of contacts at a time and read line by line
+from the chunks of an upload, so neither side ever holds the whole file.
+"""
+import codecs
+from datetime import date
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Iterable
+
+from pydantic import ValidationError
+
+from src.contacts.schemas import ContactIn
+from src.emails.schemas import EmailIn
+from src.phones.schemas import PhoneIn
+
+# RFC 6350 3.2: lines longer than 75 octets should be folded
+FOLD_OCTETS = 75
+# a line this long is not a contact card, stop before it fills the memory
+MAX_LINE_LENGTH = 1 << 20
+CHUNK_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(',', '\\,').replace(';', '\\;') \
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def unescape(value: str) -> str:
+    result, chars = [], iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            result.append('\n' if char in 'nN' else char)
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def split_components(value: str) -> list[str]:
+    parts, start, escaped = [], 0, False
+    for i, char in enumerate(value):
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == ';':
+            parts.append(value[start:i])
+            start = i + 1
+    parts.append(value[start:])
+    return [unescape(part) for part in parts]
+
+
+def fold(line: str) -> str:
+    encoded = line.encode()
+    if len(encoded) <= FOLD_OCTETS:
+        return line + '\r\n'
+    parts, start, limit = [], 0, FOLD_OCTETS
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # never split a multi-byte character: continuation bytes look like 0b10xxxxxx
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, FOLD_OCTETS - 1
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_card(contact, phones: Iterable[str], emails: Iterable[str], version: str = "3.0") -> str:
+    """
+    Write one contact as a vCard.
+
+    :param contact: Row with ``first_name``, ``last_name``, ``birthday`` and ``description``.
+    :param phones: Phone numbers of the contact.
+    :type phones: Iterable[str]
+    :param emails: Email addresses of the contact.
+    :type emails: Iterable[str]
+    :param version: ``3.0`` or ``4.0``.
+    :type version: str
+    :return: The folded card with CRLF line endings.
+    :rtype: str
+    """
+    full_name = ' '.join(name for name in (contact.first_name, contact.last_name) if name)
+    lines = ["BEGIN:VCARD", f"VERSION:{version}", f"FN:{escape(full_name)}",
+             f"N:{escape(contact.last_name or '')};{escape(contact.first_name or '')};;;"]
+    if contact.birthday:
+        lines.append(f"BDAY:{contact.birthday.strftime('%Y%m%d' if version == '4.0' else '%Y-%m-%d')}")
+    for number in phones:
+        lines.append(f"TEL;VALUE=text:{escape(number)}" if version == "4.0" else f"TEL:{escape(number)}")
+    for address in emails:
+        lines.append(f"EMAIL:{escape(address)}" if version == "4.0" else f"EMAIL;TYPE=INTERNET:{escape(address)}")
+    if contact.description:
+        lines.append(f"NOTE:{escape(contact.description)}")
+    lines.append("END:VCARD")
+    return ''.join(fold(line) for line in lines)
+
+
+async def write_cards(batches: AsyncIterable[list[tuple]], version: str = "3.0") -> AsyncIterator[str]:
+    async for batch in batches:
+        yield ''.join(format_card(contact, phones, emails, version) for contact, phones, emails in batch)
+
+
+async def read_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    buffer = ''
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split('\n')
+        for line in lines:
+            yield line.rstrip('\r')
+        if len(buffer) > MAX_LINE_LENGTH:
+            raise ValueError("vCard line too long")
+    buffer += decoder.decode(b'', final=True)
+    if buffer:
+        yield buffer.rstrip('\r')
+
+
+async def unfold(lines: AsyncIterable[str]) -> AsyncIterator[str]:
+    current = None
+    async for line in lines:
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            if len(current) > MAX_LINE_LENGTH:
+                raise ValueError("vCard line too long")
+            continue
+        if current:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_property(line: str) -> tuple[str, str]:
+    quoted = False
+    for i, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            name = line[:i].split(';', 1)[0]
+            # "item1.TEL" -> "TEL"
+            return name.rsplit('.', 1)[-1].upper(), line[i + 1:]
+    return line.upper(), ''
+
+
+def parse_birthday(value: str) -> date | None:
+    # "--0501" (no year) cannot be stored as a date and is dropped
+    digits = value[:10].replace('-', '')
+    if len(digits) != 8 or not digits.isdigit():
+        return None
+    try:
+        return date(int(digits[:4]), int(digits[4:6]), int(digits[6:]))
+    except ValueError:
+        return None
+
+
+async def read_cards(chunks: AsyncIterable[bytes]) -> AsyncIterator[dict]:
+    """
+    Parse vCards from the chunks of a file.
+
+    :param chunks: Raw bytes of the file, in pieces of any size.
+    :type chunks: AsyncIterable[bytes]
+    :return: One dict per card with ``fn``, ``n``, ``bday``, ``note``, ``tel`` and ``email``.
+    :rtype: AsyncIterator[dict]
+    :raises ValueError: If a line is longer than :data:`MAX_LINE_LENGTH`.
+    """
+    card = None
+    async for line in unfold(read_lines(chunks)):
+        name, value = parse_property(line)
+        if name == 'BEGIN' and value.strip().upper() == 'VCARD':
+            card = {"fn": None, "n": None, "bday": None, "note": None, "tel": [], "email": []}
+        elif name == 'END' and value.strip().upper() == 'VCARD':
+            if card is not None:
+                yield card
+            card = None
+        elif card is None:
+            continue
+        elif name in ('TEL', 'EMAIL'):
+            value = unescape(value).strip()
+            if name == 'TEL' and value.lower().startswith('tel:'):
+                value = value[4:]
+            if value:
+                card[name.lower()].append(value)
+        elif name == 'N':
+            card["n"] = [part.strip() for part in split_components(value)]
+        elif name == 'FN':
+            card["fn"] = unescape(value).strip()
+        elif name == 'BDAY':
+            card["bday"] = parse_birthday(value.strip())
+        elif name == 'NOTE':
+            card["note"] = unescape(value)
+
+
+def card_to_schemas(card: dict) -> tuple[ContactIn, list[PhoneIn], list[EmailIn]]:
+    """
+    Validate a parsed card with the schemas of the contact, phone and email routes.
+
+    :param card: Card from :func:`read_cards`.
+    :type card: dict
+    :return: The contact with its phones and emails.
+    :rtype: tuple[ContactIn, list[PhoneIn], list[EmailIn]]
+    :raises pydantic.ValidationError: If a field does not fit its schema.
+    """
+    family, given = ((card["n"] or []) + ['', ''])[:2]
+    if not given:
+        # cards of companies and some phones fill only FN or the family name
+        given, _, family = (card["fn"] or family).partition(' ')
+        family = family.strip()
+    contact = ContactIn(first_name=given, last_name=family or None, birthday=card["bday"],
+                        description=card["note"] or None)
+    return contact, [PhoneIn(number=number) for number in card["tel"]], \
+        [EmailIn(address=address) for address in card["email"]]
+
+
+async def read_chunks(file, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+    while chunk := await file.read(chunk_size):
+        yield chunk
+
+
+async def import_cards(chunks: AsyncIterable[bytes],
+                       save_batch: Callable[[list], Awaitable[int]],
+                       batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    """
+    Validate the cards of a file and save them ``batch_size`` at a time.
+
+    Only one batch of cards is held at once, so memory does not grow with the file. Cards that do not fit the
+    schemas are skipped; the batches saved before a malformed line stay saved.
+
+    :param chunks: Raw bytes of the file.
+    :type chunks: AsyncIterable[bytes]
+    :param save_batch: Saves a list of validated cards and returns how many were saved.
+    :type save_batch: Callable[[list], Awaitable[int]]
+    :param batch_size: Number of cards per batch.
+    :type batch_size: int
+    :return: Counts of the ``imported`` and ``skipped`` cards.
+    :rtype: dict
+    :raises ValueError: If a line is longer than :data:`MAX_LINE_LENGTH`.
+    """
+    imported = skipped = 0
+    batch = []
+    async for card in read_cards(chunks):
+        try:
+            batch.append(card_to_schemas(card))
+        except ValidationError:
+            skipped += 1
+            continue
+        if len(batch) >= batch_size:
+            imported += await save_batch(batch)
+            batch = []
+    imported += await save_batch(batch)
+    return {"imported": imported, "skipped": skipped}
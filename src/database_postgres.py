@@ -1,26 +1,167 @@
 import asyncio
+import itertools
+import logging
+from contextlib import asynccontextmanager
+from typing import Hashable
 
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import AsyncSession, AsyncEngine
+from redis.exceptions import RedisError
 
-from src.config import settings as s
+from src.config import Settings, settings as s
+from src.database_redis import RedisConnector, redis_db
 
 from src.models import Base
 
-postgres_database_url = f'postgresql+asyncpg://{s.postgres_user}:{s.postgres_password}' \
-                        f'@{s.postgres_host}:{s.postgres_port}/{s.postgres_db}'
-engine = create_async_engine(postgres_database_url, echo=False)
-async_session = async_sessionmaker(engine, expire_on_commit=False)
+logger = logging.getLogger(__name__)
+
+PIN_PREFIX = "primary_pin:"
+
+
+def build_database_url(settings: Settings) -> str:
+    return f'postgresql+asyncpg://{settings.postgres_user}:{settings.postgres_password}' \
+           f'@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}'
+
+
+def build_engine_options(settings: Settings) -> dict:
+    # the naive DateTime columns hold UTC: now() defaults are written in the wall time of the session, so every
+    # session runs in UTC whatever the time zone of the server
+    return {"pool_size": settings.postgres_pool_size, "max_overflow": settings.postgres_max_overflow,
+            "pool_pre_ping": True, "connect_args": {"server_settings": {"timezone": "UTC"}}}
+
+
+class PrimaryPins:
+    """
+    Keys (user ids or emails) that wrote recently and must keep reading from the primary
+    until their replicas have caught up.
+
+    A pin is a Redis key expiring with the window, so the next request of the user is routed the same way whichever
+    worker serves it. When Redis cannot be reached, the reads go to the primary.
+    """
+
+    def __init__(self, redis_connector: RedisConnector, window: float):
+        self.redis_connector = redis_connector
+        self.window = window
+
+    async def pin(self, key: Hashable):
+        milliseconds = int(self.window * 1000)
+        if milliseconds <= 0:
+            return
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            await redis.set(f"{PIN_PREFIX}{key}", 1, px=milliseconds)
+        except RedisError:
+            logger.warning("cannot pin %s to the primary", key, exc_info=True)
+
+    async def is_pinned(self, key: Hashable) -> bool:
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            return bool(await redis.exists(f"{PIN_PREFIX}{key}"))
+        except RedisError:
+            logger.warning("cannot read the pin of %s, reading from the primary", key, exc_info=True)
+            return True
+
+
+class PostgresConnector:
+
+    def __init__(self, database_url, replica_urls=(), read_your_writes_window=5, **engine_options):
+        self.configure(database_url, replica_urls, read_your_writes_window, **engine_options)
+
+    def configure(self, database_url, replica_urls=(), read_your_writes_window=5, **engine_options):
+        self.database_url = database_url
+        self.replica_urls = list(replica_urls)
+        self.engine_options = engine_options
+        self.engine = None
+        self.session_maker = None
+        self.replica_engines = None
+        self.replica_session_makers = None
+        self.pins = PrimaryPins(redis_db, read_your_writes_window)
+        self._next_replica = itertools.count()
+
+    def get_engine(self) -> AsyncEngine:
+        # the engine (and with it the asyncpg driver) is only created on first use
+        if self.engine is None:
+            self.engine = create_async_engine(self.database_url, echo=False, **self.engine_options)
+            self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        return self.engine
+
+    def get_session_maker(self) -> async_sessionmaker:
+        self.get_engine()
+        return self.session_maker
+
+    def get_replica_session_maker(self) -> async_sessionmaker | None:
+        """
+        Pick the next replica round-robin.
+
+        :return: A session maker bound to a replica, or None when no replica is configured.
+        :rtype: async_sessionmaker | None
+        """
+        if not self.replica_urls:
+            return None
+        if self.replica_session_makers is None:
+            self.replica_engines = [create_async_engine(url, echo=False, **self.engine_options)
+                                    for url in self.replica_urls]
+            self.replica_session_makers = [async_sessionmaker(engine, expire_on_commit=False)
+                                           for engine in self.replica_engines]
+        return self.replica_session_makers[next(self._next_replica) % len(self.replica_session_makers)]
+
+    async def dispose(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+            self.session_maker = None
+        if self.replica_engines is not None:
+            for engine in self.replica_engines:
+                await engine.dispose()
+            self.replica_engines = None
+            self.replica_session_makers = None
+
+
+postgres_database_url = build_database_url(s)
+postgres_db = PostgresConnector(postgres_database_url, s.postgres_replica_urls, s.read_your_writes_window,
+                                **build_engine_options(s))
 
 
 async def get_session() -> AsyncSession:
-    async with async_session() as session:
+    async with postgres_db.get_session_maker()() as session:
+        yield session
+
+
+@asynccontextmanager
+async def read_session(key: Hashable, session: AsyncSession):
+    """
+    Session for a read-only repository call.
+
+    Yields a session on one of the replicas, or the given primary session when no replica is configured or
+    ``key`` wrote within the read-your-writes window.
+
+    :param key: The user id (or email for user lookups) the read is made for.
+    :type key: Hashable
+    :param session: The primary session of the request.
+    :type session: AsyncSession
+    """
+    pinned = postgres_db.replica_urls and await postgres_db.pins.is_pinned(key)
+    session_maker = None if pinned else postgres_db.get_replica_session_maker()
+    if session_maker is None:
         yield session
-    await engine.dispose()
+    else:
+        async with session_maker() as replica_session:
+            yield replica_session
+
+
+async def pin_to_primary(key: Hashable):
+    """
+    Send the reads of ``key`` to the primary for the read-your-writes window, once a write has been committed.
+
+    :param key: The user id (or email for user writes) that has just written.
+    :type key: Hashable
+    """
+    if postgres_db.replica_urls:
+        await postgres_db.pins.pin(key)
 
 
 async def database_create():
-    async with engine.begin() as conn:
+    async with postgres_db.get_engine().begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
 
@@ -32,5 +173,3 @@ async def main():
 if __name__ == '__main__':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
     asyncio.run(main())
-
-
@@ -1,6 +1,10 @@
 import redis.asyncio as redis
 
-from src.config import settings as s
+from src.config import Settings, settings as s
+
+
+def build_redis_url(settings: Settings) -> str:
+    return f'redis://{settings.redis_host}:{settings.redis_port}'
 
 
 class RedisConnector:
@@ -9,11 +13,20 @@ class RedisConnector:
         self.redis_url = redis_url
         self.redis = None
 
+    def configure(self, redis_url):
+        self.redis_url = redis_url
+        self.redis = None
+
     async def get_redis_db(self):
         if self.redis is None:
             self.redis = await redis.from_url(self.redis_url)
         return self.redis
 
+    async def close(self):
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
 
-redis_database_url = f'redis://{s.redis_host}:{s.redis_port}'
+redis_database_url = build_redis_url(s)
 redis_db = RedisConnector(redis_database_url)
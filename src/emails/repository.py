@@ -2,13 +2,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from src.models import Contact, Email, User
 from src.emails.schemas import EmailIn
+from src.contacts.repository import touch_contacts, live_contacts
+from src.database_postgres import read_session, pin_to_primary
+from src.events import change_broker
 
 
 async def get_all_emails(contact_id, current_user: User, session: AsyncSession) -> list[Email]:
-    async with session.begin():
-        stmt = select(Email) \
-            .join(Contact) \
-            .where(and_(Email.contact_id == contact_id, Contact.owner_id == current_user.id)) \
+    async with read_session(current_user.id, session) as session, session.begin():
+        stmt = select(Email).join(Email.contact) \
+            .where(and_(Email.contact_id == contact_id, Email.owner_id == current_user.id, live_contacts())) \
             .order_by(Email.id)
         emails = await session.execute(stmt)
     return [email for email in emails.scalars()]
@@ -19,10 +21,17 @@ async def add_email(contact_id: int,
                     current_user: User,
                     session: AsyncSession) -> Contact | None:
     async with session.begin():
-        contact = await session.get(Contact, contact_id)
-        if contact and contact.owner_id == current_user.id:
-            session.add(Email(**email.dict(), contact_id=contact.id))
-            return contact
+        contact = await session.execute(
+            select(Contact).where(live_contacts(Contact.owner_id == current_user.id, Contact.id == contact_id))
+        )
+        contact = contact.scalars().unique().one_or_none()
+        if not contact:
+            return
+        session.add(Email(**email.model_dump(), contact_id=contact.id, owner_id=current_user.id))
+        await session.execute(touch_contacts(current_user.id, contact.id))
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "updated", contact_id)
+    return contact
 
 
 async def update_email(contact_id: int,
@@ -31,16 +40,20 @@ async def update_email(contact_id: int,
                        current_user: User,
                        session: AsyncSession) -> Email | None:
     async with session.begin():
-        stmt = select(Email) \
-            .join(Contact) \
+        stmt = select(Email).join(Email.contact) \
             .where(
-            and_(Email.contact_id == contact_id, Email.id == email_id, Contact.owner_id == current_user.id)) \
+            and_(Email.contact_id == contact_id, Email.id == email_id, Email.owner_id == current_user.id,
+                 live_contacts())) \
             .limit(1)
         email = await session.execute(stmt)
         email = email.scalars().one_or_none()
         if email:
             email.address = new_email.address
+            await session.execute(touch_contacts(current_user.id, email.contact_id))
             await session.commit()
+    if email:
+        await pin_to_primary(current_user.id)
+        await change_broker.publish(current_user.id, "updated", contact_id)
     return email
 
 
@@ -48,17 +61,18 @@ async def remove_email(contact_id: int,
                        email_id: int,
                        current_user: User,
                        session: AsyncSession) -> bool:
-
     async with session.begin():
-        stmt = select(Email) \
-            .join(Contact) \
+        stmt = select(Email).join(Email.contact) \
             .where(
-            and_(Email.contact_id == contact_id, Email.id == email_id, Contact.owner_id == current_user.id)) \
+            and_(Email.contact_id == contact_id, Email.id == email_id, Email.owner_id == current_user.id,
+                 live_contacts())) \
             .limit(1)
         email = await session.execute(stmt)
         email = email.scalars().one_or_none()
-        if email:
-            await session.delete(email)
-            return True
-        else:
+        if not email:
             return False
+        await session.delete(email)
+        await session.execute(touch_contacts(current_user.id, contact_id))
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "updated", contact_id)
+    return True
@@ -0,0 +1,222 @@
+"""
+Response encoding of the API: MessagePack bodies for the clients that ask for them and gzip / brotli
+compression of the larger responses.
+
+brotli and msgpack are optional (``pip install brotli msgpack``). Without them responses are compressed with
+gzip only and always rendered as JSON.
+"""
+import time
+import zlib
+from collections import defaultdict
+from contextvars import ContextVar
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+
+_wants_msgpack: ContextVar[bool] = ContextVar("wants_msgpack", default=False)
+
+
+class EncodingMetrics:
+    """
+    Bytes and CPU time spent per encoding in this worker.
+
+    Content encodings (``gzip``, ``br``, ``identity``) count the bytes before and after compression, body
+    formats (``json``, ``msgpack``) the rendered bytes.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(lambda: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_seconds": 0.0})
+
+    def record(self, encoding: str, bytes_in: int, bytes_out: int, cpu_seconds: float, responses: int = 0):
+        counter = self.counters[encoding]
+        counter["responses"] += responses
+        counter["bytes_in"] += bytes_in
+        counter["bytes_out"] += bytes_out
+        counter["cpu_seconds"] += cpu_seconds
+
+    def snapshot(self) -> dict:
+        return {encoding: dict(counter) for encoding, counter in self.counters.items()}
+
+
+encoding_metrics = EncodingMetrics()
+
+
+def parse_qualities(header: str) -> dict[str, float]:
+    qualities = {}
+    for item in header.split(','):
+        value, *params = [part.strip() for part in item.split(';')]
+        if not value:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        qualities[value.lower()] = quality
+    return qualities
+
+
+def accepts_msgpack(accept: str) -> bool:
+    qualities = parse_qualities(accept)
+    best = max((qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES), default=0.0)
+    return msgpack is not None and best > 0 and best >= qualities.get("application/json", 0.0)
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    qualities = parse_qualities(accept_encoding)
+    wildcard = qualities.get('*', 0.0)
+    candidates = [("br", qualities.get("br", wildcard))] if brotli is not None else []
+    candidates.append(("gzip", qualities.get("gzip", wildcard)))
+    # the first one wins a tie, so brotli is preferred when it is installed
+    encoding, quality = max(candidates, key=lambda candidate: candidate[1])
+    return encoding if quality > 0 else None
+
+
+class NegotiatedResponse(JSONResponse):
+    """
+    JSON response that is rendered as MessagePack when the request accepts ``application/msgpack``.
+    """
+
+    def render(self, content) -> bytes:
+        start = time.thread_time()
+        if _wants_msgpack.get():
+            self.media_type = MSGPACK_TYPES[0]
+            body = msgpack.packb(content, use_bin_type=True)
+        else:
+            body = super().render(content)
+        encoding_metrics.record(self.media_type.rpartition('/')[2].removeprefix('x-'), 0, len(body),
+                                time.thread_time() - start, responses=1)
+        return body
+
+    def init_headers(self, headers=None):
+        super().init_headers(headers)
+        MutableHeaders(raw=self.raw_headers).add_vary_header("Accept")
+
+
+class GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int = 6):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        return self.compressor.compress(data) + (self.compressor.flush(zlib.Z_SYNC_FLUSH) if flush else b"")
+
+    def finish(self) -> bytes:
+        return self.compressor.flush()
+
+
+class BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int = 4):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, flush: bool = False) -> bytes:
+        return self.compressor.process(data) + (self.compressor.flush() if flush else b"")
+
+    def finish(self) -> bytes:
+        return self.compressor.finish()
+
+
+class ResponseEncodingMiddleware:
+    """
+    Negotiate the body format and compress the response body while it is sent.
+
+    Bodies sent in one piece are compressed when they reach ``minimum_size``. Streamed bodies are compressed
+    chunk by chunk and flushed after every chunk, so the client gets each part as soon as it is produced and
+    nothing is buffered beyond the compressor window. Event streams and already encoded bodies pass through.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, gzip_level: int = 6, brotli_quality: int = 4,
+                 metrics: EncodingMetrics = encoding_metrics):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        token = _wants_msgpack.set(accepts_msgpack(headers.get("accept", "")))
+        try:
+            encoding = choose_encoding(headers.get("accept-encoding", ""))
+            if encoding is None:
+                await self.app(scope, receive, send)
+            else:
+                await self.app(scope, receive, EncodingSender(self, encoding, send))
+        finally:
+            _wants_msgpack.reset(token)
+
+    def encoder(self, encoding: str):
+        return BrotliEncoder(self.brotli_quality) if encoding == "br" else GzipEncoder(self.gzip_level)
+
+
+class EncodingSender:
+    def __init__(self, middleware: ResponseEncodingMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start_message = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers \
+                or headers.get("content-type", "").startswith("text/event-stream")
+            if self.passthrough:
+                await self.send(message)
+            else:
+                self.start_message = message
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            await self.send(message)
+            return
+
+        body, more_body = message.get("body", b""), message.get("more_body", False)
+        if self.encoder is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self.middleware.metrics.record("identity", len(body), len(body), 0.0, responses=1)
+                await self.send(self.start_message)
+                await self.send(message)
+                return
+            self.encoder = self.middleware.encoder(self.encoding)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            del headers["Content-Length"]
+
+        start = time.thread_time()
+        encoded = self.encoder.compress(body, flush=more_body)
+        if not more_body:
+            encoded += self.encoder.finish()
+        self.middleware.metrics.record(self.encoding, len(body), len(encoded), time.thread_time() - start,
+                                       responses=0 if more_body else 1)
+
+        if self.start_message is not None:
+            if not more_body:
+                MutableHeaders(raw=self.start_message["headers"])["Content-Length"] = str(len(encoded))
+            await self.send(self.start_message)
+            self.start_message = None
+        await self.send({"type": "http.response.body", "body": encoded, "more_body": more_body})
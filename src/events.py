@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from redis.exceptions import RedisError
+
+from src.database_redis import RedisConnector, redis_db
+
+CHANNEL_PREFIX = "contacts:events:"
+# events a slow client may fall behind by before its backlog is replaced with a single resync event
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+RESYNC = json.dumps({"type": "resync"})
+
+logger = logging.getLogger(__name__)
+
+
+def channel(owner_id: int) -> str:
+    return f"{CHANNEL_PREFIX}{owner_id}"
+
+
+class ChangeBroker:
+    """
+    Fan-out of contact change events to the event streams of one worker.
+
+    Every worker keeps a single Redis pub/sub connection. It subscribes to the channel of a user while at least
+    one stream of that user is open on the worker and copies every message to the local queues, so idle clients
+    cost a queue each instead of a Redis connection or a polling request.
+    """
+
+    def __init__(self, redis_connector: RedisConnector, queue_size: int = QUEUE_SIZE):
+        self.redis_connector = redis_connector
+        self.queue_size = queue_size
+        self.listeners: dict[int, set[asyncio.Queue]] = {}
+        self.pubsub = None
+        self.reader = None
+
+    @property
+    def started(self) -> bool:
+        return self.pubsub is not None
+
+    async def start(self):
+        redis = await self.redis_connector.get_redis_db()
+        self.pubsub = redis.pubsub()
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+            try:
+                await self.reader
+            except asyncio.CancelledError:
+                pass
+            self.reader = None
+        for queues in self.listeners.values():
+            for queue in queues:
+                self.deliver(queue, None)
+        if self.pubsub is not None:
+            await self.pubsub.close()
+            self.pubsub = None
+
+    async def publish(self, owner_id: int, event_type: str, contact_id: int):
+        """
+        Announce a change of a contact to the streams of its owner on every worker.
+
+        Events are hints for the clients to sync, so a failed publish is reported and the write goes on. Processes
+        that did not start the broker (scripts, tests) do not publish.
+
+        :param owner_id: Owner of the contact.
+        :type owner_id: int
+        :param event_type: ``created``, ``updated`` or ``deleted``.
+        :type event_type: str
+        :param contact_id: Changed contact.
+        :type contact_id: int
+        """
+        if not self.started:
+            return
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            await redis.publish(channel(owner_id), json.dumps({"type": event_type, "contact_id": contact_id}))
+        except RedisError:
+            logger.warning("cannot announce the change of contact %s", contact_id, exc_info=True)
+
+    async def publish_many(self, owner_id: int, event_type: str, contact_ids: list[int]):
+        """
+        Announce the same change of many contacts, e.g. of a bulk operation, in one round trip.
+
+        :param owner_id: Owner of the contacts.
+        :type owner_id: int
+        :param event_type: ``created``, ``updated`` or ``deleted``.
+        :type event_type: str
+        :param contact_ids: Changed contacts.
+        :type contact_ids: list[int]
+        """
+        if not self.started or not contact_ids:
+            return
+        try:
+            redis = await self.redis_connector.get_redis_db()
+            async with redis.pipeline(transaction=False) as pipe:
+                for contact_id in contact_ids:
+                    pipe.publish(channel(owner_id), json.dumps({"type": event_type, "contact_id": contact_id}))
+                await pipe.execute()
+        except RedisError:
+            logger.warning("cannot announce the changes of %d contacts of user %s", len(contact_ids), owner_id,
+                           exc_info=True)
+
+    @asynccontextmanager
+    async def subscribe(self, owner_id: int) -> AsyncIterator[asyncio.Queue]:
+        queue = asyncio.Queue(self.queue_size)
+        queues = self.listeners.setdefault(owner_id, set())
+        queues.add(queue)
+        try:
+            if len(queues) == 1:
+                await self.pubsub.subscribe(channel(owner_id))
+            if self.reader is None:
+                self.reader = asyncio.create_task(self.read())
+            yield queue
+        finally:
+            queues.discard(queue)
+            if not queues:
+                del self.listeners[owner_id]
+                if self.pubsub is not None:
+                    await self.pubsub.unsubscribe(channel(owner_id))
+
+    async def read(self):
+        while True:
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except RedisError:
+                # the pub/sub connection re-subscribes to its channels when it reconnects
+                logger.warning("cannot read the contact changes", exc_info=True)
+                await asyncio.sleep(1)
+                continue
+            if message is None or message["type"] != "message":
+                continue
+            owner_id = int(message["channel"].decode().removeprefix(CHANNEL_PREFIX))
+            for queue in self.listeners.get(owner_id, ()):
+                self.deliver(queue, message["data"].decode())
+
+    @staticmethod
+    def deliver(queue: asyncio.Queue, data: str | None):
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            if data is not None:
+                data = RESYNC
+        queue.put_nowait(data)
+
+
+async def event_stream(broker: ChangeBroker, owner_id: int) -> AsyncIterator[str]:
+    """
+    Server-Sent Events of the changes of ``owner_id`` until the client disconnects or the worker stops.
+
+    :param broker: Broker of the worker.
+    :type broker: ChangeBroker
+    :param owner_id: User whose changes are streamed.
+    :type owner_id: int
+    :return: ``text/event-stream`` chunks, with a comment every :data:`HEARTBEAT_SECONDS` to keep proxies open.
+    :rtype: AsyncIterator[str]
+    """
+    async with broker.subscribe(owner_id) as queue:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            if data is None:
+                return
+            yield f"data: {data}\n\n"
+
+
+change_broker = ChangeBroker(redis_db)
@@ -1,17 +1,65 @@
 from pydantic import EmailStr
+from sqlalchemy import select, update, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.auth.repository import get_user_by_email
-from src.models import User
+from src.contacts.repository import birthday_key_filter, live_contacts
+from src.models import User, Contact
+from src.database_postgres import pin_to_primary
 
 
 async def verify_email(user: User, session: AsyncSession) -> None:
     async with session.begin():
-        user.is_confirmed = True
-        await session.commit()
+        await session.execute(update(User).where(User.id == user.id).values(is_confirmed=True))
+    await pin_to_primary(user.email)
+    user.is_confirmed = True
 
 
 async def update_password(user: User, pwd_hash: str, session: AsyncSession) -> None:
     async with session.begin():
-        user.password = pwd_hash
-        await session.commit()
+        await session.execute(update(User).where(User.id == user.id).values(password=pwd_hash))
+    await pin_to_primary(user.email)
+    user.password = pwd_hash
+
+
+async def get_birthday_owner_ids(key_ranges: list[tuple[int, int]],
+                                 after_owner_id: int,
+                                 limit: int,
+                                 session: AsyncSession) -> list[int]:
+    """
+    Next page of ids of the users that have contacts with a birthday key in ``key_ranges``,
+    keyset-paginated by user id.
+    """
+    async with session.begin():
+        owners = await session.execute(
+            select(Contact.owner_id)
+            .where(live_contacts(Contact.owner_id > after_owner_id, birthday_key_filter(key_ranges)))
+            .group_by(Contact.owner_id)
+            .order_by(Contact.owner_id)
+            .limit(limit)
+        )
+        return list(owners.scalars())
+
+
+async def get_confirmed_users(user_ids: list[int], session: AsyncSession) -> list[User]:
+    async with session.begin():
+        users = await session.execute(
+            select(User).where(and_(User.id.in_(user_ids), User.is_confirmed.is_(True))).order_by(User.id)
+        )
+        return list(users.scalars())
+
+
+async def get_birthday_contacts(owner_ids: list[int],
+                                key_ranges: list[tuple[int, int]],
+                                session: AsyncSession) -> list[tuple]:
+    """
+    ``(owner_id, first_name, last_name, birthday)`` rows of the given owners' contacts with a birthday key in
+    ``key_ranges``.
+    """
+    async with session.begin():
+        contacts = await session.execute(
+            select(Contact.owner_id, Contact.first_name, Contact.last_name, Contact.birthday)
+            .where(live_contacts(Contact.owner_id.in_(owner_ids), birthday_key_filter(key_ranges)))
+            .order_by(Contact.owner_id, Contact.birthday_key)
+        )
+        return list(contacts.tuples())
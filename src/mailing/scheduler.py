@@ -0,0 +1,173 @@
+"""
+Daily birthday reminders.
+
+Walks the users that have contacts with an upcoming birthday in keyset pages, groups the birthdays per
+user and mails every page of reminders through a few reused SMTP connections. The last user id of every
+sent page is checkpointed in Redis, so a crashed run started again on the same day resumes after it. A page
+that is not sent in full, because a connection was lost or the server deferred a reminder, stops the run,
+checkpointed before the first user whose reminder failed. The users whose reminder went out, or was refused for
+good, are also recorded in a set of the day as soon as it happens, so the run started again skips them instead of
+mailing them twice.
+
+Usage::
+
+    python -m src.mailing.scheduler [--days 1] [--batch-size 500] [--concurrency 4] [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from datetime import date
+
+from redis.asyncio import Redis
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.contacts.service import birthday_key_ranges
+from src.mailing import repository as repository_mailing
+from src.mailing.service import FastMailService
+
+TEMPLATE_NAME = "birthday_reminder.html"
+CHECKPOINT_TTL = 2 * 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def checkpoint_key(today: date) -> str:
+    return f"birthday_reminders:{today.isoformat()}"
+
+
+def done_key(today: date) -> str:
+    return f"birthday_reminders:{today.isoformat()}:done"
+
+
+def build_reminders(users: list, contacts: list[tuple]) -> list[dict]:
+    by_owner = defaultdict(list)
+    for owner_id, first_name, last_name, birthday in contacts:
+        name = f"{first_name} {last_name}" if last_name else first_name
+        by_owner[owner_id].append({"name": name, "birthday": birthday.strftime("%d %B")})
+    return [
+        {
+            "owner_id": user.id,
+            "email": user.email,
+            "subject": "Upcoming birthdays",
+            "template_body": {"username": user.username, "contacts": by_owner[user.id]},
+        }
+        for user in users if by_owner[user.id]
+    ]
+
+
+async def send_birthday_reminders(session_maker: async_sessionmaker,
+                                  redis: Redis,
+                                  mail: FastMailService,
+                                  today: date,
+                                  days: int = 1,
+                                  batch_size: int = 500,
+                                  concurrency: int = 4,
+                                  dry_run: bool = False) -> dict:
+    """
+    Send the reminders for the birthdays from ``today`` to ``today + days``.
+
+    :param session_maker: Session maker of the database to read from.
+    :type session_maker: async_sessionmaker
+    :param redis: Redis holding the checkpoint and the users done.
+    :type redis: Redis
+    :param mail: Mail service used to send the reminders.
+    :type mail: FastMailService
+    :param today: First day of the window; also names the checkpoint.
+    :type today: date
+    :param days: Length of the window in days.
+    :type days: int
+    :param batch_size: Number of users per page.
+    :type batch_size: int
+    :param concurrency: Number of SMTP connections per page.
+    :type concurrency: int
+    :param dry_run: Build the reminders without sending them or moving the checkpoint.
+    :type dry_run: bool
+    :return: Counters of the run: ``users``, ``contacts``, ``sent``, ``refused``, ``failed``, ``skipped`` (users
+        done by an earlier run), ``batches`` and ``seconds``.
+    :rtype: dict
+    """
+    key_ranges = birthday_key_ranges(today, days)
+    checkpoint = await redis.get(checkpoint_key(today))
+    after_owner_id = int(checkpoint) if checkpoint else 0
+    stats = {"users": 0, "contacts": 0, "sent": 0, "refused": 0, "failed": 0, "skipped": 0, "batches": 0,
+             "resumed_after": after_owner_id}
+    start = time.perf_counter()
+
+    async def mark_done(reminder: dict):
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(done_key(today), reminder["owner_id"])
+            pipe.expire(done_key(today), CHECKPOINT_TTL)
+            await pipe.execute()
+
+    while True:
+        async with session_maker() as session:
+            owner_ids = await repository_mailing.get_birthday_owner_ids(key_ranges, after_owner_id, batch_size,
+                                                                         session)
+            if not owner_ids:
+                break
+            users = await repository_mailing.get_confirmed_users(owner_ids, session)
+            contacts = await repository_mailing.get_birthday_contacts([user.id for user in users], key_ranges,
+                                                                      session)
+        reminders = build_reminders(users, contacts)
+        failed = set()
+        if reminders and not dry_run:
+            # users done by an earlier run that stopped on a failure further in this page
+            done = await redis.smismember(done_key(today), [reminder["owner_id"] for reminder in reminders])
+            stats["skipped"] += sum(map(bool, done))
+            reminders = [reminder for reminder, is_done in zip(reminders, done) if not is_done]
+        if reminders and not dry_run:
+            refused, failed = await mail.send_batch(reminders, TEMPLATE_NAME, concurrency, mark_done)
+            failed = set(failed)
+            stats["sent"] += len(reminders) - len(refused) - len(failed)
+            stats["refused"] += len(refused)
+            stats["failed"] += len(failed)
+        if failed:
+            # the next run starts again at the first user that did not get a reminder
+            first_failed = min(reminder["owner_id"] for reminder in reminders if reminder["email"] in failed)
+            after_owner_id = max((owner_id for owner_id in owner_ids if owner_id < first_failed),
+                                 default=after_owner_id)
+        else:
+            after_owner_id = owner_ids[-1]
+        if not dry_run:
+            await redis.set(checkpoint_key(today), after_owner_id, ex=CHECKPOINT_TTL)
+        stats["users"] += len(reminders)
+        stats["contacts"] += len(contacts)
+        stats["batches"] += 1
+        if failed:
+            logger.error("%d reminders failed, stopping after user %d", len(failed), after_owner_id)
+            break
+
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+async def main(days: int, batch_size: int, concurrency: int, dry_run: bool):
+    from src.database_postgres import postgres_db
+    from src.database_redis import redis_db
+    from src.mailing.service import mail_service
+
+    try:
+        stats = await send_birthday_reminders(postgres_db.get_session_maker(), await redis_db.get_redis_db(),
+                                              mail_service, date.today(), days, batch_size, concurrency, dry_run)
+    finally:
+        await postgres_db.dispose()
+        await redis_db.close()
+
+    rate = stats["users"] / stats["seconds"] if stats["seconds"] else 0
+    print(f"{'dry run: ' if dry_run else ''}{stats['users']} users, {stats['contacts']} birthdays, "
+          f"{stats['sent']} emails sent ({stats['refused']} refused, {stats['failed']} failed, "
+          f"{stats['skipped']} already sent) in {stats['batches']} batches, "
+          f"{stats['seconds']:.2f} s ({rate:.0f} users/s), resumed after user {stats['resumed_after']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Send the daily birthday reminders.")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(args.days, args.batch_size, args.concurrency, args.dry_run))
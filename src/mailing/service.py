@@ -1,32 +1,53 @@
+import asyncio
+import logging
+from email.message import EmailMessage
+from email.utils import formataddr
 from pathlib import Path
-from fastapi_mail import ConnectionConfig, FastMail
+from typing import Awaitable, Callable
 from pydantic import EmailStr
-from fastapi_mail import MessageSchema, MessageType
-from fastapi_mail.errors import ConnectionErrors
 
-from src.config import settings as s
+from src.config import Settings, settings as s
 from src.auth.service import auth_service
 
+logger = logging.getLogger(__name__)
+
 
 class FastMailService:
-    conf = ConnectionConfig(
-        MAIL_USERNAME=s.mail_username,
-        MAIL_PASSWORD=s.mail_password,
-        MAIL_FROM=s.mail_from,
-        MAIL_PORT=s.mail_port,
-        MAIL_SERVER=s.mail_server,
-        MAIL_FROM_NAME=s.mail_from_name,
-        MAIL_STARTTLS=False,
-        MAIL_SSL_TLS=True,
-        USE_CREDENTIALS=True,
-        VALIDATE_CERTS=True,
-        TEMPLATE_FOLDER=Path(__file__).parent.parent.parent / 'templates',
-    )
-
-    def __init__(self):
-        self.mf = FastMail(self.conf)
+
+    def __init__(self, settings: Settings = s):
+        self.settings = settings
+        self._mf = None
+
+    def configure(self, settings: Settings):
+        self.settings = settings
+        self._mf = None
+
+    @property
+    def mf(self):
+        # fastapi_mail is heavy to import, so the client is built on the first sent message
+        if self._mf is None:
+            from fastapi_mail import ConnectionConfig, FastMail
+
+            conf = ConnectionConfig(
+                MAIL_USERNAME=self.settings.mail_username,
+                MAIL_PASSWORD=self.settings.mail_password,
+                MAIL_FROM=self.settings.mail_from,
+                MAIL_PORT=self.settings.mail_port,
+                MAIL_SERVER=self.settings.mail_server,
+                MAIL_FROM_NAME=self.settings.mail_from_name,
+                MAIL_STARTTLS=False,
+                MAIL_SSL_TLS=True,
+                USE_CREDENTIALS=True,
+                VALIDATE_CERTS=True,
+                TEMPLATE_FOLDER=Path(__file__).parent.parent.parent / 'templates',
+            )
+            self._mf = FastMail(conf)
+        return self._mf
 
     async def send_verification_email(self, email: EmailStr, username: str, host: str):
+        from fastapi_mail import MessageSchema, MessageType
+        from fastapi_mail.errors import ConnectionErrors
+
         try:
             token_verification = await auth_service.create_email_token({"sub": email})
             message = MessageSchema(
@@ -41,6 +62,9 @@ class FastMailService:
             print(err)
 
     async def send_password_reset_mail(self, email: EmailStr, username: str, host: str, reset_token: str):
+        from fastapi_mail import MessageSchema, MessageType
+        from fastapi_mail.errors import ConnectionErrors
+
         try:
             message = MessageSchema(
                 subject="Reset your password",
@@ -54,5 +78,81 @@ class FastMailService:
         except ConnectionErrors as err:
             print(err)
 
+    async def send_batch(self, messages: list[dict], template_name: str, concurrency: int = 4,
+                         on_done: Callable[[dict], Awaitable] | None = None) -> tuple[list[str], list[str]]:
+        """
+        Send one templated email per item of ``messages`` over a few reused SMTP connections.
+
+        The template is loaded once for the whole batch and the messages are spread over ``concurrency``
+        connections, each of which sends its share one after another. A message refused for good (a 5xx reply) is
+        logged and the share goes on, as does a message deferred with a 4xx reply; a lost connection fails the
+        rest of its share.
+
+        :param messages: Items with ``email``, ``subject`` and the ``template_body`` to render.
+        :type messages: list[dict]
+        :param template_name: File name of the template in the templates folder.
+        :type template_name: str
+        :param concurrency: Number of SMTP connections opened at the same time.
+        :type concurrency: int
+        :param on_done: Awaited with every item as soon as it is sent or refused for good, i.e. it must not be
+            sent again.
+        :type on_done: Callable[[dict], Awaitable], optional
+        :return: Addresses of the emails refused for good, and of those that failed and may be sent again.
+        :rtype: tuple[list[str], list[str]]
+        """
+        from aiosmtplib import SMTP, SMTPException, SMTPRecipientsRefused, SMTPResponseException
+
+        config = self.mf.config
+        template = config.template_engine().get_template(template_name)
+        sender = formataddr((config.MAIL_FROM_NAME, config.MAIL_FROM)) if config.MAIL_FROM_NAME else config.MAIL_FROM
+
+        def build(item: dict) -> EmailMessage:
+            message = EmailMessage()
+            message["From"] = sender
+            message["To"] = item["email"]
+            message["Subject"] = item["subject"]
+            message.set_content(template.render(**item["template_body"]), subtype="html")
+            return message
+
+        def is_permanent(err: SMTPException) -> bool:
+            # 4xx replies (a full mailbox, greylisting) may be accepted on the next run, 5xx ones will not
+            if isinstance(err, SMTPRecipientsRefused):
+                return all(recipient.code >= 500 for recipient in err.recipients)
+            return err.code >= 500
+
+        async def send_share(share: list[dict]) -> tuple[list[str], list[str]]:
+            if config.SUPPRESS_SEND:
+                return [], []
+            sent = 0
+            refused = []
+            failed = []
+            try:
+                async with SMTP(hostname=config.MAIL_SERVER, port=config.MAIL_PORT,
+                                username=config.MAIL_USERNAME if config.USE_CREDENTIALS else None,
+                                password=config.MAIL_PASSWORD if config.USE_CREDENTIALS else None,
+                                use_tls=config.MAIL_SSL_TLS, start_tls=config.MAIL_STARTTLS,
+                                validate_certs=config.VALIDATE_CERTS, timeout=config.TIMEOUT) as smtp:
+                    for item in share:
+                        settled = True
+                        try:
+                            await smtp.send_message(build(item))
+                        except (SMTPRecipientsRefused, SMTPResponseException) as err:
+                            settled = is_permanent(err)
+                            logger.warning("%s %s the email to %s", config.MAIL_SERVER,
+                                           "refused" if settled else "deferred", item["email"], exc_info=True)
+                            (refused if settled else failed).append(item["email"])
+                        sent += 1
+                        if settled and on_done is not None:
+                            await on_done(item)
+            except SMTPException:
+                # everything not handed over yet, the message that was being sent included
+                logger.exception("SMTP connection to %s failed", config.MAIL_SERVER)
+                failed += [item["email"] for item in share[sent:]]
+            return refused, failed
+
+        shares = [messages[i::concurrency] for i in range(min(concurrency, len(messages)))]
+        results = await asyncio.gather(*(send_share(share) for share in shares))
+        return ([email for refused, _ in results for email in refused],
+                [email for _, failed in results for email in failed])
 
 mail_service = FastMailService()
@@ -1,20 +1,61 @@
-from datetime import date
-from sqlalchemy import Integer, String, Boolean, Text, Date, DateTime, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship, DeclarativeBase
+from datetime import date, datetime
+from sqlalchemy import Integer, SmallInteger, String, Boolean, Text, Date, DateTime, Index, func, text
+from sqlalchemy.orm import Mapped, mapped_column, relationship, validates, DeclarativeBase
 from sqlalchemy.sql.schema import ForeignKey
+from sqlalchemy.sql.functions import FunctionElement
 from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.ext.compiler import compiles
+
+from src.contacts.names import name_keys
 
 
 class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
+class naive_now(FunctionElement):
+    """
+    The current time as the naive ``DateTime`` columns store it.
+
+    ``now()`` is a ``timestamptz`` on Postgres: compared with a naive column, or read into Python and bound again,
+    it mixes aware and naive values. ``LOCALTIMESTAMP`` is the same instant in the wall time ``now()`` defaults are
+    stored with; SQLite stores and returns ``CURRENT_TIMESTAMP`` naive already.
+    """
+    type = DateTime()
+    inherit_cache = True
+
+
+@compiles(naive_now)
+def compile_naive_now(element, compiler, **kw):
+    return "CURRENT_TIMESTAMP"
+
+
+@compiles(naive_now, "postgresql")
+def compile_naive_now_postgresql(element, compiler, **kw):
+    return "LOCALTIMESTAMP"
+
+
+def contact_join(child: str) -> str:
+    # children are joined on the owner too, so their partitions are pruned like the contact's
+    return f"and_(Contact.id == foreign({child}.contact_id), Contact.owner_id == foreign({child}.owner_id))"
+
+
 class Phone(Base):
     __tablename__ = 'phones'
+    __table_args__ = (Index('ix_phones_owner_id_normalized_contact_id', 'owner_id', 'normalized', 'contact_id'),
+                      Index('ix_phones_owner_id_updated_at', 'owner_id', 'updated_at'),
+                      Index('ix_phones_contact_id', 'contact_id'))
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     number: Mapped[str] = mapped_column(String(50), nullable=False)
+    normalized: Mapped[str] = mapped_column(String(50), nullable=False)
     contact_id: Mapped[int] = mapped_column(Integer, ForeignKey('contacts.id', ondelete='CASCADE'))
-    contact = relationship("Contact", back_populates="phones")
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now(), onupdate=func.now(),
+                                                 server_default=func.now())
+    contact = relationship("Contact", back_populates="phones", primaryjoin=contact_join("Phone"), overlaps="owner")
+    owner = relationship("User", overlaps="contact")
+    # rows are identified with their owner, so ORM updates and deletes carry the partition key
+    __mapper_args__ = {"primary_key": [id, owner_id]}
 
     def __repr__(self):
         return self.number
@@ -22,26 +63,114 @@ class Phone(Base):
 
 class Email(Base):
     __tablename__ = 'emails'
+    __table_args__ = (Index('ix_emails_owner_id_updated_at', 'owner_id', 'updated_at'),
+                      Index('ix_emails_contact_id', 'contact_id'))
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     address: Mapped[str] = mapped_column(String(50), nullable=False)
     contact_id: Mapped[int] = mapped_column(Integer, ForeignKey('contacts.id', ondelete='CASCADE'))
-    contact = relationship("Contact", back_populates="emails")
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now(), onupdate=func.now(),
+                                                 server_default=func.now())
+    contact = relationship("Contact", back_populates="emails", primaryjoin=contact_join("Email"), overlaps="owner")
+    owner = relationship("User", overlaps="contact")
+    __mapper_args__ = {"primary_key": [id, owner_id]}
 
     def __repr__(self):
         return self.address
 
 
+class Tag(Base):
+    __tablename__ = 'tags'
+    __table_args__ = (Index('ix_tags_owner_id_name', 'owner_id', 'name', unique=True),)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    name: Mapped[str] = mapped_column(String(50), nullable=False)
+
+
+class ContactTag(Base):
+    __tablename__ = 'contact_tags'
+    # the first index answers "contacts with these tags" from the index alone and keeps a tag once per contact
+    __table_args__ = (Index('ix_contact_tags_owner_id_tag_id_contact_id', 'owner_id', 'tag_id', 'contact_id',
+                            unique=True),
+                      Index('ix_contact_tags_owner_id_contact_id', 'owner_id', 'contact_id'))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    contact_id: Mapped[int] = mapped_column(Integer, ForeignKey('contacts.id', ondelete='CASCADE'), nullable=False)
+    tag_id: Mapped[int] = mapped_column(Integer, ForeignKey('tags.id', ondelete='CASCADE'), nullable=False)
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    __mapper_args__ = {"primary_key": [id, owner_id]}
+
+
 class Contact(Base):
     __tablename__ = 'contacts'
+    __table_args__ = (Index('ix_contacts_owner_id_id', 'owner_id', 'id'),
+                      Index('ix_contacts_owner_id_last_name_first_name', 'owner_id', 'last_name', 'first_name'),
+                      Index('ix_contacts_owner_id_updated_at', 'owner_id', 'updated_at'),
+                      # the sort keys of /contacts/read, each ending with the id so a page is one index range
+                      Index('ix_contacts_owner_id_birthday_key_id', 'owner_id', 'birthday_key', 'id'),
+                      Index('ix_contacts_owner_id_first_name_sort', 'owner_id', 'first_name_normalized',
+                            'last_name_normalized', 'id'),
+                      Index('ix_contacts_owner_id_last_name_sort', 'owner_id', 'last_name_normalized',
+                            'first_name_normalized', 'id'),
+                      Index('ix_contacts_owner_id_created_at_id', 'owner_id', 'created_at', 'id'),
+                      # the fuzzy search: equal phonetic keys, and prefixes of the normalized names
+                      Index('ix_contacts_owner_id_first_name_phonetic', 'owner_id', 'first_name_phonetic'),
+                      Index('ix_contacts_owner_id_last_name_phonetic', 'owner_id', 'last_name_phonetic'),
+                      Index('ix_contacts_owner_id_first_name_normalized', 'owner_id', 'first_name_normalized',
+                            postgresql_ops={'first_name_normalized': 'varchar_pattern_ops'}),
+                      Index('ix_contacts_owner_id_last_name_normalized', 'owner_id', 'last_name_normalized',
+                            postgresql_ops={'last_name_normalized': 'varchar_pattern_ops'}),
+                      Index('ix_contacts_deleted_at_id', 'deleted_at', 'id',
+                            postgresql_where=text('deleted_at IS NOT NULL'),
+                            sqlite_where=text('deleted_at IS NOT NULL')))
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     owner = relationship("User", back_populates="contacts")
     owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
-    first_name: Mapped[str] = mapped_column(String(50), nullable=False, index=True)
-    last_name: Mapped[str] = mapped_column(String(50), nullable=True, index=True)
-    emails: Mapped[Email] = relationship("Email", back_populates="contact", lazy='joined', cascade="all, delete")
-    phones: Mapped[Phone] = relationship("Phone", back_populates="contact", lazy='joined', cascade="all, delete")
+    first_name: Mapped[str] = mapped_column(String(50), nullable=False)
+    last_name: Mapped[str] = mapped_column(String(50), nullable=True)
+    # lowercase, accent-folded names and their Metaphone codes, set with the names (src/contacts/names.py); a
+    # missing name is normalized to '', so the name sorts never compare nulls
+    first_name_normalized: Mapped[str] = mapped_column(String(100), nullable=False, default='')
+    last_name_normalized: Mapped[str] = mapped_column(String(100), nullable=False, default='')
+    first_name_phonetic: Mapped[str] = mapped_column(String(100), nullable=True)
+    last_name_phonetic: Mapped[str] = mapped_column(String(100), nullable=True)
+    emails: Mapped[list[Email]] = relationship("Email", back_populates="contact", lazy='joined', cascade="all, delete",
+                                               primaryjoin=contact_join("Email"), overlaps="owner")
+    phones: Mapped[list[Phone]] = relationship("Phone", back_populates="contact", lazy='joined', cascade="all, delete",
+                                               primaryjoin=contact_join("Phone"), overlaps="owner")
     birthday: Mapped[date] = mapped_column(Date, nullable=True)
+    # month * 100 + day, so upcoming birthdays are a range scan of ix_contacts_owner_id_birthday_key
+    birthday_key: Mapped[int] = mapped_column(SmallInteger, nullable=True)
     description: Mapped[str] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now(),
+                                                 server_default=func.now())
+    # bumped on every write to the contact, its phones or its emails; drives /contacts/changes
+    updated_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now(), onupdate=func.now(),
+                                                 server_default=func.now())
+    # set by user-facing deletes, which leave the rows to the purger (src/contacts/purger.py)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    __mapper_args__ = {"primary_key": [id, owner_id]}
+
+    @validates('birthday')
+    def validate_birthday(self, key, birthday: date | None):
+        self.birthday_key = birthday.month * 100 + birthday.day if birthday else None
+        return birthday
+
+    @validates('first_name', 'last_name')
+    def validate_name(self, key, name: str | None):
+        for column, value in name_keys({key: name}).items():
+            setattr(self, column, value)
+        return name
+
+
+class ContactTombstone(Base):
+    __tablename__ = 'contact_tombstones'
+    __table_args__ = (Index('ix_contact_tombstones_owner_id_deleted_at', 'owner_id', 'deleted_at'),
+                      Index('ix_contact_tombstones_deleted_at_id', 'deleted_at', 'id'))
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    owner_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    contact_id: Mapped[int] = mapped_column(Integer, nullable=False)
+    deleted_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=func.now(),
+                                                 server_default=func.now())
 
 
 class User(Base):
@@ -54,7 +183,7 @@ class User(Base):
     avatar: Mapped[str] = mapped_column(String(255), nullable=True)
     is_confirmed: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
     refresh_token: Mapped[str] = mapped_column(String(255), nullable=True)
-    contacts: Mapped[Contact] = relationship("Contact", back_populates="owner", lazy='noload', cascade="all, delete")
+    contacts: Mapped[list[Contact]] = relationship("Contact", back_populates="owner", lazy='noload', cascade="all, delete")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,250 @@
+"""
+Online conversion of ``contacts``, ``phones``, ``emails`` and ``contact_tags`` between plain tables and tables
+hash-partitioned by ``owner_id`` (Postgres only).
+
+Every repository query filters on ``owner_id``, so on partitioned tables the planner only touches the partition
+of the user, and indexes and vacuum work on partitions a fraction of the size of the whole table.
+
+A conversion runs while the application keeps writing:
+
+1. a copy of each table is created in the target layout, with the same columns, defaults and indexes;
+2. a trigger on each table mirrors every insert, update and delete into its copy;
+3. the existing rows are copied in id batches, each committed on its own and locking only the rows it copies;
+4. in one short transaction the tables are swapped with their copies and the old tables dropped;
+5. the foreign keys are added back ``NOT VALID`` and validated without blocking writes, on every partition
+   of a partitioned table.
+
+The ``partition_by_owner`` migration converts when ``CONTACTS_PARTITIONS`` (or ``-x partitions=N``) is set.
+A deployment can also be converted later, in either direction::
+
+    python -m src.partitioning --partitions 16
+    python -m src.partitioning --partitions 0
+"""
+import argparse
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import Connection, create_engine, text
+
+TABLES = ("contacts", "phones", "emails", "contact_tags")
+BATCH_SIZE = 10000
+COPY_SUFFIX = "_converted"
+
+# (table, columns, referenced table, referenced columns); a partitioned table is unique on its primary key only,
+# which includes the partition key
+FOREIGN_KEYS = {
+    False: [
+        ("contacts", "owner_id", "users", "id"),
+        ("phones", "owner_id", "users", "id"),
+        ("phones", "contact_id", "contacts", "id"),
+        ("emails", "owner_id", "users", "id"),
+        ("emails", "contact_id", "contacts", "id"),
+        ("contact_tags", "owner_id", "users", "id"),
+        ("contact_tags", "contact_id", "contacts", "id"),
+        ("contact_tags", "tag_id", "tags", "id"),
+    ],
+    True: [
+        ("contacts", "owner_id", "users", "id"),
+        ("phones", "owner_id", "users", "id"),
+        ("phones", "contact_id, owner_id", "contacts", "id, owner_id"),
+        ("emails", "owner_id", "users", "id"),
+        ("emails", "contact_id, owner_id", "contacts", "id, owner_id"),
+        ("contact_tags", "owner_id", "users", "id"),
+        ("contact_tags", "contact_id, owner_id", "contacts", "id, owner_id"),
+        ("contact_tags", "tag_id", "tags", "id"),
+    ],
+}
+
+MIRROR_FUNCTION = f"""
+CREATE OR REPLACE FUNCTION mirror_to_converted() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        EXECUTE format('DELETE FROM %I WHERE owner_id = $1 AND id = $2', TG_TABLE_NAME || '{COPY_SUFFIX}')
+            USING OLD.owner_id, OLD.id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        EXECUTE format('INSERT INTO %I SELECT ($1).* ON CONFLICT DO NOTHING', TG_TABLE_NAME || '{COPY_SUFFIX}')
+            USING NEW;
+    END IF;
+    RETURN NULL;
+END $$
+"""
+
+
+@contextmanager
+def transaction(connection: Connection):
+    # the connection is in autocommit mode, so the steps that must be atomic open their transaction themselves
+    connection.execute(text("BEGIN"))
+    try:
+        yield
+    except Exception:
+        connection.execute(text("ROLLBACK"))
+        raise
+    connection.execute(text("COMMIT"))
+
+
+def is_partitioned(connection: Connection, table: str = "contacts") -> bool:
+    return bool(connection.scalar(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+    ))
+
+
+def partition_count(connection: Connection, table: str = "contacts") -> int:
+    return connection.scalar(
+        text("SELECT count(*) FROM pg_inherits WHERE inhparent = to_regclass(:table)"), {"table": table}
+    )
+
+
+def existing_tables(connection: Connection) -> list[str]:
+    # the migrations before a table was added convert the tables that existed then
+    return [table for table in TABLES
+            if connection.scalar(text("SELECT to_regclass(:table) IS NOT NULL"), {"table": table})]
+
+
+def create_copy(connection: Connection, table: str, partitions: int):
+    copy = f"{table}{COPY_SUFFIX}"
+    if partitions:
+        connection.execute(text(f"CREATE TABLE {copy} (LIKE {table} INCLUDING DEFAULTS) "
+                                f"PARTITION BY HASH (owner_id)"))
+        connection.execute(text(f"ALTER TABLE {copy} ADD CONSTRAINT {copy}_pkey PRIMARY KEY (id, owner_id)"))
+        for remainder in range(partitions):
+            connection.execute(text(f"CREATE TABLE {table}_p{remainder} PARTITION OF {copy} "
+                                    f"FOR VALUES WITH (MODULUS {partitions}, REMAINDER {remainder})"))
+    else:
+        connection.execute(text(f"CREATE TABLE {copy} (LIKE {table} INCLUDING DEFAULTS)"))
+        connection.execute(text(f"ALTER TABLE {copy} ADD CONSTRAINT {copy}_pkey PRIMARY KEY (id)"))
+    # the secondary indexes are built before the copy and renamed at the swap, so the copy is ready at once
+    indexes = connection.execute(
+        text("SELECT indexname, indexdef FROM pg_indexes WHERE tablename = :table AND indexname <> :pkey"),
+        {"table": table, "pkey": f"{table}_pkey"},
+    )
+    for name, definition in indexes.all():
+        definition = re.sub(rf"INDEX {name} ON (\w+\.)?{table} ", f"INDEX {name}{COPY_SUFFIX} ON {copy} ",
+                            definition)
+        connection.execute(text(definition))
+    connection.execute(text(f"CREATE TRIGGER mirror_to_converted AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                            f"FOR EACH ROW EXECUTE FUNCTION mirror_to_converted()"))
+
+
+def copy_rows(connection: Connection, table: str, batch_size: int):
+    copy = f"{table}{COPY_SUFFIX}"
+    max_id = connection.scalar(text(f"SELECT coalesce(max(id), 0) FROM {table}"))
+    # every batch commits on its own; FOR SHARE copies the latest committed version of each row and holds back
+    # its updates until the batch commits, after which the trigger mirrors them
+    for first_id in range(0, max_id + 1, batch_size):
+        connection.execute(
+            text(f"INSERT INTO {copy} SELECT * FROM {table} WHERE id >= :first_id AND id < :last_id "
+                 f"FOR SHARE ON CONFLICT DO NOTHING"),
+            {"first_id": first_id, "last_id": first_id + batch_size},
+        )
+
+
+def swap(connection: Connection, partitioned: bool, tables: list[str]):
+    with transaction(connection):
+        connection.execute(text(f"LOCK TABLE {', '.join(tables)} IN ACCESS EXCLUSIVE MODE"))
+        for table in reversed(tables):
+            copy = f"{table}{COPY_SUFFIX}"
+            indexes = connection.execute(
+                text("SELECT indexname FROM pg_indexes WHERE tablename = :copy AND indexname <> :pkey"),
+                {"copy": copy, "pkey": f"{copy}_pkey"},
+            ).scalars().all()
+            # the id sequence belongs to the old table and would be dropped with it
+            connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE"))
+            connection.execute(text(f"DROP TABLE {table} CASCADE"))
+            connection.execute(text(f"ALTER TABLE {copy} RENAME TO {table}"))
+            connection.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {copy}_pkey TO {table}_pkey"))
+            connection.execute(text(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"))
+            for name in indexes:
+                connection.execute(text(f"ALTER INDEX {name} RENAME TO {name.removesuffix(COPY_SUFFIX)}"))
+    add_foreign_keys(connection, partitioned, tables)
+    for table in tables:
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def add_foreign_keys(connection: Connection, partitioned: bool, tables: list[str]):
+    # NOT VALID keys are not supported on partitioned tables, so those get theirs on every partition instead
+    for table, columns, referenced, referenced_columns in FOREIGN_KEYS[partitioned]:
+        if table not in tables:
+            continue
+        targets = [table]
+        if partitioned:
+            targets = connection.execute(
+                text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"),
+                {"table": table},
+            ).scalars().all()
+        for target in targets:
+            name = f"{target}_{columns.split(',')[0]}_fkey"
+            connection.execute(text(f"ALTER TABLE {target} ADD CONSTRAINT {name} FOREIGN KEY ({columns}) "
+                                    f"REFERENCES {referenced} ({referenced_columns}) ON DELETE CASCADE NOT VALID"))
+            connection.execute(text(f"ALTER TABLE {target} VALIDATE CONSTRAINT {name}"))
+
+
+def create_index(connection: Connection, name: str, table: str, columns: list[str], where: str | None = None):
+    """
+    Build an index without blocking writes, on a plain or on a partitioned table.
+
+    Postgres cannot build the index of a partitioned table concurrently, so it is declared on the parent only,
+    built concurrently on every partition and attached partition by partition.
+
+    :param connection: A connection in autocommit mode.
+    :type connection: Connection
+    :param name: Name of the index.
+    :type name: str
+    :param table: Table to index.
+    :type table: str
+    :param columns: Indexed columns.
+    :type columns: list[str]
+    :param where: Condition of a partial index.
+    :type where: str | None
+    """
+    definition = f"({', '.join(columns)})" + (f" WHERE {where}" if where else "")
+    if not is_partitioned(connection, table):
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY {name} ON {table} {definition}"))
+        return
+    connection.execute(text(f"CREATE INDEX {name} ON ONLY {table} {definition}"))
+    partitions = connection.execute(
+        text("SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = to_regclass(:table)"),
+        {"table": table},
+    ).scalars().all()
+    for partition in partitions:
+        partition_index = f"{name}{partition.removeprefix(table)}"
+        connection.execute(text(f"CREATE INDEX CONCURRENTLY {partition_index} ON {partition} {definition}"))
+        connection.execute(text(f"ALTER INDEX {name} ATTACH PARTITION {partition_index}"))
+
+
+def convert(connection: Connection, partitions: int, batch_size: int = BATCH_SIZE):
+    """
+    Convert the tables to ``partitions`` hash partitions by owner, or back to plain tables when it is 0.
+
+    :param connection: A connection in autocommit mode, so every step commits on its own.
+    :type connection: Connection
+    :param partitions: Number of partitions, 0 for plain tables.
+    :type partitions: int
+    :param batch_size: Number of ids copied per transaction.
+    :type batch_size: int
+    """
+    if is_partitioned(connection) == bool(partitions):
+        return
+    tables = existing_tables(connection)
+    with transaction(connection):
+        connection.execute(text(MIRROR_FUNCTION))
+        for table in tables:
+            create_copy(connection, table, partitions)
+    for table in tables:
+        copy_rows(connection, table, batch_size)
+    swap(connection, bool(partitions), tables)
+    connection.execute(text("DROP FUNCTION mirror_to_converted()"))
+
+
+if __name__ == '__main__':
+    from src.config import settings
+
+    parser = argparse.ArgumentParser(description="Convert the contact tables to or from hash partitions by owner.")
+    parser.add_argument("--partitions", type=int, required=True, help="number of partitions, 0 for plain tables")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+    engine = create_engine(f'postgresql+psycopg2://{settings.postgres_user}:{settings.postgres_password}'
+                           f'@{settings.postgres_host}:{settings.postgres_port}/{settings.postgres_db}',
+                           isolation_level="AUTOCOMMIT")
+    with engine.connect() as connection:
+        convert(connection, args.partitions, args.batch_size)
@@ -2,13 +2,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 from src.models import Contact, Phone, User
 from src.phones.schemas import PhoneIn
+from src.phones.service import normalize_number
+from src.contacts.repository import touch_contacts, live_contacts
+from src.database_postgres import read_session, pin_to_primary
+from src.events import change_broker
 
 
 async def get_all_phones(contact_id, current_user: User, session: AsyncSession) -> list[Phone]:
-    async with session.begin():
-        stmt = select(Phone) \
-            .join(Contact) \
-            .where(and_(Phone.contact_id == contact_id, Contact.owner_id == current_user.id)) \
+    async with read_session(current_user.id, session) as session, session.begin():
+        stmt = select(Phone).join(Phone.contact) \
+            .where(and_(Phone.contact_id == contact_id, Phone.owner_id == current_user.id, live_contacts())) \
             .order_by(Phone.id)
         phones = await session.execute(stmt)
     return [phone for phone in phones.scalars()]
@@ -19,10 +22,18 @@ async def add_phone(contact_id: int,
                     current_user: User,
                     session: AsyncSession) -> Contact | None:
     async with session.begin():
-        contact = await session.get(Contact, contact_id)
-        if contact and contact.owner_id == current_user.id:
-            session.add(Phone(**phone.dict(), contact_id=contact.id))
-            return contact
+        contact = await session.execute(
+            select(Contact).where(live_contacts(Contact.owner_id == current_user.id, Contact.id == contact_id))
+        )
+        contact = contact.scalars().unique().one_or_none()
+        if not contact:
+            return
+        session.add(Phone(**phone.model_dump(), normalized=normalize_number(phone.number), contact_id=contact.id,
+                          owner_id=current_user.id))
+        await session.execute(touch_contacts(current_user.id, contact.id))
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "updated", contact_id)
+    return contact
 
 
 async def update_phone(contact_id: int,
@@ -31,16 +42,21 @@ async def update_phone(contact_id: int,
                        current_user: User,
                        session: AsyncSession) -> Phone | None:
     async with session.begin():
-        stmt = select(Phone) \
-            .join(Contact) \
+        stmt = select(Phone).join(Phone.contact) \
             .where(
-            and_(Phone.contact_id == contact_id, Phone.id == phone_id, Contact.owner_id == current_user.id)) \
+            and_(Phone.contact_id == contact_id, Phone.id == phone_id, Phone.owner_id == current_user.id,
+                 live_contacts())) \
             .limit(1)
         phone = await session.execute(stmt)
         phone = phone.scalars().one_or_none()
         if phone:
             phone.number = new_phone.number
+            phone.normalized = normalize_number(new_phone.number)
+            await session.execute(touch_contacts(current_user.id, phone.contact_id))
             await session.commit()
+    if phone:
+        await pin_to_primary(current_user.id)
+        await change_broker.publish(current_user.id, "updated", contact_id)
     return phone
 
 
@@ -49,15 +65,28 @@ async def remove_phone(contact_id: int,
                        current_user: User,
                        session: AsyncSession) -> bool:
     async with session.begin():
-        stmt = select(Phone) \
-            .join(Contact) \
+        stmt = select(Phone).join(Phone.contact) \
             .where(
-            and_(Phone.contact_id == contact_id, Phone.id == phone_id, Contact.owner_id == current_user.id)) \
+            and_(Phone.contact_id == contact_id, Phone.id == phone_id, Phone.owner_id == current_user.id,
+                 live_contacts())) \
             .limit(1)
         phone = await session.execute(stmt)
         phone = phone.scalars().one_or_none()
-        if phone:
-            await session.delete(phone)
-            return True
-        else:
+        if not phone:
             return False
+        await session.delete(phone)
+        await session.execute(touch_contacts(current_user.id, contact_id))
+    await pin_to_primary(current_user.id)
+    await change_broker.publish(current_user.id, "updated", contact_id)
+    return True
+
+
+async def lookup_contacts(number: str, current_user: User, session: AsyncSession) -> list[Contact]:
+    # one probe of ix_phones_owner_id_normalized_contact_id, which holds the contact ids too, then the matching contacts by primary key
+    async with read_session(current_user.id, session) as session, session.begin():
+        phones = select(Phone.contact_id) \
+            .where(and_(Phone.owner_id == current_user.id, Phone.normalized == normalize_number(number)))
+        contacts = await session.execute(
+            select(Contact).where(live_contacts(Contact.owner_id == current_user.id, Contact.id.in_(phones)))
+        )
+        return [contact for contact in contacts.unique().scalars()]
@@ -5,6 +5,7 @@ from fastapi_limiter.depends import RateLimiter
 import src.phones.repository as phones_db
 from src.database_postgres import get_session
 from src.phones.schemas import PhoneIn, PhoneOut
+from src.contacts.schemas import ContactOut
 from src.auth.service import auth_service
 from src.models import User
 
@@ -139,3 +140,31 @@ async def delete_phone(contact_id: int, phone_id: int, current_user: User = Depe
     if respond:
         return {"detail": "Phone deleted sucsessfully."}
     raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Phone not found.")
+
+
+@router.get("/lookup", response_model=list[ContactOut])
+async def lookup_phone(number: str, current_user: User = Depends(auth_service.get_current_user),
+                       db: AsyncSession = Depends(get_session)):
+    """
+    .. http:get:: /lookup?number={number}
+
+       Find the contacts of the current user that have the given phone number.
+
+       :param number: The phone number to look up, in any format (``+1 555 123-4567``, ``(555) 1234567``, ...).
+       :type number: str
+       :param current_user: The authenticated user making the request. If not provided, the user will be obtained from the authentication service.
+       :type current_user: User, optional
+       :param db: The asynchronous database session to be used for the query. If not provided, a session will be generated using the `get_session` dependency.
+       :type db: AsyncSession, optional
+       :return: A list of `ContactOut` objects representing the contacts with this phone number.
+       :rtype: List[ContactOut]
+       :raises HTTPException: If no contact has this phone number, an HTTPException with a 404 status code is raised.
+
+       **Notes**:
+
+       The number is normalized to E.164 the same way stored numbers are, so the lookup is a single probe of the `(owner_id, normalized)` index.
+    """
+    contacts = await phones_db.lookup_contacts(number, current_user, db)
+    if contacts:
+        return contacts
+    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found.")
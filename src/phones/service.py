@@ -0,0 +1,31 @@
+import re
+
+from src.config import settings as s
+
+_non_digits = re.compile(r'\D')
+
+
+def normalize_number(number: str, country_code: str = s.default_country_code) -> str:
+    """
+    Bring a phone number to E.164 form (``+<country code><number>``).
+
+    Numbers written with ``+`` or ``00`` already carry their country code. National numbers get
+    ``country_code`` in place of their leading trunk ``0``; without a default country code they are kept
+    as plain digits.
+
+    :param number: Phone number as entered by the user.
+    :type number: str
+    :param country_code: Country code for numbers written without one. Defaults to ``DEFAULT_COUNTRY_CODE``.
+    :type country_code: str
+    :return: The normalized number.
+    :rtype: str
+    """
+    number = number.strip()
+    digits = _non_digits.sub('', number)
+    if number.startswith('+'):
+        return f'+{digits}'
+    if digits.startswith('00'):
+        return f'+{digits[2:]}'
+    if country_code and digits:
+        return f'+{country_code}{digits.removeprefix("0")}'
+    return digits
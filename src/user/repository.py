@@ -1,15 +1,19 @@
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.models import User
+from src.database_postgres import pin_to_primary
 
 
 async def update_password(user: User, pwd_hash: str, session: AsyncSession) -> None:
     async with session.begin():
-        user.password = pwd_hash
-        await session.commit()
+        await session.execute(update(User).where(User.id == user.id).values(password=pwd_hash))
+    await pin_to_primary(user.email)
+    user.password = pwd_hash
 
 
 async def update_avatar(user: User, url: str, session: AsyncSession) -> None:
     async with session.begin():
-        user.avatar = url
-        await session.commit()
+        await session.execute(update(User).where(User.id == user.id).values(avatar=url))
+    await pin_to_primary(user.email)
+    user.avatar = url
@@ -1,16 +1,17 @@
-import cloudinary
-import cloudinary.uploader
+import time
 
 from fastapi import APIRouter, HTTPException, Depends, status, UploadFile, File
-from redis.asyncio import Redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi_limiter.depends import RateLimiter
 
 from src.database_postgres import get_session
-from src.database_redis import redis_db
 from src.user.schemas import NewPasswordSchema
 from src.user import repository as repository_users
-from src.auth.service import auth_service
+from src.auth.service import auth_service, ACCESS_TOKEN_TTL
+from src.auth.revocation import revocation_list
+from src.auth.tokens import refresh_token_store
+from src.auth.sessions import session_store
+from src.auth.user_cache import user_cache
 from src.models import User
 from src.config import settings
 
@@ -19,7 +20,7 @@ router = APIRouter(prefix='/user', tags=["user"])
 
 @router.patch("/set_password", dependencies=[Depends(RateLimiter(times=2, seconds=5))])
 async def set_password(body: NewPasswordSchema, current_user: User = Depends(auth_service.get_current_user),
-                       db: AsyncSession = Depends(get_session), rdb: Redis = Depends(redis_db.get_redis_db)):
+                       db: AsyncSession = Depends(get_session)):
     """
     .. http:patch:: /set_password
 
@@ -31,8 +32,6 @@ async def set_password(body: NewPasswordSchema, current_user: User = Depends(aut
        :type current_user: User, optional
        :param db: The asynchronous database session to be used for the operation. If not provided, a session will be generated using the `get_session` dependency.
        :type db: AsyncSession, optional
-       :param rdb: Redis database instance used to delete the user's session.
-       :type rdb: Redis, optional
        :return: A message indicating the status of the password update process.
        :rtype: dict
        :raises HTTPException:
@@ -40,14 +39,13 @@ async def set_password(body: NewPasswordSchema, current_user: User = Depends(aut
 
        **Notes**:
 
-       The function verifies the correctness of the provided current password. If it's correct, the user's password is updated in the database and the user's session is deleted from Redis.
+       The function verifies the correctness of the provided current password. If it's correct, the user's password is updated in the database, the user's cache entry is deleted from Redis and every session token, refresh token and access token of the user is revoked.
 
        **Dependencies**:
 
        - RateLimiter: Limits the number of requests to 2 every 5 seconds.
        - get_current_user: Dependency to get the currently authenticated user.
        - get_session: Dependency to get the current asynchronous database session.
-       - redis_db.get_redis_db: Dependency to get the Redis database instance.
     """
     if body.new_password != body.r_new_password:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Passwords do not match.")
@@ -56,7 +54,12 @@ async def set_password(body: NewPasswordSchema, current_user: User = Depends(aut
     else:
         new_password_hash = auth_service.get_password_hash(body.new_password)
         await repository_users.update_password(current_user, new_password_hash, db)
-        await rdb.delete(f'user:{current_user.email}')
+        await user_cache.delete(current_user.email)
+        # sessions hold a snapshot of the user with the old password
+        await session_store.revoke_user(current_user.id)
+        # so do the tokens issued with it, which a thief of the old password may hold
+        await refresh_token_store.revoke_user(current_user.email)
+        await revocation_list.revoke_user(current_user.email, time.time() + ACCESS_TOKEN_TTL.total_seconds())
         return {"message": "Password updated sucsessfully."}
 
 
@@ -91,6 +94,9 @@ async def update_user_avatar(file: UploadFile = File(), current_user: User = Dep
 
        - Cloudinary: Used for image uploading, manipulation, and delivery.
     """
+    import cloudinary
+    import cloudinary.uploader
+
     cloudinary.config(
         cloud_name=settings.cloudinary_name,
         api_key=settings.cloudinary_api_key,
@@ -1,38 +1,99 @@
+import asyncio
+
+import fakeredis
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from src.database_postgres import get_session
+from src.database_redis import redis_db
 from src.models import Base
 from main import app
 
-URL = "sqlite+aiosqlite:///./test.db"
 
-engine = create_async_engine(URL, echo=True)
-async_session = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+def create_engine():
+    # one in-memory database per process, so every pytest-xdist worker has its own; StaticPool keeps the single
+    # connection the database lives in
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool,
+                                 connect_args={"check_same_thread": False})
+
+    # pysqlite opens transactions by itself and breaks SAVEPOINT; SQLAlchemy is left to emit BEGIN instead
+    @event.listens_for(engine.sync_engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+    return engine
+
+
+async def create_schema(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture(scope="session")
+def engine():
+    engine = create_engine()
+    asyncio.run(create_schema(engine))
+    yield engine
+    asyncio.run(engine.dispose())
+
 
+@pytest_asyncio.fixture
+async def connection(engine):
+    # every test runs in a transaction rolled back at its end; the commits of the code under test only release
+    # savepoints, so the schema is created once and no test sees the rows of another
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        yield conn
+        await transaction.rollback()
 
-@pytest.fixture(scope="module")
-async def db():
-    async with async_session() as session:
+
+@pytest.fixture
+def session_maker(connection):
+    # for the code under test that opens its own sessions, all of them in the transaction of the test
+    return async_sessionmaker(bind=connection, expire_on_commit=False, join_transaction_mode="create_savepoint")
+
+
+@pytest_asyncio.fixture
+async def db(session_maker):
+    async with session_maker() as session:
         yield session
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture
 def client(db):
-    async def mock_get_db():
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
-            await conn.run_sync(Base.metadata.create_all)
-        async with async_session() as session:
-            yield session
-
-    app.dependency_overrides[get_session] = mock_get_db
+    async def override_get_session():
+        yield db
 
+    app.dependency_overrides[get_session] = override_get_session
     yield TestClient(app)
+    app.dependency_overrides.pop(get_session, None)
+
+
+@pytest.fixture
+def redis_server():
+    # an in-process Redis for the tests that need one, empty for every test; ``connected = False`` takes it down
+    return fakeredis.FakeServer()
+
+
+@pytest_asyncio.fixture
+async def redis(redis_server, monkeypatch):
+    # a client is bound to the event loop it is used in, so the application gets a new one on the server of the
+    # test for every connection it asks for
+    async def get_redis_db():
+        return fakeredis.FakeAsyncRedis(server=redis_server)
+
+    monkeypatch.setattr(redis_db, "get_redis_db", get_redis_db)
+    yield fakeredis.FakeAsyncRedis(server=redis_server)
 
 
-@pytest.fixture(scope="module")
+@pytest.fixture
 def user():
     return {"username": "deadpool", "email": "deadpool@example.com", "password": "12345678"}
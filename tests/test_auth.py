@@ -1,6 +1,10 @@
 import pytest
 from unittest.mock import MagicMock
 
+from sqlalchemy import select, update, func
+
+from src.models import User
+
 
 @pytest.mark.usefixtures("db")
 @pytest.mark.asyncio
@@ -23,3 +27,25 @@ async def test_register_existing_user(client, user, monkeypatch):
 
     assert response.status_code == 409
     assert response.json()['detail'] == "Account already exists"
+
+
+@pytest.mark.asyncio
+async def test_each_test_starts_with_empty_tables(db):
+    # the users signed up by the tests above were rolled back
+    assert await db.scalar(select(func.count()).select_from(User)) == 0
+
+
+@pytest.mark.asyncio
+async def test_login_and_authenticated_request(client, db, redis, user, monkeypatch):
+    monkeypatch.setattr("src.mailing.service.mail_service", MagicMock())
+    assert client.post("/api/auth/signup", json=user).status_code == 201
+    await db.execute(update(User).where(User.email == user["email"]).values(is_confirmed=True))
+    await db.commit()
+
+    response = client.post("/api/auth/login", data={"username": user["email"], "password": user["password"]})
+    assert response.status_code == 200
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = client.get("/api/contacts/read", headers=headers)
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Contact not found."
@@ -0,0 +1,17 @@
+from benchmarks.import_time import measure_import_time
+
+# generous enough for a cold CI runner, tight enough to catch a heavy client creeping back into import time
+IMPORT_TIME_BUDGET_US = 2_500_000
+
+LAZY_MODULES = ["cloudinary", "fastapi_mail", "libgravatar", "passlib", "jose", "asyncpg", "uvicorn"]
+
+
+def test_import_time_within_budget():
+    timings = measure_import_time("main")
+    assert timings["main"] < IMPORT_TIME_BUDGET_US
+
+
+def test_heavy_clients_not_imported():
+    timings = measure_import_time("main")
+    for module in LAZY_MODULES:
+        assert module not in timings, f"{module} is imported when the app is created"
@@ -0,0 +1,94 @@
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.config import settings
+from src.database_postgres import postgres_db, postgres_database_url, build_engine_options, PrimaryPins
+from src.database_redis import redis_db
+from src.models import Base, User, Contact
+from src.contacts.repository import get_contacts, add_contact
+from src.contacts.schemas import ContactIn
+
+pytestmark = pytest.mark.asyncio
+
+USER = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+
+
+@pytest_asyncio.fixture
+async def session(tmp_path, redis):
+    primary_url = f"sqlite+aiosqlite:///{tmp_path}/primary.db"
+    replica_url = f"sqlite+aiosqlite:///{tmp_path}/replica.db"
+
+    # the two files are seeded differently so the test can tell which one answered
+    for url, name in ((primary_url, "Primary"), (replica_url, "Replica")):
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(engine)() as session, session.begin():
+            session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            session.add(Contact(owner_id=1, first_name=name))
+        await engine.dispose()
+
+    postgres_db.configure(primary_url, [replica_url], read_your_writes_window=60)
+    async with postgres_db.get_session_maker()() as session:
+        yield session
+    await postgres_db.dispose()
+    postgres_db.configure(postgres_database_url, settings.postgres_replica_urls,
+                          settings.read_your_writes_window, **build_engine_options(settings))
+
+
+async def test_reads_go_to_replica(session):
+    contacts = await get_contacts(USER, session)
+    assert [contact.first_name for contact in contacts] == ["Replica"]
+
+
+async def test_writer_is_pinned_to_primary(session):
+    await add_contact(ContactIn(first_name="Written"), USER, session)
+
+    contacts = await get_contacts(USER, session)
+    assert sorted(contact.first_name for contact in contacts) == ["Primary", "Written"]
+
+
+async def test_pin_expires(session):
+    postgres_db.pins.window = 0
+    await add_contact(ContactIn(first_name="Written"), USER, session)
+
+    contacts = await get_contacts(USER, session)
+    assert [contact.first_name for contact in contacts] == ["Replica"]
+
+
+async def test_pin_is_seen_by_other_workers(session):
+    await add_contact(ContactIn(first_name="Written"), USER, session)
+
+    # another worker has its own pins, shared through Redis
+    other_worker = PrimaryPins(redis_db, 60)
+    assert await other_worker.is_pinned(USER.id)
+    assert not await other_worker.is_pinned(2)
+
+
+async def test_reads_go_to_primary_when_redis_is_down(session, redis_server):
+    redis_server.connected = False
+    await add_contact(ContactIn(first_name="Written"), USER, session)
+
+    contacts = await get_contacts(USER, session)
+    assert sorted(contact.first_name for contact in contacts) == ["Primary", "Written"]
+
+
+async def test_failed_write_does_not_pin(session, redis):
+    with patch.object(session.sync_session, "flush", side_effect=RuntimeError("commit failed")):
+        with pytest.raises(RuntimeError):
+            await add_contact(ContactIn(first_name="Written"), USER, session)
+
+    assert await redis.keys() == []
+
+
+async def test_replicas_round_robin(session, tmp_path):
+    second = f"sqlite+aiosqlite:///{tmp_path}/second.db"
+    postgres_db.configure(postgres_db.database_url, postgres_db.replica_urls + [second])
+
+    makers = [postgres_db.get_replica_session_maker() for _ in range(4)]
+    assert makers[0] is makers[2]
+    assert makers[1] is makers[3]
+    assert makers[0] is not makers[1]
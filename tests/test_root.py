@@ -1,6 +1,7 @@
 from fastapi.testclient import TestClient
 
-from main import app
+from main import app, create_app
+from src.config import settings
 
 client = TestClient(app)
 
@@ -15,3 +16,14 @@ def test_not_found():
     response = client.get("/1")
     assert response.status_code == 404
     assert response.json() == {"detail": "Not Found"}
+
+
+def test_encoding_metrics_need_the_metrics_token():
+    assert client.get("/metrics/encoding").status_code == 404
+
+    metrics_client = TestClient(create_app(settings.model_copy(update={"metrics_token": "secret"})))
+    assert metrics_client.get("/metrics/encoding").status_code == 401
+    assert metrics_client.get("/metrics/encoding", headers={"Authorization": "Bearer other"}).status_code == 401
+    response = metrics_client.get("/metrics/encoding", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert "identity" in response.json()
@@ -0,0 +1,24 @@
+import importlib.util
+
+from src.config import settings
+from server import build_server_options
+
+
+def test_server_options_from_settings():
+    options = build_server_options(settings.model_copy(update={"server_workers": 3, "server_backlog": 512}))
+
+    assert options["workers"] == 3
+    assert options["backlog"] == 512
+    assert options["timeout_keep_alive"] == settings.server_keepalive
+    assert options["timeout_graceful_shutdown"] == settings.server_graceful_timeout
+
+
+def test_server_workers_override():
+    assert build_server_options(settings, workers=8)["workers"] == 8
+
+
+def test_server_loop_and_parser_fallback():
+    options = build_server_options(settings)
+
+    assert options["loop"] == ("uvloop" if importlib.util.find_spec("uvloop") else "asyncio")
+    assert options["http"] == ("httptools" if importlib.util.find_spec("httptools") else "h11")
@@ -0,0 +1,118 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+
+from src.auth import service
+from src.auth.revocation import RevocationList, revoked_key
+from src.auth.service import auth_service
+from src.database_redis import redis_db
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def workers(redis):
+    workers = [RevocationList(redis_db) for _ in range(2)]
+    for worker in workers:
+        await worker.start()
+    yield workers
+    for worker in workers:
+        await worker.close()
+
+
+async def wait_for(condition, seconds: float = 3.0):
+    deadline = time.monotonic() + seconds
+    while not condition() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    return condition()
+
+
+async def test_revocation_reaches_every_worker(workers):
+    await workers[0].revoke("abc", time.time() + 60)
+
+    assert await wait_for(lambda: workers[1].is_revoked("abc"))
+    assert workers[0].is_revoked("abc")
+    assert not workers[1].is_revoked("def")
+    assert not workers[1].is_revoked(None)
+
+
+async def test_user_revocation_reaches_every_worker(workers):
+    issued_at = time.time() - 1
+
+    await workers[0].revoke_user("test@test.com", time.time() + 60)
+
+    assert await wait_for(lambda: workers[1].is_revoked("abc", "test@test.com", issued_at))
+    assert not workers[1].is_revoked("abc", "test@test.com", time.time() + 1)
+    assert not workers[1].is_revoked("abc", "other@test.com", issued_at)
+
+
+async def test_start_loads_live_entries(workers, redis):
+    await workers[0].revoke_user("test@test.com", time.time() + 60)
+    await redis.set(revoked_key("old"), time.time() + 60)
+    worker = RevocationList(redis_db)
+    await worker.start()
+
+    try:
+        assert worker.is_revoked("old")
+        assert worker.is_revoked(None, "test@test.com", time.time() - 1)
+    finally:
+        await worker.close()
+
+
+async def test_start_without_redis_syncs_once_it_is_back(redis, redis_server):
+    redis_server.connected = False
+    worker = RevocationList(redis_db)
+    await worker.start()
+
+    try:
+        # the reader fails too before Redis is back
+        await asyncio.sleep(0.05)
+        redis_server.connected = True
+        await redis.set(revoked_key("old"), time.time() + 60)
+        assert await wait_for(lambda: worker.is_revoked("old"))
+
+        await RevocationList(redis_db).revoke("new", time.time() + 60)
+        assert await wait_for(lambda: worker.is_revoked("new"))
+    finally:
+        await worker.close()
+
+
+async def test_expired_entries_are_dropped(workers, redis):
+    workers[0].revoked["stale"] = time.time() - 1
+
+    await workers[0].revoke("expired", time.time() - 1)
+    await workers[0].revoke("fresh", time.time() + 60)
+
+    assert list(workers[0].revoked) == ["fresh"]
+    assert not await redis.exists(revoked_key("expired"))
+
+
+async def test_revoked_token_is_rejected_without_redis(redis, monkeypatch):
+    revocation_list = RevocationList(redis_db)
+    monkeypatch.setattr(service, "revocation_list", revocation_list)
+    token = await auth_service.create_access_token(data={"sub": "test@test.com"})
+    payload = await auth_service.decode_access_payload(token)
+    assert "jti" in payload
+
+    await revocation_list.revoke(payload["jti"], payload["exp"])
+
+    async def unreachable():
+        raise AssertionError("Redis called")
+
+    monkeypatch.setattr(redis_db, "get_redis_db", unreachable)
+    with pytest.raises(HTTPException) as cm:
+        await auth_service.decode_access_payload(token)
+    assert cm.value.status_code == 401
+
+
+async def test_tokens_get_distinct_ids():
+    first = await auth_service.create_access_token(data={"sub": "test@test.com"})
+    second = await auth_service.create_access_token(data={"sub": "test@test.com"})
+
+    first_payload = await auth_service.decode_access_payload(first)
+    second_payload = await auth_service.decode_access_payload(second)
+
+    assert first_payload["jti"] != second_payload["jti"]
@@ -0,0 +1,130 @@
+import pickle
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+
+from src.models import User
+from src.auth import routes, service
+from src.auth.service import auth_service
+from src.auth.sessions import SessionStore, is_session_token, session_key
+from src.database_redis import redis_db
+
+pytestmark = pytest.mark.asyncio
+
+USER = User(id=1, username="test", email="test@test.com", password="1234567")
+
+
+@pytest.fixture
+def store(redis):
+    return SessionStore(redis_db)
+
+
+@pytest.fixture
+def session_mode(store, monkeypatch):
+    monkeypatch.setattr(service, "session_store", store)
+    monkeypatch.setattr(routes, "session_store", store)
+    monkeypatch.setattr(auth_service, "auth_mode", "session")
+
+
+async def test_lookup_uses_local_copy(store, redis):
+    token = await store.create(USER)
+
+    first = await store.get(token)
+    await redis.delete(session_key(token))
+    second = await store.get(token)
+
+    assert is_session_token(token)
+    assert first["user"].email == "test@test.com"
+    assert first["scopes"] == ["access_token"]
+    assert second is first
+
+
+async def test_without_local_copy_every_lookup_reads_redis(store, redis):
+    store.configure(900, 0)
+    token = await store.create(USER)
+
+    assert await store.get(token) is not None
+    await redis.delete(session_key(token))
+
+    assert await store.get(token) is None
+
+
+async def test_expired_session(store, redis):
+    token = await store.create(USER)
+    # a record read the moment it expires, before Redis drops it
+    record = pickle.loads(await redis.get(session_key(token)))
+    record["exp"] = time.time()
+    await redis.set(session_key(token), pickle.dumps(record))
+
+    assert await store.get(token) is None
+
+
+async def test_revoke(store):
+    token = await store.create(USER)
+    await store.get(token)
+
+    await store.revoke(token)
+
+    assert await store.get(token) is None
+
+
+async def test_revoke_user(store, redis):
+    tokens = [await store.create(USER) for _ in range(2)]
+    other = await store.create(User(id=2, username="other", email="other@test.com", password="1234567"))
+
+    await store.revoke_user(1)
+
+    for token in tokens:
+        assert await store.get(token) is None
+        assert not await redis.exists(session_key(token))
+    assert await store.get(other) is not None
+
+
+async def test_login_tokens_are_sessions(session_mode):
+    tokens = await routes.create_tokens(USER.email, "family", "token", None, USER)
+
+    assert is_session_token(tokens["access_token"])
+    assert not is_session_token(tokens["refresh_token"])
+    assert (await auth_service.get_current_user(tokens["access_token"], None)).id == 1
+
+
+async def test_jwt_still_goes_through_user_cache(session_mode, monkeypatch):
+    token = await auth_service.create_access_token(data={"sub": "test@test.com"})
+
+    async def get_redis_db():
+        raise RuntimeError("user cache")
+
+    monkeypatch.setattr(redis_db, "get_redis_db", get_redis_db)
+    with pytest.raises(RuntimeError, match="user cache"):
+        await auth_service.get_current_user(token, None)
+
+
+async def test_logout(session_mode):
+    token = await auth_service.create_session_token(USER)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+    await routes.logout(credentials)
+
+    with pytest.raises(HTTPException) as cm:
+        await auth_service.get_current_user(token, None)
+    assert cm.value.status_code == 401
+    with pytest.raises(HTTPException):
+        await routes.logout(credentials)
+
+
+async def test_logout_ends_the_refresh_family(session_mode):
+    tokens = await routes.create_tokens(USER.email, "family", "token", None, USER)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=tokens["access_token"])
+
+    with patch.object(routes.refresh_token_store, "revoke") as revoke:
+        await routes.logout(credentials)
+
+    revoke.assert_awaited_once_with("family")
+
+
+async def test_unknown_token(session_mode):
+    with pytest.raises(HTTPException):
+        await auth_service.get_current_user("unknown-session-token", None)
@@ -0,0 +1,136 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy import select
+
+from src.models import User
+from src.auth import routes
+from src.auth.revocation import revocation_list
+from src.auth.service import auth_service
+from src.auth.tokens import refresh_token_store, family_key
+from src.user import routes as user_routes
+from src.user.schemas import NewPasswordSchema
+
+pytestmark = pytest.mark.asyncio
+
+EMAIL = "test@test.com"
+
+
+@pytest.fixture(autouse=True)
+def revoked(redis, monkeypatch):
+    # the mirror of the revocation list is global; every test starts with an empty one
+    monkeypatch.setattr(revocation_list, "revoked", {})
+    monkeypatch.setattr(revocation_list, "revoked_users", {})
+
+
+async def refresh(token: str, session_maker):
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    async with session_maker() as session:
+        return await routes.refresh_token(credentials, session)
+
+
+async def test_rotation(redis):
+    family, first = await refresh_token_store.start_family(EMAIL)
+
+    second = await refresh_token_store.rotate(family, first, EMAIL)
+    third = await refresh_token_store.rotate(family, second, EMAIL)
+
+    assert None not in (second, third)
+    assert await redis.get(family_key(family)) == third.encode()
+
+
+async def test_reuse_revokes_family(redis):
+    family, first = await refresh_token_store.start_family(EMAIL)
+    second = await refresh_token_store.rotate(family, first, EMAIL)
+
+    assert await refresh_token_store.rotate(family, first, EMAIL) is None
+    assert await refresh_token_store.rotate(family, second, EMAIL) is None
+    assert not await redis.exists(family_key(family))
+
+
+async def test_families_are_independent():
+    phone, phone_token = await refresh_token_store.start_family(EMAIL)
+    laptop, laptop_token = await refresh_token_store.start_family(EMAIL)
+
+    await refresh_token_store.revoke(phone)
+
+    assert await refresh_token_store.rotate(phone, phone_token, EMAIL) is None
+    assert await refresh_token_store.rotate(laptop, laptop_token, EMAIL) is not None
+
+
+async def test_revoke_user_ends_every_family_of_the_user():
+    phone, phone_token = await refresh_token_store.start_family(EMAIL)
+    laptop, laptop_token = await refresh_token_store.start_family(EMAIL)
+    laptop_token = await refresh_token_store.rotate(laptop, laptop_token, EMAIL)
+    other, other_token = await refresh_token_store.start_family("other@test.com")
+
+    await refresh_token_store.revoke_user(EMAIL)
+
+    assert await refresh_token_store.rotate(phone, phone_token, EMAIL) is None
+    assert await refresh_token_store.rotate(laptop, laptop_token, EMAIL) is None
+    assert await refresh_token_store.rotate(other, other_token, "other@test.com") is not None
+
+
+async def test_family_token_refresh_does_not_touch_the_database(session_maker):
+    family, token_id = await refresh_token_store.start_family(EMAIL)
+    tokens = await routes.create_tokens(EMAIL, family, token_id, None)
+
+    with patch.object(routes.repository_users, "get_user_by_email") as get_user, \
+            patch.object(routes.repository_users, "update_token") as update_token:
+        new_tokens = await refresh(tokens["refresh_token"], session_maker)
+        with pytest.raises(HTTPException):
+            await refresh(tokens["refresh_token"], session_maker)
+
+    get_user.assert_not_called()
+    update_token.assert_not_called()
+    with pytest.raises(HTTPException):
+        await refresh(new_tokens["refresh_token"], session_maker)
+
+
+async def test_logout_ends_the_family(session_maker):
+    family, token_id = await refresh_token_store.start_family(EMAIL)
+    tokens = await routes.create_tokens(EMAIL, family, token_id, None)
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=tokens["access_token"])
+
+    await routes.logout(credentials)
+
+    with pytest.raises(HTTPException):
+        await auth_service.decode_access_payload(tokens["access_token"])
+    with pytest.raises(HTTPException):
+        await refresh(tokens["refresh_token"], session_maker)
+
+
+async def test_password_change_revokes_the_tokens_of_the_user(db, session_maker):
+    user = User(id=1, username="test", email=EMAIL, password=auth_service.get_password_hash("1234567"))
+    db.add(user)
+    await db.commit()
+    family, token_id = await refresh_token_store.start_family(EMAIL)
+    tokens = await routes.create_tokens(EMAIL, family, token_id, None)
+    other = await auth_service.create_access_token(data={"sub": "other@test.com"})
+
+    body = NewPasswordSchema(current_password="1234567", new_password="7654321", r_new_password="7654321")
+    await user_routes.set_password(body, user, db)
+
+    with pytest.raises(HTTPException):
+        await auth_service.decode_access_payload(tokens["access_token"])
+    with pytest.raises(HTTPException):
+        await refresh(tokens["refresh_token"], session_maker)
+    assert (await auth_service.decode_access_payload(other))["sub"] == "other@test.com"
+
+
+async def test_legacy_token_moves_to_a_family(db, session_maker):
+    legacy = await auth_service.create_refresh_token(data={"sub": EMAIL})
+    db.add(User(id=1, username="test", email=EMAIL, password="1234567", refresh_token=legacy))
+    await db.commit()
+
+    tokens = await refresh(legacy, session_maker)
+
+    payload = await auth_service.decode_refresh_payload(tokens["refresh_token"])
+    assert payload["sub"] == EMAIL
+    assert "fam" in payload
+    async with session_maker() as session:
+        assert await session.scalar(select(User.refresh_token)) is None
+    with pytest.raises(HTTPException):
+        await refresh(legacy, session_maker)
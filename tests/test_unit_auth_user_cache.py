@@ -0,0 +1,131 @@
+import asyncio
+import pickle
+import time
+from unittest.mock import patch
+
+import pytest
+
+from src.models import User
+from src.auth import service
+from src.auth.service import auth_service
+from src.auth.user_cache import UserCache, user_key, lock_key
+from src.database_redis import redis_db
+
+pytestmark = pytest.mark.asyncio
+
+EMAIL = "test@test.com"
+USER = User(id=1, username="test", email=EMAIL, password="1234567")
+
+
+class CountingLoader:
+    def __init__(self, user: User | None, seconds: float = 0.01):
+        self.user = user
+        self.seconds = seconds
+        self.calls = 0
+
+    async def __call__(self, email, session):
+        self.calls += 1
+        await asyncio.sleep(self.seconds)
+        return self.user
+
+
+@pytest.fixture
+def loader():
+    return CountingLoader(USER)
+
+
+@pytest.fixture
+def cache(redis, loader, monkeypatch):
+    cache = UserCache(redis_db)
+    monkeypatch.setattr(service, "user_cache", cache)
+    monkeypatch.setattr(service.repository_users, "get_user_by_email", loader)
+    return cache
+
+
+async def test_concurrent_misses_query_once(cache, loader, redis):
+    token = await auth_service.create_access_token(data={"sub": EMAIL})
+
+    users = await asyncio.gather(*[auth_service.get_current_user(token, None) for _ in range(1000)])
+
+    assert loader.calls == 1
+    assert all(user.id == 1 for user in users)
+    assert await redis.exists(user_key(EMAIL))
+    assert not await redis.exists(lock_key(EMAIL))
+    assert cache.loading == {}
+
+
+async def test_workers_share_the_load(cache, loader):
+    other_worker = UserCache(redis_db)
+
+    users = await asyncio.gather(*[worker.get(EMAIL, lambda: loader(EMAIL, None))
+                                   for _ in range(50) for worker in (cache, other_worker)])
+
+    assert loader.calls == 1
+    assert all(user.id == 1 for user in users)
+
+
+async def test_early_refresh_serves_cached_user_meanwhile(cache, loader, redis):
+    # a second before expiry, with a load that took a second
+    record = {"user": USER, "delta": 1.0, "expires": time.time() + 1}
+    await redis.set(user_key(EMAIL), pickle.dumps(record))
+    loader.user = User(id=1, username="renamed", email=EMAIL, password="1234567")
+
+    with patch("src.auth.user_cache.random.random", return_value=0.999):
+        users = await asyncio.gather(*[cache.get(EMAIL, lambda: loader(EMAIL, None)) for _ in range(20)])
+
+    assert loader.calls == 1
+    assert sorted({user.username for user in users}) == ["renamed", "test"]
+    record = pickle.loads(await redis.get(user_key(EMAIL)))
+    assert record["user"].username == "renamed"
+    assert record["expires"] > time.time() + 800
+
+
+async def test_fresh_entry_not_refreshed(cache, loader):
+    await cache.set(USER, delta=0.01)
+
+    with patch("src.auth.user_cache.random.random", return_value=0.999):
+        found = await cache.get(EMAIL, lambda: loader(EMAIL, None))
+
+    assert (found.id, loader.calls) == (1, 0)
+
+
+async def test_entry_of_previous_format_reloaded(cache, loader, redis):
+    await redis.set(user_key(EMAIL), pickle.dumps(USER))
+
+    found = await cache.get(EMAIL, lambda: loader(EMAIL, None))
+
+    assert (found.id, loader.calls) == (1, 1)
+    assert isinstance(pickle.loads(await redis.get(user_key(EMAIL))), dict)
+
+
+async def test_unknown_user_not_cached(cache, loader, redis):
+    loader.user = None
+
+    users = await asyncio.gather(*[cache.get("nobody@test.com", lambda: loader("nobody@test.com", None))
+                                   for _ in range(10)])
+
+    assert users == [None] * 10
+    assert loader.calls == 1
+    assert not await redis.exists(user_key("nobody@test.com"))
+
+
+async def test_failed_load_reaches_every_waiter(cache, redis):
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("database down")
+
+    results = await asyncio.gather(*[cache.get(EMAIL, fail) for _ in range(5)], return_exceptions=True)
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not await redis.exists(lock_key(EMAIL))
+    assert cache.loading == {}
+
+
+async def test_lock_taken_over_is_not_released(cache, redis):
+    async def slow_load():
+        # the lock runs out during the load and another worker takes it
+        await redis.set(lock_key(EMAIL), "other")
+        return USER
+
+    assert (await cache.get(EMAIL, slow_load)).id == 1
+    assert await redis.get(lock_key(EMAIL)) == b"other"
@@ -0,0 +1,148 @@
+import pytest
+import pytest_asyncio
+from redis.exceptions import ConnectionError
+
+from src.models import User, Contact
+from src.contacts import repository as repository_contacts
+from src.contacts.autocomplete import autocomplete_index, rebuild_users, index_key, names_key, INDEX_TTL
+from src.contacts.schemas import ContactIn, ContactsFilterIn, ContactPatchIn
+from src.database_redis import redis_db
+
+pytestmark = pytest.mark.asyncio
+
+USER = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def contacts(db):
+    db.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+    db.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+    for contact_id, first_name, last_name in ((1, "John", "Smith"), (2, "Johanna", "Johnson"),
+                                              (3, "Anna", "Smirnova"), (4, "Zoë", "Ångström")):
+        db.add(Contact(id=contact_id, owner_id=1, first_name=first_name, last_name=last_name))
+    db.add(Contact(id=5, owner_id=2, first_name="Johnny", last_name="Other"))
+    await db.commit()
+
+
+@pytest.fixture(autouse=True)
+def index(redis):
+    autocomplete_index.start()
+    yield autocomplete_index
+    autocomplete_index.close()
+    autocomplete_index.unsynced.clear()
+
+
+async def suggest(session_maker, prefix: str, limit: int = 10) -> list[tuple[int, str]]:
+    async with session_maker() as session:
+        found = await repository_contacts.autocomplete_contacts(prefix, USER, session, limit)
+    return [(contact["id"], contact["name"]) for contact in found]
+
+
+async def test_built_on_first_use_then_served_from_redis(session_maker, redis, monkeypatch):
+    assert await suggest(session_maker, "jo") == [(2, "Johanna Johnson"), (1, "John Smith")]
+    assert 0 < await redis.ttl(index_key(1)) <= INDEX_TTL
+    assert 0 < await redis.ttl(names_key(1)) <= INDEX_TTL
+    assert not await redis.exists(index_key(2))
+    # a contact written without the index is not seen until a rebuild, and the search reads no names
+    async with session_maker() as session, session.begin():
+        session.add(Contact(id=6, owner_id=1, first_name="Joe", last_name=None))
+    get_contact_names = repository_contacts.get_contact_names
+    monkeypatch.setattr(repository_contacts, "get_contact_names", None)
+
+    assert await suggest(session_maker, "jo") == [(2, "Johanna Johnson"), (1, "John Smith")]
+
+    monkeypatch.setattr(repository_contacts, "get_contact_names", get_contact_names)
+    await rebuild_users(session_maker, autocomplete_index, pause=0)
+    assert await suggest(session_maker, "joe") == [(6, "Joe")]
+    assert await redis.exists(index_key(2))
+
+
+async def test_any_word_case_and_accents(session_maker):
+    assert await suggest(session_maker, "SMI") == [(3, "Anna Smirnova"), (1, "John Smith")]
+    assert await suggest(session_maker, "john sm") == [(1, "John Smith")]
+    assert await suggest(session_maker, "angs") == [(4, "Zoë Ångström")]
+    assert await suggest(session_maker, "johnson") == [(2, "Johanna Johnson")]
+    assert await suggest(session_maker, "x") == []
+    assert await suggest(session_maker, "-") == []
+    assert await suggest(session_maker, "j", limit=1) == [(2, "Johanna Johnson")]
+
+
+async def test_writes_keep_the_index_current(session_maker):
+    await suggest(session_maker, "a")
+    async with session_maker() as session:
+        await repository_contacts.add_contact(ContactIn(first_name="Jack", last_name="Black"), USER, session)
+    async with session_maker() as session:
+        await repository_contacts.update_contact(ContactIn(first_name="Jon", last_name="Smith"), 1, USER, session)
+    async with session_maker() as session:
+        await repository_contacts.remove_contact(3, USER, session)
+    async with session_maker() as session:
+        await repository_contacts.bulk_update_contacts(ContactsFilterIn(ids=[4]), ContactPatchIn(last_name="Berg"),
+                                                       USER, session)
+    async with session_maker() as session:
+        await repository_contacts.add_contacts_batch([(ContactIn(first_name="Jill", last_name="Smart"), [], [])],
+                                                     USER, session)
+
+    assert await suggest(session_maker, "j") == [(6, "Jack Black"), (7, "Jill Smart"), (2, "Johanna Johnson"),
+                                                 (1, "Jon Smith")]
+    assert await suggest(session_maker, "sm") == [(7, "Jill Smart"), (1, "Jon Smith")]
+    assert await suggest(session_maker, "b") == [(4, "Zoë Berg"), (6, "Jack Black")]
+
+    async with session_maker() as session:
+        await repository_contacts.bulk_remove_contacts(ContactsFilterIn(search="j"), USER, session)
+    assert await suggest(session_maker, "j") == []
+    assert await suggest(session_maker, "z") == [(4, "Zoë Berg")]
+
+
+async def test_writes_before_the_first_search_skip_the_index(session_maker, redis):
+    async with session_maker() as session:
+        await repository_contacts.add_contact(ContactIn(first_name="Jack", last_name="Black"), USER, session)
+
+    assert not await redis.exists(index_key(1))
+    assert await suggest(session_maker, "jack") == [(6, "Jack Black")]
+
+
+async def test_rebuild_racing_a_write_starts_again(session_maker, redis):
+    loads = []
+
+    async def load():
+        async with session_maker() as session:
+            names = await repository_contacts.get_contact_names(USER, session)
+        if not loads:
+            # written after the names were read, before the index is installed
+            async with session_maker() as session:
+                await repository_contacts.add_contact(ContactIn(first_name="Jack", last_name="Black"), USER, session)
+        loads.append(names)
+        return names
+
+    assert await autocomplete_index.rebuild(1, load)
+    assert len(loads) == 2
+    assert await suggest(session_maker, "jack") == [(6, "Jack Black")]
+    assert await redis.keys("*:build:*") == []
+
+
+async def test_index_missing_writes_during_an_outage_is_rebuilt(session_maker, monkeypatch):
+    await suggest(session_maker, "j")
+    get_redis_db = redis_db.get_redis_db
+
+    async def refused():
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(redis_db, "get_redis_db", refused)
+    async with session_maker() as session:
+        await repository_contacts.add_contact(ContactIn(first_name="Jack", last_name="Black"), USER, session)
+    monkeypatch.setattr(redis_db, "get_redis_db", get_redis_db)
+
+    assert await suggest(session_maker, "jack") == [(6, "Jack Black")]
+    assert autocomplete_index.unsynced == set()
+
+
+async def test_database_answers_without_redis(session_maker, monkeypatch):
+    async def refused():
+        raise ConnectionError("Connection refused")
+
+    monkeypatch.setattr(redis_db, "get_redis_db", refused)
+
+    assert await suggest(session_maker, "Jo") == [(2, "Johanna Johnson"), (1, "John Smith")]
+    assert await suggest(session_maker, "smi", limit=1) == [(3, "Anna Smirnova")]
+    async with session_maker() as session:
+        assert await repository_contacts.remove_contact(1, USER, session)
@@ -0,0 +1,69 @@
+import unittest
+from datetime import date
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact
+from src.contacts.service import birthday_key_ranges
+from src.contacts.repository import get_upcoming_birthdays, update_contact
+from src.contacts.schemas import ContactIn
+
+
+class TestBirthdayKeyRanges(unittest.TestCase):
+    def test_window_within_year(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 7, 10), 7), [(710, 717)])
+
+    def test_window_across_new_year(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 12, 28), 7), [(1228, 1231), (101, 104)])
+
+    def test_feb_29_in_non_leap_year(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 2, 20), 8), [(220, 229)])
+        self.assertEqual(birthday_key_ranges(date(2023, 3, 1), 3), [(301, 304)])
+
+    def test_feb_29_in_leap_year(self):
+        self.assertEqual(birthday_key_ranges(date(2024, 2, 20), 8), [(220, 228)])
+
+    def test_whole_year(self):
+        self.assertEqual(birthday_key_ranges(date(2023, 5, 1), 365), [])
+
+
+class TestUpcomingBirthdays(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session.begin():
+            self.session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            self.session.add_all([
+                Contact(id=1, owner_id=1, first_name="January", birthday=date(1990, 1, 2)),
+                Contact(id=2, owner_id=1, first_name="December", birthday=date(1985, 12, 30)),
+                Contact(id=3, owner_id=1, first_name="Leap", birthday=date(1992, 2, 29)),
+                Contact(id=4, owner_id=1, first_name="Nobirthday"),
+            ])
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_across_new_year_in_upcoming_order(self):
+        contacts = await get_upcoming_birthdays(7, self.user, self.session, today=date(2023, 12, 28))
+
+        self.assertEqual([contact.first_name for contact in contacts], ["December", "January"])
+
+    async def test_leap_birthday_on_feb_28(self):
+        contacts = await get_upcoming_birthdays(0, self.user, self.session, today=date(2023, 2, 28))
+
+        self.assertEqual([contact.first_name for contact in contacts], ["Leap"])
+
+    async def test_key_follows_update(self):
+        await update_contact(ContactIn(first_name="Nobirthday", birthday=date(2000, 12, 29)), 4, self.user,
+                             self.session)
+
+        contacts = await get_upcoming_birthdays(1, self.user, self.session, today=date(2023, 12, 28))
+        self.assertEqual([contact.first_name for contact in contacts], ["Nobirthday"])
+
+
+if __name__ == "__main__":
+    unittest.main()
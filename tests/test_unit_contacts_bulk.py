@@ -0,0 +1,116 @@
+import asyncio
+import json
+import unittest
+from datetime import date, datetime
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from pydantic import ValidationError
+from sqlalchemy import select
+
+from src.database_redis import redis_db
+from src.events import ChangeBroker
+from src.models import User, Contact, ContactTombstone, Phone, Email
+from src.contacts import repository as repository_contacts
+from src.contacts.schemas import ContactsFilterIn, ContactPatchIn
+
+pytestmark = pytest.mark.asyncio
+
+PAST = datetime(2020, 1, 1)
+USER = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+
+
+@pytest_asyncio.fixture(autouse=True)
+async def contacts(db):
+    db.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+    db.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+    # 1-3 have a phone, 4-5 an email, 6-7 nothing; 8 belongs to someone else
+    for contact_id in range(1, 8):
+        db.add(Contact(id=contact_id, owner_id=1, first_name=f"Name{contact_id}", updated_at=PAST))
+    db.add(Contact(id=8, owner_id=2, first_name="Other", updated_at=PAST))
+    db.add_all([Phone(number=f"555 000 000{i}", normalized=f"555000000{i}", contact_id=i, owner_id=1)
+                for i in range(1, 4)])
+    db.add_all([Email(address=f"c{i}@test.com", contact_id=i, owner_id=1) for i in range(4, 6)])
+    await db.commit()
+
+
+@pytest_asyncio.fixture
+async def broker(redis, monkeypatch):
+    broker = ChangeBroker(redis_db)
+    await broker.start()
+    monkeypatch.setattr(repository_contacts, "change_broker", broker)
+    yield broker
+    await broker.close()
+
+
+async def live_ids(session_maker, owner_id: int = 1) -> list[int]:
+    async with session_maker() as session:
+        contacts = await session.execute(
+            select(Contact.id).where(repository_contacts.live_contacts(Contact.owner_id == owner_id))
+            .order_by(Contact.id)
+        )
+        return contacts.scalars().all()
+
+
+async def test_delete_by_ids_in_chunks(session_maker, broker):
+    criteria = ContactsFilterIn(ids=[1, 2, 3, 8, 99])
+
+    async with broker.subscribe(1) as queue:
+        with patch.object(broker, "publish_many", wraps=broker.publish_many) as publish_many:
+            async with session_maker() as session:
+                count = await repository_contacts.bulk_remove_contacts(criteria, USER, session, chunk_size=2)
+        published = [json.loads(await asyncio.wait_for(queue.get(), 1)) for _ in range(3)]
+
+    assert count == 3
+    assert await live_ids(session_maker) == [4, 5, 6, 7]
+    assert await live_ids(session_maker, 2) == [8]
+    async with session_maker() as session:
+        tombstones = (await session.execute(select(ContactTombstone.contact_id))).scalars().all()
+    assert sorted(tombstones) == [1, 2, 3]
+    assert published == [{"type": "deleted", "contact_id": contact_id} for contact_id in (1, 2, 3)]
+    # one round trip per chunk
+    assert publish_many.await_count == 2
+
+
+async def test_delete_contacts_without_children(session_maker):
+    criteria = ContactsFilterIn(without_phones=True, without_emails=True)
+
+    async with session_maker() as session:
+        count = await repository_contacts.bulk_remove_contacts(criteria, USER, session)
+
+    assert count == 2
+    assert await live_ids(session_maker) == [1, 2, 3, 4, 5]
+
+
+async def test_delete_search_matches(session_maker):
+    async with session_maker() as session:
+        count = await repository_contacts.bulk_remove_contacts(ContactsFilterIn(search="c4@"), USER, session)
+
+    assert count == 1
+    assert 4 not in await live_ids(session_maker)
+
+
+async def test_update(session_maker):
+    criteria = ContactsFilterIn(without_emails=True, search="name")
+    patch = ContactPatchIn(birthday=date(1990, 3, 4), description="No email")
+
+    async with session_maker() as session:
+        count = await repository_contacts.bulk_update_contacts(criteria, patch, USER, session, chunk_size=3)
+
+    assert count == 5
+    async with session_maker() as session:
+        contacts = (await session.execute(select(Contact).where(Contact.id.in_([1, 4, 7])))).unique().scalars()
+        contacts = {contact.id: contact for contact in contacts}
+    assert (contacts[1].birthday_key, contacts[1].description, contacts[1].first_name) == (304, "No email", "Name1")
+    assert contacts[1].updated_at > PAST
+    assert (contacts[4].birthday, contacts[4].updated_at) == (None, PAST)
+    assert contacts[7].description == "No email"
+
+
+class TestBulkSchemas(unittest.TestCase):
+    def test_criteria_required(self):
+        with self.assertRaises(ValidationError):
+            ContactsFilterIn()
+        with self.assertRaises(ValidationError):
+            ContactPatchIn()
@@ -0,0 +1,102 @@
+import unittest
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact, Phone, Email
+from src.contacts.names import normalize_name
+from src.contacts.service import find_duplicate_groups, normalize_phone, normalize_email
+from src.contacts.repository import find_duplicates, merge_contacts
+
+
+class TestNormalization(unittest.TestCase):
+    def test_normalize_phone(self):
+        self.assertEqual(normalize_phone("+1 (555) 123-45-67"), "15551234567")
+        self.assertEqual(normalize_phone("00 380 50 123 45 67"), "380501234567")
+
+    def test_normalize_email(self):
+        self.assertEqual(normalize_email(" John.Smith+work@GMail.com"), "johnsmith@gmail.com")
+        self.assertEqual(normalize_email("john.smith+work@example.com"), "john.smith@example.com")
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("  José-María "), "jose maria")
+
+
+class TestFindDuplicateGroups(unittest.TestCase):
+    def test_shared_phone_with_similar_name(self):
+        contacts = [(1, "John", "Smith"), (2, "Jon", "Smith"), (3, "Mary", "Jane")]
+        phones = [(1, "+1 555 123 4567"), (2, "555.123.4567"), (3, "5551234567")]
+
+        groups = find_duplicate_groups(contacts, phones, [])
+
+        self.assertEqual(groups, [{"contact_ids": [1, 2], "survivor_id": 1, "reasons": ["phone"]}])
+
+    def test_shared_email_and_missing_last_name(self):
+        contacts = [(1, "Anna", None), (2, "Anna", "Lee")]
+        emails = [(1, "anna.lee@gmail.com"), (2, "annalee+home@gmail.com"), (2, "anna@work.com")]
+
+        groups = find_duplicate_groups(contacts, [], emails)
+
+        self.assertEqual(groups, [{"contact_ids": [1, 2], "survivor_id": 2, "reasons": ["email"]}])
+
+    def test_same_full_name(self):
+        groups = find_duplicate_groups([(1, "Zoë", "Núñez"), (2, "zoe", "nunez"), (3, "Zoe", None)], [], [])
+
+        self.assertEqual(groups, [{"contact_ids": [1, 2], "survivor_id": 1, "reasons": ["name"]}])
+
+    def test_oversized_block_is_ignored(self):
+        contacts = [(i, "Office", "Desk") for i in range(1, 100)]
+        phones = [(i, "555 000 0000") for i in range(1, 100)]
+
+        groups = find_duplicate_groups(contacts, phones, [])
+
+        self.assertEqual(groups, [])
+
+
+class TestMergeContacts(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session.begin():
+            self.session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            self.session.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+            self.session.add(Contact(id=1, owner_id=1, first_name="John", last_name="Smith",
+                                     phones=[Phone(number="555 123 4567", normalized="5551234567", owner_id=1)]))
+            self.session.add(Contact(id=2, owner_id=1, first_name="Jon", last_name="Smith",
+                                     phones=[Phone(number="(555) 123-4567", normalized="5551234567", owner_id=1),
+                                             Phone(number="555 999 0000", normalized="5559990000", owner_id=1)],
+                                     emails=[Email(address="john@example.com", owner_id=1)]))
+            self.session.add(Contact(id=3, owner_id=2, first_name="John", last_name="Smith"))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_find_duplicates(self):
+        groups = await find_duplicates(self.user, self.session)
+
+        self.assertEqual(groups, [{"contact_ids": [1, 2], "survivor_id": 2, "reasons": ["phone"]}])
+
+    async def test_merge_moves_children(self):
+        result = await merge_contacts(1, [2], self.user, self.session)
+
+        self.assertTrue(result)
+        async with self.session.begin():
+            contacts = (await self.session.execute(select(Contact.id).where(Contact.owner_id == 1))).scalars().all()
+            phones = (await self.session.execute(select(Phone.number).where(Phone.contact_id == 1))).scalars().all()
+            emails = (await self.session.execute(select(Email.address).where(Email.contact_id == 1))).scalars().all()
+        self.assertEqual(contacts, [1])
+        self.assertEqual(sorted(phones), ["555 123 4567", "555 999 0000"])
+        self.assertEqual(emails, ["john@example.com"])
+
+    async def test_merge_foreign_contact(self):
+        result = await merge_contacts(1, [3], self.user, self.session)
+
+        self.assertFalse(result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from datetime import date
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact, Phone, Email
+from src.contacts.service import parse_fields
+from src.contacts.schemas import contact_fields_adapter
+from src.contacts.repository import get_contacts, search_in_contacts
+
+
+class TestParseFields(unittest.TestCase):
+    def test_canonical_order_with_id(self):
+        self.assertEqual(parse_fields("last_name, first_name"), ("id", "first_name", "last_name"))
+        self.assertEqual(parse_fields("phones,id"), ("id", "phones"))
+
+    def test_all_fields(self):
+        self.assertIsNone(parse_fields(None))
+        self.assertIsNone(parse_fields(""))
+
+    def test_unknown_field(self):
+        with self.assertRaisesRegex(ValueError, "password"):
+            parse_fields("id,password")
+
+
+class TestSparseFields(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session.begin():
+            self.session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            self.session.add(Contact(id=1, owner_id=1, first_name="John", last_name="Smith",
+                                     birthday=date(1990, 1, 1), description="Long text",
+                                     phones=[Phone(number="555 123", normalized="555123", owner_id=1),
+                                             Phone(number="555 456", normalized="555456", owner_id=1)],
+                                     emails=[Email(address="john@test.com", owner_id=1)]))
+            self.session.add(Contact(id=2, owner_id=1, first_name="Jane", last_name="Doe"))
+        self.statements = []
+        event.listen(self.engine.sync_engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_columns_only(self):
+        contacts = await get_contacts(self.user, self.session, ("id", "first_name", "last_name"))
+
+        self.assertEqual(contacts, [{"id": 1, "first_name": "John", "last_name": "Smith"},
+                                    {"id": 2, "first_name": "Jane", "last_name": "Doe"}])
+        selects = [statement for statement in self.statements if statement.startswith("SELECT")]
+        self.assertEqual(len(selects), 1)
+        self.assertNotIn("phones", selects[0])
+        self.assertNotIn("description", selects[0])
+
+    async def test_children_loaded_when_requested(self):
+        contacts = await search_in_contacts("smith", self.user, self.session, ("id", "phones"))
+
+        self.assertEqual(contacts, [{"id": 1, "phones": [{"id": 1, "number": "555 123"},
+                                                         {"id": 2, "number": "555 456"}]}])
+        self.assertFalse(any("emails.address AS" in statement for statement in self.statements))
+
+    async def test_reduced_model(self):
+        fields = ("id", "first_name", "birthday", "emails")
+        contacts = await get_contacts(self.user, self.session, fields)
+
+        adapter = contact_fields_adapter(fields)
+        dumped = adapter.dump_python(adapter.validate_python(contacts), mode="json")
+
+        self.assertEqual(dumped[0], {"id": 1, "first_name": "John", "birthday": "1990-01-01",
+                                     "emails": [{"address": "john@test.com", "id": 1}]})
+        self.assertIs(contact_fields_adapter(fields), adapter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact
+from src.contacts.phonetic import metaphone, phonetic_key, edit_distance
+from src.contacts.names import name_keys
+from src.contacts.service import rank_fuzzy_matches
+from src.contacts.schemas import ContactIn, ContactsFilterIn, ContactPatchIn
+from src.contacts import repository as repository_contacts
+
+
+class TestPhonetic(unittest.TestCase):
+    def test_similar_names_share_a_key(self):
+        for first, second in (("jon", "john"), ("jhon", "john"), ("smith", "smyth"), ("cathy", "kathy"), ("stephen", "steven"),
+                              ("philip", "filip"), ("catherine", "katherine"), ("muller", "mueller")):
+            with self.subTest(first):
+                self.assertEqual(metaphone(first), metaphone(second))
+
+    def test_codes(self):
+        self.assertEqual([metaphone(word) for word in ("smith", "knight", "hodge", "xavier", "wright")],
+                         ["SM0", "NT", "HJ", "SFR", "RT"])
+        self.assertEqual(metaphone("42"), "")
+
+    def test_name_keys(self):
+        self.assertEqual(name_keys({"first_name": "Jöhn Paul", "last_name": None, "birthday": None}),
+                         {"first_name_normalized": "john paul", "first_name_phonetic": "JN PL",
+                          "last_name_normalized": "", "last_name_phonetic": ""})
+        self.assertEqual(phonetic_key("r2 d2"), "R T")
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("kitten", "sitting"), 3)
+        self.assertEqual(edit_distance("", "jon"), 3)
+        self.assertEqual(edit_distance("jon", "jon"), 0)
+
+    def test_rank(self):
+        candidates = [(1, "john", "smith"), (2, "jonathan", "smythe"), (3, "jon", "smyth"), (4, "", ""),
+                      (5, "mary", "jones"), (6, "jan", "smit")]
+
+        self.assertEqual(rank_fuzzy_matches(["jon", "smyth"], candidates), [3, 1, 2])
+        self.assertEqual(rank_fuzzy_matches(["jon"], candidates), [3, 1, 6, 5, 2])
+
+
+class TestFuzzySearch(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session_maker() as session, session.begin():
+            session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            session.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+            for contact_id, first_name, last_name in ((1, "John", "Smith"), (2, "Jonathan", "Smythe"),
+                                                      (3, "José", "Núñez"), (4, "Mary", "Jones"),
+                                                      (5, "Katherine", None)):
+                session.add(Contact(id=contact_id, owner_id=1, first_name=first_name, last_name=last_name))
+            session.add(Contact(id=6, owner_id=2, first_name="Jon", last_name="Smyth"))
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def search(self, prompt: str, fields=None) -> list[int]:
+        async with self.session_maker() as session:
+            contacts = await repository_contacts.fuzzy_search_contacts(prompt, self.user, session, fields)
+        return [contact["id"] if fields else contact.id for contact in contacts]
+
+    async def test_misspelled_names_found_closest_first(self):
+        self.assertEqual(await self.search("Jon Smyth"), [1, 2])
+        self.assertEqual(await self.search("Jhon"), [1])
+        self.assertEqual(await self.search("Cathrine"), [5])
+        self.assertEqual(await self.search("jose nunez"), [3])
+        self.assertEqual(await self.search("NUÑEZ", ("id", "first_name")), [3])
+
+    async def test_prefix_found(self):
+        self.assertEqual(await self.search("jon"), [1, 4, 2])
+
+    async def test_candidates_that_sound_the_same_kept_first(self):
+        async with self.session_maker() as session, session.begin():
+            session.add(Contact(id=7, owner_id=1, first_name="Jon", last_name="Doe"))
+
+        with patch.object(repository_contacts, "FUZZY_CANDIDATES", 2):
+            self.assertEqual(sorted(await self.search("jon")), [1, 7])
+
+    async def test_nothing_to_search(self):
+        self.assertEqual(await self.search("-- "), [])
+        self.assertEqual(await self.search("Zebedee"), [])
+
+    async def test_deleted_contacts_skipped(self):
+        async with self.session_maker() as session:
+            await repository_contacts.remove_contact(1, self.user, session)
+
+        self.assertEqual(await self.search("Jon Smyth"), [2])
+
+    async def test_keys_follow_writes(self):
+        async with self.session_maker() as session:
+            await repository_contacts.add_contacts_batch([(ContactIn(first_name="Zoë", last_name="Brown"), [], [])],
+                                                         self.user, session)
+        async with self.session_maker() as session:
+            await repository_contacts.bulk_update_contacts(ContactsFilterIn(ids=[4]),
+                                                           ContactPatchIn(last_name="Braun"), self.user, session)
+        async with self.session_maker() as session:
+            await repository_contacts.update_contact(ContactIn(first_name="Jim", last_name="Smith"), 2, self.user,
+                                                     session)
+
+        self.assertEqual(await self.search("zoe brawn"), [7])
+        self.assertEqual(await self.search("mary brawn"), [4])
+        self.assertEqual(await self.search("Jim Smyth"), [2])
+        async with self.session_maker() as session:
+            contact = (await session.execute(select(Contact).where(Contact.id == 4))).unique().scalar_one()
+        self.assertEqual((contact.first_name_phonetic, contact.last_name_normalized), ("MR", "braun"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+from datetime import date, datetime
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact, Phone, Email
+from src.contacts import repository as repository_contacts
+from src.contacts.schemas import ContactsFilterIn, ContactsQueryIn
+from src.contacts.service import parse_sort, encode_page_cursor, decode_page_cursor
+
+CONTACTS = [
+    # id, first name, last name, birthday, created
+    (1, "Émile", "Zola", date(1840, 4, 2), datetime(2023, 1, 5)),
+    (2, "Anna", "Smith", None, datetime(2023, 1, 1)),
+    (3, "anna", "Brown", date(1990, 12, 24), datetime(2023, 1, 3)),
+    (4, "Bob", "Smith", date(1985, 4, 2), datetime(2023, 1, 2)),
+    (5, "Zoë", "Adams", date(2001, 1, 15), datetime(2023, 1, 4)),
+    (6, "Bob", None, None, datetime(2023, 1, 6)),
+]
+
+
+class TestSortAndCursor(unittest.TestCase):
+    def test_parse_sort(self):
+        self.assertEqual(parse_sort("last_name"), ("last_name", False))
+        self.assertEqual(parse_sort("-created"), ("created", True))
+        for sort in ("phone", "--id", "", "description"):
+            with self.subTest(sort), self.assertRaises(ValueError):
+                parse_sort(sort)
+
+    def test_cursor_round_trip(self):
+        for sort, values in (("id", (7,)), ("-last_name", ("smith", "anna", 2)),
+                             ("created", (datetime(2023, 1, 5, 10, 30), 1))):
+            with self.subTest(sort):
+                self.assertEqual(decode_page_cursor(encode_page_cursor(sort, values), sort), values)
+
+    def test_invalid_cursor(self):
+        for token, sort in (("garbage", "id"), (encode_page_cursor("id", (7,)), "-id"),
+                            (encode_page_cursor("id", ("7",)), "id"), (encode_page_cursor("id", (True,)), "id"),
+                            (encode_page_cursor("birthday", (305,)), "birthday")):
+            with self.subTest(token), self.assertRaises(ValueError):
+                decode_page_cursor(token, sort)
+
+    def test_created_bounds_in_utc(self):
+        query = ContactsQueryIn(created_from="2023-01-02T03:00:00+02:00", created_to="2023-01-02T01:00:00")
+
+        self.assertEqual(query.created_from, datetime(2023, 1, 2, 1))
+        self.assertIsNone(query.created_from.tzinfo)
+
+    def test_invalid_query(self):
+        for values in ({"sort": "phones"}, {"born_from": date(2000, 1, 2), "born_to": date(2000, 1, 1)},
+                       {"name": ""}, {"tags_any": []}, {"has_birthday": False, "sort": "-birthday"},
+                       {"created_from": "2023-01-02T01:00:00-01:00", "created_to": "2023-01-02T01:00:00"}):
+            with self.subTest(values), self.assertRaises(ValidationError):
+                ContactsQueryIn(**values)
+
+
+class TestListContacts(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session_maker = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session_maker() as session, session.begin():
+            session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            session.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+            for contact_id, first_name, last_name, birthday, created_at in CONTACTS:
+                session.add(Contact(id=contact_id, owner_id=1, first_name=first_name, last_name=last_name,
+                                    birthday=birthday, created_at=created_at))
+            session.add(Contact(id=7, owner_id=2, first_name="Anna", last_name="Other"))
+            session.add(Phone(number="+380501234567", normalized="380501234567", contact_id=2, owner_id=1))
+            session.add(Phone(number="+380501234568", normalized="380501234568", contact_id=4, owner_id=1))
+            session.add(Email(address="bob@test.com", contact_id=4, owner_id=1))
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def ids(self, fields=("id",), limit=None, **query) -> list[int]:
+        async with self.session_maker() as session:
+            contacts, _ = await repository_contacts.list_contacts(ContactsQueryIn(**query), self.user, session,
+                                                                  fields, limit)
+        return [contact["id"] if fields else contact.id for contact in contacts]
+
+    async def pages(self, limit: int, fields=("id",), **query) -> list[list[int]]:
+        pages, after = [], None
+        while True:
+            async with self.session_maker() as session:
+                contacts, after = await repository_contacts.list_contacts(ContactsQueryIn(**query), self.user,
+                                                                          session, fields, limit, after)
+            pages.append([contact["id"] if fields else contact.id for contact in contacts])
+            if after is None:
+                return pages
+
+    async def test_sorts(self):
+        self.assertEqual(await self.ids(), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(await self.ids(sort="first_name"), [3, 2, 6, 4, 1, 5])
+        self.assertEqual(await self.ids(sort="last_name"), [6, 5, 3, 2, 4, 1])
+        self.assertEqual(await self.ids(sort="-last_name"), [1, 4, 2, 3, 5, 6])
+        self.assertEqual(await self.ids(sort="birthday"), [5, 1, 4, 3])
+        self.assertEqual(await self.ids(sort="-created"), [6, 1, 5, 3, 4, 2])
+        self.assertEqual(await self.ids(fields=None, sort="last_name"), [6, 5, 3, 2, 4, 1])
+
+    async def test_filters(self):
+        self.assertEqual(await self.ids(name="ann"), [2, 3])
+        self.assertEqual(await self.ids(name="ANNA sm"), [2])
+        self.assertEqual(await self.ids(name="emile"), [1])
+        self.assertEqual(await self.ids(name="-"), [])
+        self.assertEqual(await self.ids(has_phone=True), [2, 4])
+        self.assertEqual(await self.ids(has_phone=True, has_email=False), [2])
+        self.assertEqual(await self.ids(has_email=False, has_birthday=False), [2, 6])
+        self.assertEqual(await self.ids(born_from=date(1900, 1, 1), born_to=date(1990, 12, 24)), [3, 4])
+        self.assertEqual(await self.ids(created_from=datetime(2023, 1, 2), created_to=datetime(2023, 1, 4),
+                                        sort="created"), [4, 3, 5])
+
+    async def test_pages(self):
+        self.assertEqual(await self.pages(2), [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(await self.pages(4, sort="first_name"), [[3, 2, 6, 4], [1, 5]])
+        self.assertEqual(await self.pages(2, fields=None, sort="-last_name"), [[1, 4], [2, 3], [5, 6]])
+        self.assertEqual(await self.pages(3, sort="birthday"), [[5, 1, 4], [3]])
+        self.assertEqual(await self.pages(2, sort="-created", name="b"), [[6, 3], [4]])
+        self.assertEqual(await self.pages(5, has_phone=False), [[1, 3, 5, 6]])
+
+    async def test_pages_over_missing_last_names(self):
+        async with self.session_maker() as session, session.begin():
+            session.add(Contact(id=8, owner_id=1, first_name="Cleo"))
+
+        self.assertEqual(await self.pages(2, sort="last_name"), [[6, 8], [5, 3], [2, 4], [1]])
+        self.assertEqual(await self.pages(3, sort="-first_name"), [[5, 1, 8], [4, 6, 2], [3]])
+
+    async def test_pages_skip_deleted_and_follow_writes(self):
+        async with self.session_maker() as session:
+            first, after = await repository_contacts.list_contacts(ContactsQueryIn(sort="last_name"), self.user,
+                                                                   session, ("id",), 2)
+        async with self.session_maker() as session:
+            await repository_contacts.bulk_remove_contacts(ContactsFilterIn(ids=[2]), self.user, session)
+        async with self.session_maker() as session:
+            second, _ = await repository_contacts.list_contacts(ContactsQueryIn(sort="last_name"), self.user,
+                                                                session, ("id",), 10, after)
+
+        self.assertEqual([contact["id"] for contact in first + second], [6, 5, 3, 4, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+import unittest
+from datetime import timedelta
+
+import pytest
+import pytest_asyncio
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from src.models import Base, User, Contact, ContactTag
+from src.contacts import repository as repository_contacts
+from src.contacts.schemas import ContactsFilterIn, TagsIn
+
+
+class TestTagSchemas(unittest.TestCase):
+    def test_names_trimmed_and_lowercased(self):
+        body = TagsIn(where=ContactsFilterIn(tags_any=[" Work"]), tags=["Family ", "VIP"])
+
+        self.assertEqual(body.tags, ["family", "vip"])
+        self.assertEqual(body.where.tags_any, ["work"])
+
+    def test_invalid(self):
+        for where, tags in (({"tags_any": []}, ["a"]), ({"ids": [1]}, []), ({"ids": [1]}, ["  "]),
+                            ({"ids": [1]}, ["x" * 51])):
+            with self.subTest(where=where, tags=tags):
+                with self.assertRaises(ValidationError):
+                    TagsIn(where=where, tags=tags)
+
+
+USER = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+OTHER = User(id=2, username='other', email="other@test.com", password="1234567", is_confirmed=True)
+
+
+@pytest_asyncio.fixture
+async def contacts(db):
+    db.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+    db.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+    for contact_id in range(1, 7):
+        db.add(Contact(id=contact_id, owner_id=1, first_name=f"Name{contact_id}", last_name="Smith"))
+    db.add(Contact(id=7, owner_id=2, first_name="Other", last_name="Smith"))
+    await db.commit()
+
+
+class Tags:
+    def __init__(self, session_maker):
+        self.session_maker = session_maker
+
+    async def tag(self, ids: list[int], tags: list[str], user: User = USER, chunk_size: int = 500) -> int:
+        async with self.session_maker() as session:
+            return await repository_contacts.tag_contacts(ContactsFilterIn(ids=ids), tags, user, session, chunk_size)
+
+    async def untag(self, criteria: ContactsFilterIn, tags: list[str]) -> int:
+        async with self.session_maker() as session:
+            return await repository_contacts.untag_contacts(criteria, tags, USER, session)
+
+    async def read(self, tags_any=None, tags_all=None, search: str | None = None) -> list[int]:
+        async with self.session_maker() as session:
+            if search is None:
+                contacts = await repository_contacts.get_contacts(USER, session, ("id",), tags_any, tags_all)
+            else:
+                contacts = await repository_contacts.search_in_contacts(search, USER, session, ("id",),
+                                                                        tags_any, tags_all)
+        return [contact["id"] for contact in contacts]
+
+    async def tags(self) -> list[tuple[str, int]]:
+        async with self.session_maker() as session:
+            return [(tag["name"], tag["contacts"]) for tag in await repository_contacts.get_tags(USER, session)]
+
+
+@pytest.fixture
+def tags(contacts, session_maker):
+    return Tags(session_maker)
+
+
+@pytest.mark.asyncio
+async def test_any_and_all(tags):
+    assert await tags.tag([1, 2, 3], ["work"], chunk_size=2) == 3
+    await tags.tag([3, 4], ["family"])
+    await tags.tag([2, 3, 7], ["vip"], user=OTHER)
+    await tags.tag([7], ["vip"], user=OTHER)
+
+    assert await tags.read(tags_any=["work"]) == [1, 2, 3]
+    assert await tags.read(tags_any=["work", "family"]) == [1, 2, 3, 4]
+    assert await tags.read(tags_all=["work", "family"]) == [3]
+    assert await tags.read(tags_all=["work", "work"]) == [1, 2, 3]
+    assert await tags.read(tags_any=["family"], tags_all=["work"]) == [3]
+    assert await tags.read(tags_any=["vip"]) == []
+    assert await tags.read(tags_all=["work", "unknown"]) == []
+    assert await tags.read(tags_any=["family"], search="name4") == [4]
+    assert await tags.tags() == [("family", 2), ("work", 3)]
+
+
+@pytest.mark.asyncio
+async def test_tagging_twice_keeps_one_tag(tags, db):
+    await tags.tag([1, 2], ["work"])
+    await tags.tag([1, 2, 3], ["work", "work"])
+
+    rows = (await db.execute(select(ContactTag.contact_id).order_by(ContactTag.contact_id))).all()
+    assert [contact_id for contact_id, in rows] == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_session_bound_per_mapper(tags, connection):
+    # a session bound through binds has no session.bind, the dialect is read from the bind it resolves to
+    tags.session_maker = async_sessionmaker(binds={Base: connection}, expire_on_commit=False,
+                                            join_transaction_mode="create_savepoint")
+
+    assert await tags.tag([1], ["work"]) == 1
+
+
+@pytest.mark.asyncio
+async def test_untag_and_bulk_filters(tags, session_maker):
+    await tags.tag([1, 2, 3, 4], ["work"])
+    await tags.tag([3, 4, 5], ["family"])
+
+    assert await tags.untag(ContactsFilterIn(tags_any=["family"]), ["work", "vip"]) == 3
+    assert await tags.untag(ContactsFilterIn(ids=[1]), ["unknown"]) == 0
+    assert await tags.read(tags_any=["work"]) == [1, 2]
+
+    async with session_maker() as session:
+        assert await repository_contacts.bulk_remove_contacts(ContactsFilterIn(tags_all=["family"]), USER,
+                                                              session) == 3
+    assert await tags.read() == [1, 2, 6]
+    assert await tags.tags() == [("work", 2)]
+
+
+@pytest.mark.asyncio
+async def test_merge_and_purge_carry_tags(tags, session_maker):
+    await tags.tag([1], ["work"])
+    await tags.tag([2], ["work", "family"])
+    await tags.tag([3], ["vip"])
+
+    async with session_maker() as session:
+        assert await repository_contacts.merge_contacts(1, [2], USER, session)
+    assert await tags.read(tags_all=["work", "family"]) == [1]
+
+    async with session_maker() as session:
+        await repository_contacts.remove_contact(3, USER, session)
+    async with session_maker() as session:
+        await repository_contacts.purge_deleted_contacts(timedelta(0), None, 10, session)
+    async with session_maker() as session:
+        rows = (await session.execute(select(ContactTag.contact_id).distinct())).all()
+    assert rows == [(1,)]
+    assert await tags.tags() == [("family", 1), ("work", 1)]
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact, Phone, Email
+from src.contacts.vcard import format_card, read_cards, import_cards, write_cards, fold, MAX_LINE_LENGTH
+from src.contacts import repository as repository_contacts
+from src.contacts.repository import add_contacts_batch, stream_contacts
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def collect(iterator):
+    return [item async for item in iterator]
+
+
+class TestVCardFormat(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.saved = []
+
+    async def save(self, batch):
+        self.saved.append(batch)
+        return len(batch)
+
+    async def test_round_trip_in_small_chunks(self):
+        contact = SimpleNamespace(first_name="Zoë", last_name="O'Brien; Jr.", birthday=date(1990, 5, 1),
+                                  description="Met at the conference, table 4\nлюбить каву " * 3)
+        for version in ("3.0", "4.0"):
+            card = format_card(contact, ["+380 50 123 45 67"], ["zoe@example.com"], version)
+
+            cards = await collect(read_cards(chunked(card.encode(), 7)))
+
+            self.assertEqual(cards, [{"fn": "Zoë O'Brien; Jr.", "n": ["O'Brien; Jr.", "Zoë", "", "", ""],
+                                      "bday": date(1990, 5, 1), "note": contact.description,
+                                      "tel": ["+380 50 123 45 67"], "email": ["zoe@example.com"]}])
+
+    def test_fold_keeps_lines_short_and_characters_whole(self):
+        folded = fold("NOTE:" + "є" * 100)
+
+        lines = folded.split("\r\n")[:-1]
+        self.assertTrue(all(len(line.encode()) <= 75 for line in lines))
+        self.assertEqual("".join(line[1:] if i else line for i, line in enumerate(lines)), "NOTE:" + "є" * 100)
+
+    async def test_names_from_fn_and_uri_phones(self):
+        data = (b"BEGIN:VCARD\r\nVERSION:4.0\r\nFN:Acme Support Desk\r\nTEL;VALUE=uri;TYPE=\"work,voice\":"
+                b"tel:+1-555-0100\r\nitem1.EMAIL:help@acme.test\r\nBDAY:--0501\r\nEND:VCARD\r\n")
+
+        result = await import_cards(chunked(data, 1024), self.save)
+
+        self.assertEqual(result, {"imported": 1, "skipped": 0})
+        contact, phones, emails = self.saved[0][0]
+        self.assertEqual((contact.first_name, contact.last_name, contact.birthday), ("Acme", "Support Desk", None))
+        self.assertEqual([phone.number for phone in phones], ["+1-555-0100"])
+        self.assertEqual([email.address for email in emails], ["help@acme.test"])
+
+    async def test_line_too_long(self):
+        with self.assertRaises(ValueError):
+            await collect(read_cards(chunked(b"BEGIN:VCARD\r\nNOTE:" + b"x" * (MAX_LINE_LENGTH + 1), 65536)))
+
+
+class TestVCardImportExport(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        async with self.session.begin():
+            self.session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_import_in_batches_then_export(self):
+        cards = "".join(
+            format_card(SimpleNamespace(first_name=f"Name{i}", last_name="Smith", birthday=date(1990, 1, i + 1),
+                                        description=None), [f"050 000 00 0{i}"], [f"name{i}@test.com"] * (i % 2))
+            for i in range(5)
+        ) + "BEGIN:VCARD\r\nVERSION:3.0\r\nN:Smith;X;;;\r\nEND:VCARD\r\n"
+        batches = []
+
+        async def save(batch):
+            batches.append(len(batch))
+            return await add_contacts_batch(batch, self.user, self.session)
+
+        with patch.object(repository_contacts.change_broker, "publish_many") as publish_many:
+            result = await import_cards(chunked(cards.encode(), 100), save, batch_size=2)
+
+        self.assertEqual(result, {"imported": 5, "skipped": 1})
+        self.assertEqual(batches, [2, 2, 1])
+        # one announcement per imported batch
+        self.assertEqual([call.args for call in publish_many.await_args_list],
+                         [(1, "created", [1, 2]), (1, "created", [3, 4]), (1, "created", [5])])
+        async with self.session.begin():
+            keys = await self.session.scalars(select(Contact.birthday_key).order_by(Contact.id))
+            self.assertEqual(keys.all(), [101, 102, 103, 104, 105])
+            owners = await self.session.scalars(select(Phone.owner_id).union_all(select(Email.owner_id)))
+            self.assertEqual(set(owners.all()), {1})
+
+        exported = "".join(await collect(write_cards(stream_contacts(self.user, self.session, batch_size=2))))
+        reread = await collect(read_cards(chunked(exported.encode(), 64)))
+        self.assertEqual([card["fn"] for card in reread], [f"Name{i} Smith" for i in range(5)])
+        self.assertEqual([card["email"] for card in reread][:2], [[], ["name1@test.com"]])
+        self.assertEqual(reread[3]["tel"], ["050 000 00 03"])
+
+
+if __name__ == "__main__":
+    unittest.main()
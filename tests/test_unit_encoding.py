@@ -0,0 +1,96 @@
+import unittest
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from src.encoding import ResponseEncodingMiddleware, NegotiatedResponse, EncodingMetrics, choose_encoding, \
+    accepts_msgpack, msgpack
+
+
+def build_app(metrics: EncodingMetrics) -> FastAPI:
+    app = FastAPI(default_response_class=NegotiatedResponse)
+    app.add_middleware(ResponseEncodingMiddleware, minimum_size=500, metrics=metrics)
+
+    @app.get("/contacts")
+    def contacts(count: int = 100):
+        return [{"id": i, "first_name": f"Name{i}", "birthday": "1990-01-01", "phones": []} for i in range(count)]
+
+    @app.get("/stream")
+    def stream():
+        async def chunks():
+            for i in range(3):
+                yield f"BEGIN:VCARD\r\nFN:Name{i}\r\nEND:VCARD\r\n" * 50
+        return StreamingResponse(chunks(), media_type="text/vcard")
+
+    @app.get("/events")
+    def events():
+        async def chunks():
+            yield "data: {}\n\n" * 100
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+class TestNegotiation(unittest.TestCase):
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertEqual(choose_encoding("*"), choose_encoding("br, gzip"))
+        self.assertIsNone(choose_encoding("gzip;q=0, identity"))
+        self.assertIsNone(choose_encoding(""))
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_accepts_msgpack(self):
+        self.assertTrue(accepts_msgpack("application/msgpack"))
+        self.assertTrue(accepts_msgpack("application/x-msgpack, application/json;q=0.5"))
+        self.assertFalse(accepts_msgpack("application/json, application/msgpack;q=0.5"))
+        self.assertFalse(accepts_msgpack("*/*"))
+
+
+class TestResponseEncoding(unittest.TestCase):
+    def setUp(self):
+        self.metrics = EncodingMetrics()
+        self.client = TestClient(build_app(self.metrics))
+
+    def test_large_json_is_gzipped(self):
+        response = self.client.get("/contacts", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(len(response.json()), 100)
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        gzip = self.metrics.snapshot()["gzip"]
+        self.assertEqual(gzip["responses"], 1)
+        self.assertEqual(int(response.headers["content-length"]), gzip["bytes_out"])
+        self.assertLess(gzip["bytes_out"], gzip["bytes_in"] / 3)
+
+    def test_small_body_is_not_compressed(self):
+        response = self.client.get("/contacts?count=1", headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(self.metrics.snapshot()["identity"]["responses"], 1)
+
+    def test_stream_is_compressed_per_chunk(self):
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(response.text.count("BEGIN:VCARD"), 150)
+        self.assertEqual(self.metrics.snapshot()["gzip"]["responses"], 1)
+
+    def test_event_stream_passes_through(self):
+        response = self.client.get("/events", headers={"Accept-Encoding": "gzip"})
+
+        self.assertNotIn("content-encoding", response.headers)
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        response = self.client.get("/contacts?count=2", headers={"Accept": "application/msgpack"})
+
+        self.assertEqual(response.headers["content-type"], "application/msgpack")
+        self.assertIn("Accept", response.headers["vary"])
+        self.assertEqual(msgpack.unpackb(response.content)[1]["first_name"], "Name1")
+        self.assertEqual(self.client.get("/contacts?count=2").headers["content-type"], "application/json")
+
+
+if __name__ == "__main__":
+    unittest.main()
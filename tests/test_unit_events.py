@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+
+from src.events import ChangeBroker, event_stream, channel, RESYNC
+from src.models import User, Contact
+from src.contacts import repository as repository_contacts
+from src.contacts.schemas import ContactIn
+from src.database_redis import redis_db
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest_asyncio.fixture
+async def broker(redis):
+    broker = ChangeBroker(redis_db, queue_size=3)
+    await broker.start()
+    yield broker
+    await broker.close()
+
+
+async def test_one_subscription_per_user_fanned_out(broker, redis):
+    async with broker.subscribe(1) as first, broker.subscribe(1) as second, broker.subscribe(2) as other:
+        await broker.publish(1, "updated", 10)
+
+        events = await asyncio.wait_for(asyncio.gather(first.get(), second.get()), 1)
+        assert [json.loads(event) for event in events] == [{"type": "updated", "contact_id": 10}] * 2
+        assert other.empty()
+        assert await redis.pubsub_numsub(channel(1), channel(2)) == [(channel(1).encode(), 1),
+                                                                      (channel(2).encode(), 1)]
+
+    assert await redis.pubsub_channels() == []
+    assert broker.listeners == {}
+
+
+async def test_slow_client_gets_resync(broker):
+    async with broker.subscribe(1) as queue:
+        for contact_id in range(5):
+            broker.deliver(queue, json.dumps({"type": "updated", "contact_id": contact_id}))
+
+        assert queue.qsize() == 2
+        assert queue.get_nowait() == RESYNC
+
+
+async def test_stream_ends_on_close(broker):
+    stream = event_stream(broker, 1)
+    assert await anext(stream) == "retry: 5000\n\n"
+    await broker.publish(1, "deleted", 3)
+    assert await asyncio.wait_for(anext(stream), 1) == f"data: {json.dumps({'type': 'deleted', 'contact_id': 3})}\n\n"
+
+    await broker.close()
+
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(anext(stream), 1)
+
+
+async def test_not_started_does_not_publish(redis):
+    pubsub = redis.pubsub()
+    await pubsub.subscribe(channel(1))
+    assert (await pubsub.get_message(timeout=1))["type"] == "subscribe"
+
+    await ChangeBroker(redis_db).publish(1, "updated", 1)
+
+    assert await pubsub.get_message(ignore_subscribe_messages=True, timeout=0.1) is None
+    await pubsub.close()
+
+
+async def test_failed_publish_does_not_fail_the_write(broker, redis_server, caplog):
+    redis_server.connected = False
+
+    await broker.publish(1, "updated", 1)
+    await broker.publish_many(1, "deleted", [1, 2])
+
+    assert [record.levelname for record in caplog.records] == ["WARNING", "WARNING"]
+    assert all(record.exc_info for record in caplog.records)
+
+
+async def test_writes_publish_after_commit(broker, db, monkeypatch):
+    user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+    db.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+    db.add(Contact(id=1, owner_id=1, first_name="Contact"))
+    await db.commit()
+    monkeypatch.setattr(repository_contacts, "change_broker", broker)
+
+    async with broker.subscribe(1) as queue:
+        contact = await repository_contacts.add_contact(ContactIn(first_name="New"), user, db)
+        await repository_contacts.update_contact(ContactIn(first_name="Renamed"), 1, user, db)
+        await repository_contacts.remove_contact(1, user, db)
+        await repository_contacts.remove_contact(1, user, db)
+
+        events = [json.loads(await asyncio.wait_for(queue.get(), 1)) for _ in range(3)]
+
+    assert events == [{"type": "created", "contact_id": contact.id},
+                      {"type": "updated", "contact_id": 1},
+                      {"type": "deleted", "contact_id": 1}]
+    assert queue.empty()
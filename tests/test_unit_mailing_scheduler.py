@@ -0,0 +1,182 @@
+from datetime import date
+from pathlib import Path
+
+import pytest
+import pytest_asyncio
+from aiosmtplib import (SMTPRecipientRefused, SMTPRecipientsRefused, SMTPResponseException,
+                        SMTPServerDisconnected)
+
+from src.models import User, Contact
+from src.mailing.scheduler import send_birthday_reminders, checkpoint_key, done_key
+from src.mailing.service import FastMailService
+
+pytestmark = pytest.mark.asyncio
+
+TODAY = date(2023, 7, 10)
+TEMPLATE_NAME = "birthday_reminder.html"
+
+
+class FakeSMTPServer:
+    def __init__(self):
+        self.outbox = []
+        # address -> reply code of the refusal
+        self.refused = {}
+        self.disconnect_after = None
+
+    def connect(self, **options):
+        return FakeSMTP(self)
+
+
+class FakeSMTP:
+    def __init__(self, server: FakeSMTPServer):
+        self.server = server
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def send_message(self, message):
+        if len(self.server.outbox) == self.server.disconnect_after:
+            raise SMTPServerDisconnected("connection lost")
+        code = self.server.refused.get(message["To"])
+        if code == 550:
+            raise SMTPRecipientsRefused([SMTPRecipientRefused(code, "no such user", message["To"])])
+        if code is not None:
+            raise SMTPResponseException(code, "try again later")
+        self.server.outbox.append(message)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = FakeSMTPServer()
+    monkeypatch.setattr("aiosmtplib.SMTP", server.connect)
+    return server
+
+
+@pytest.fixture
+def mail(smtp):
+    from fastapi_mail import ConnectionConfig, FastMail
+
+    service = FastMailService()
+    service._mf = FastMail(ConnectionConfig(
+        MAIL_USERNAME="user", MAIL_PASSWORD="password", MAIL_FROM="from@test.com", MAIL_PORT=465,
+        MAIL_SERVER="localhost", MAIL_FROM_NAME="Contacts", MAIL_STARTTLS=False, MAIL_SSL_TLS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent.parent / 'templates',
+    ))
+    return service
+
+
+@pytest_asyncio.fixture
+async def users(db):
+    for user_id in range(1, 6):
+        db.add(User(id=user_id, username=f'user{user_id}', email=f"user{user_id}@test.com",
+                    password="1234567", is_confirmed=user_id != 5))
+        db.add(Contact(owner_id=user_id, first_name="Today", birthday=date(1990, 7, 10)))
+        db.add(Contact(owner_id=user_id, first_name="Later", birthday=date(1990, 8, 10)))
+    await db.commit()
+
+
+def recipients(smtp: FakeSMTPServer) -> list[str]:
+    return sorted(message["To"] for message in smtp.outbox)
+
+
+@pytest.mark.usefixtures("users")
+class TestBirthdayReminders:
+    async def test_reminders_grouped_per_user_in_batches(self, session_maker, redis, mail, smtp):
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, days=1, batch_size=2)
+
+        assert (stats["users"], stats["contacts"], stats["sent"], stats["batches"]) == (4, 4, 4, 3)
+        assert recipients(smtp) == [f"user{user_id}@test.com" for user_id in range(1, 5)]
+        content = smtp.outbox[0].get_content()
+        assert "Today" in content and "Later" not in content
+        assert await redis.get(checkpoint_key(TODAY)) == b"5"
+
+    async def test_resume_from_checkpoint(self, session_maker, redis, mail):
+        await redis.set(checkpoint_key(TODAY), 2)
+
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY)
+
+        assert stats["users"] == 2
+        assert stats["resumed_after"] == 2
+
+    async def test_deferred_reminder_stops_before_its_user(self, session_maker, redis, mail, smtp):
+        smtp.refused = {"user3@test.com": 451}
+
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, days=1, batch_size=2)
+
+        assert (stats["sent"], stats["failed"], stats["batches"]) == (3, 1, 2)
+        assert await redis.get(checkpoint_key(TODAY)) == b"2"
+
+    async def test_rerun_after_a_failure_mid_page_sends_every_reminder_once(self, session_maker, redis, mail,
+                                                                             smtp):
+        # two connections share the page, 1 and 3 on one, 2 and 4 on the other: 4 goes out after 3 failed
+        smtp.refused = {"user3@test.com": 451}
+
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, batch_size=4, concurrency=2)
+
+        assert (stats["sent"], stats["failed"]) == (3, 1)
+        assert recipients(smtp) == ["user1@test.com", "user2@test.com", "user4@test.com"]
+        assert await redis.get(checkpoint_key(TODAY)) == b"2"
+
+        smtp.refused = {}
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, batch_size=4, concurrency=2)
+
+        assert (stats["resumed_after"], stats["sent"], stats["skipped"]) == (2, 1, 1)
+        assert recipients(smtp) == [f"user{user_id}@test.com" for user_id in range(1, 5)]
+        assert await redis.smembers(done_key(TODAY)) == {b"1", b"2", b"3", b"4"}
+
+    async def test_lost_connection_stops_the_run(self, session_maker, redis, mail, smtp):
+        smtp.disconnect_after = 1
+
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, batch_size=4, concurrency=1)
+
+        assert (stats["sent"], stats["failed"]) == (1, 3)
+        assert await redis.get(checkpoint_key(TODAY)) == b"1"
+
+    async def test_refused_reminder_is_skipped(self, session_maker, redis, mail, smtp):
+        smtp.refused = {"user2@test.com": 550}
+
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, batch_size=2)
+
+        assert (stats["sent"], stats["refused"], stats["failed"]) == (3, 1, 0)
+        assert await redis.get(checkpoint_key(TODAY)) == b"5"
+        assert await redis.sismember(done_key(TODAY), 2)
+
+    async def test_dry_run(self, session_maker, redis, mail, smtp):
+        stats = await send_birthday_reminders(session_maker, redis, mail, TODAY, dry_run=True)
+
+        assert stats["users"] == 4
+        assert smtp.outbox == []
+        assert await redis.keys() == []
+
+
+class TestSendBatch:
+    MESSAGES = [{"email": f"user{i}@test.com", "subject": "Upcoming birthdays",
+                 "template_body": {"username": f"user{i}", "contacts": [{"name": "A", "birthday": "1 May"}]}}
+                for i in range(5)]
+
+    async def test_template_rendered_for_each_message(self, mail, smtp):
+        refused, failed = await mail.send_batch(self.MESSAGES, TEMPLATE_NAME, concurrency=2)
+
+        assert (refused, failed) == ([], [])
+        assert recipients(smtp) == [f"user{i}@test.com" for i in range(5)]
+        assert "user0" in smtp.outbox[0].get_content()
+
+    async def test_refused_deferred_and_lost_messages(self, mail, smtp):
+        smtp.refused = {"user1@test.com": 550, "user2@test.com": 421}
+        done = []
+
+        async def on_done(item):
+            done.append(item["email"])
+
+        refused, failed = await mail.send_batch(self.MESSAGES, TEMPLATE_NAME, concurrency=1, on_done=on_done)
+
+        assert (refused, failed) == (["user1@test.com"], ["user2@test.com"])
+        assert done == ["user0@test.com", "user1@test.com", "user3@test.com", "user4@test.com"]
+
+        smtp.outbox, smtp.refused, smtp.disconnect_after = [], {}, 2
+        refused, failed = await mail.send_batch(self.MESSAGES, TEMPLATE_NAME, concurrency=1)
+
+        assert (refused, failed) == ([], [f"user{i}@test.com" for i in range(2, 5)])
@@ -0,0 +1,57 @@
+import unittest
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.models import Base, User, Contact
+from src.phones.repository import add_phone, update_phone, lookup_contacts
+from src.phones.schemas import PhoneIn
+from src.phones.service import normalize_number
+
+
+class TestNormalizeNumber(unittest.TestCase):
+    def test_international_formats(self):
+        self.assertEqual(normalize_number("+1 (555) 123-4567", ""), "+15551234567")
+        self.assertEqual(normalize_number("00 380 50 123 45 67", ""), "+380501234567")
+
+    def test_national_number_with_country_code(self):
+        self.assertEqual(normalize_number("050 123 45 67", "380"), "+380501234567")
+
+    def test_national_number_without_country_code(self):
+        self.assertEqual(normalize_number("(050) 123-45-67", ""), "0501234567")
+
+
+class TestLookupContacts(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = async_sessionmaker(self.engine, expire_on_commit=False)()
+        self.user = User(id=1, username='test', email="test@test.com", password="1234567", is_confirmed=True)
+        self.other = User(id=2, username='other', email="other@test.com", password="1234567", is_confirmed=True)
+        async with self.session.begin():
+            self.session.add(User(id=1, username='test', email="test@test.com", password="1234567"))
+            self.session.add(User(id=2, username='other', email="other@test.com", password="1234567"))
+            self.session.add(Contact(id=1, owner_id=1, first_name="John"))
+            self.session.add(Contact(id=2, owner_id=2, first_name="Jane"))
+        await add_phone(1, PhoneIn(number="+1 555 123-4567"), self.user, self.session)
+        await add_phone(2, PhoneIn(number="+1 555 123-4567"), self.other, self.session)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    async def test_lookup_is_owner_scoped(self):
+        contacts = await lookup_contacts("001 (555) 1234567", self.user, self.session)
+
+        self.assertEqual([contact.id for contact in contacts], [1])
+
+    async def test_lookup_after_update(self):
+        phone = (await lookup_contacts("+15551234567", self.user, self.session))[0].phones[0]
+        await update_phone(1, phone.id, PhoneIn(number="+44 20 7946 0000"), self.user, self.session)
+
+        self.assertEqual(await lookup_contacts("+15551234567", self.user, self.session), [])
+        self.assertEqual(len(await lookup_contacts("00442079460000", self.user, self.session)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()